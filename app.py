@@ -1,36 +1,29 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-import time
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+import hashlib
 import re
 import logging
-from urllib.parse import urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-
-# Load environment variables from .env file
-load_dotenv()
+from cache import get_content_cache, get_response_cache
+from retrieval import ChunkIndex
+from summarizer import MapReduceSummarizer
+from content_diff import diff_content, has_changes, format_diff
+from prompt_builder import question_prompt
+from token_counter import get_token_counter
+from conversation_memory import ConversationMemory
+from batch_questions import BatchQuestioner, parse_questions
+from gemini_client import get_gemini_client, GeminiError, GeminiRateLimitError, GeminiStreamInterrupted
+from crawler import CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+from jobs import get_job_manager, DONE, FAILED, CANCELLED, JOB_POLL_INTERVAL
+from metrics import get_metrics, span, start_trace
+from web_agent import (
+    fetch_website_content, crawl_website_content, get_gemini_response, stream_gemini_response, new_page_context,
+    API_KEY, GEMINI_STREAMING
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Detect if running on Streamlit Cloud
-IS_STREAMLIT_CLOUD = (
-    os.path.exists("/home/appuser") or 
-    os.path.exists("/mount/src") or 
-    os.getenv("STREAMLIT_SHARING") is not None
-)
-
-# Get the API key from environment variable
-API_KEY = os.getenv("GEMINI_API_KEY")
 if not API_KEY:
     st.error("API key not found. Please set the GEMINI_API_KEY environment variable.")
     st.stop()
@@ -194,474 +187,267 @@ if "content_stats" not in st.session_state:
     st.session_state.content_stats = {}
 if "summary" not in st.session_state:
     st.session_state.summary = ""
+if "chunk_index" not in st.session_state:
+    st.session_state.chunk_index = None
+if "chunk_summaries" not in st.session_state:
+    st.session_state.chunk_summaries = {}
+if "summary_report" not in st.session_state:
+    st.session_state.summary_report = {}
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+if "page_context" not in st.session_state:
+    st.session_state.page_context = None
+if "batch_report" not in st.session_state:
+    st.session_state.batch_report = {}
+# Handles of background jobs; they survive reruns and are polled until they finish
+for job_key in ("load_job", "summary_job", "batch_job"):
+    if job_key not in st.session_state:
+        st.session_state[job_key] = None
 
-def validate_url(url):
-    """Validates and normalizes URL."""
-    try:
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        parsed = urlparse(url)
-        if not parsed.netloc:
-            return None, "Invalid URL format"
-        return url, None
-    except Exception as e:
-        return None, f"URL validation error: {str(e)}"
-
-def setup_selenium_driver():
-    """Sets up a headless Chrome driver for JavaScript rendering."""
-    try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
-        driver = webdriver.Chrome(options=chrome_options)
-        return driver, None
-    except Exception as e:
-        logger.error(f"Selenium setup failed: {str(e)}")
-        return None, f"Browser setup failed: {str(e)}. Please ensure Chrome and ChromeDriver are installed."
-
-def extract_with_selenium(url, timeout=15):
-    """Extracts content using Selenium for JavaScript-rendered pages."""
-    driver, error = setup_selenium_driver()
-    if error:
-        return None, error
-    
-    try:
-        driver.set_page_load_timeout(timeout)
-        driver.get(url)
-        
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        time.sleep(3)
-        
-        try:
-            WebDriverWait(driver, 5).until_not(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".loading, .spinner, [data-loading]"))
-            )
-        except TimeoutException:
-            pass
-        
-        # Execute JavaScript to ensure all content is loaded
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
-        driver.execute_script("window.scrollTo(0, 0);")
-        
-        # Get page source after JavaScript execution
-        html_source = driver.page_source
-        
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(html_source, 'html.parser')
-        
-        # Remove unwanted elements
-        for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'form']):
-            element.decompose()
-        
-        # Extract text from multiple elements
-        text_elements = []
-        
-        # Priority elements for content extraction
-        priority_selectors = [
-            'main', 'article', '.content', '#content', '.post', '.entry',
-            '[role="main"]', '.main-content', '#main-content'
-        ]
-        
-        content_found = False
-        for selector in priority_selectors:
-            elements = soup.select(selector)
-            if elements:
-                for element in elements:
-                    text = element.get_text(separator=' ', strip=True)
-                    if len(text) > 100:
-                        text_elements.append(text)
-                        content_found = True
-                break
-        
-        # If no priority content found, extract from common elements
-        if not content_found:
-            for tag in ['p', 'div', 'span', 'section', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']:
-                elements = soup.find_all(tag)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if len(text) > 20 and text not in text_elements:
-                        text_elements.append(text)
-        
-        # Clean and join text
-        combined_text = ' '.join(text_elements)
-        cleaned_text = re.sub(r'\s+', ' ', combined_text).strip()
-        
-        # Get page title
-        title = soup.title.string if soup.title else "No title"
-        
-        # Combine title and content
-        final_content = f"Title: {title}\n\nContent: {cleaned_text}"
-        
-        if len(cleaned_text) < 100:
-            return None, "Insufficient content extracted. The page might be heavily JavaScript-dependent or have access restrictions."
-        
-        return final_content[:20000], None
-        
-    except TimeoutException:
-        return None, "Page load timeout. The website might be slow or unresponsive."
-    except WebDriverException as e:
-        return None, f"Browser error: {str(e)}"
-    except Exception as e:
-        return None, f"Content extraction error: {str(e)}"
-    finally:
-        if driver:
-            driver.quit()
-
-def extract_with_requests(url):
-    """Enhanced fallback method using requests and BeautifulSoup with advanced strategies."""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0',
-    }
+def render_summary_html(summary):
+    """Renders summary Markdown as the HTML summary panel."""
+    # Process the summary text to handle Markdown formatting
+    processed_summary = summary
     
-    try:
-        session = requests.Session()
-        session.headers.update(headers)
-        
-        # Try multiple request strategies
-        for attempt in range(2):
-            try:
-                response = session.get(url, timeout=20, allow_redirects=True)
-                response.raise_for_status()
-                break
-            except requests.RequestException as e:
-                if attempt == 0:
-                    # Try with different headers on second attempt
-                    session.headers.update({
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15'
-                    })
-                    continue
-                else:
-                    raise e
-        
-        # Handle different encodings
-        if response.encoding is None:
-            response.encoding = 'utf-8'
-        
-        # Try to detect encoding from content
-        try:
-            import chardet
-            detected = chardet.detect(response.content)
-            if detected['encoding'] and detected['confidence'] > 0.7:
-                response.encoding = detected['encoding']
-        except ImportError:
-            pass
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract text using multiple enhanced strategies
-        text_parts = []
-        
-        # Strategy 1: Look for JSON-LD structured data (common in modern sites)
-        json_ld_scripts = soup.find_all('script', type='application/ld+json')
-        for script in json_ld_scripts:
-            try:
-                import json
-                data = json.loads(script.string)
-                if isinstance(data, dict):
-                    # Extract text from common JSON-LD properties
-                    for key in ['description', 'text', 'articleBody', 'name', 'headline']:
-                        if key in data and isinstance(data[key], str):
-                            text_parts.append(data[key])
-            except:
-                pass
-        
-        # Strategy 2: Look for meta descriptions and OpenGraph data
-        meta_tags = soup.find_all('meta')
-        for meta in meta_tags:
-            if meta.get('name') in ['description', 'og:description', 'twitter:description']:
-                content = meta.get('content', '')
-                if content and len(content) > 20:
-                    text_parts.append(f"Meta Description: {content}")
-            elif meta.get('property') in ['og:title', 'og:description']:
-                content = meta.get('content', '')
-                if content and len(content) > 10:
-                    text_parts.append(content)
-        
-        # Remove unwanted elements but preserve more content-rich elements
-        for element in soup(['script', 'style', 'noscript']):
-            element.decompose()
-        
-        # Strategy 3: Enhanced content extraction with more selectors
-        enhanced_selectors = [
-            # Main content areas
-            'main', 'article', '[role="main"]', '#main', '.main',
-            '.content', '#content', '.main-content', '#main-content',
-            '.post', '.entry', '.article', '.page-content',
-            # Common content containers
-            '.container', '.wrapper', '.body', '.inner',
-            '.section', '.primary', '.site-content',
-            # Specific to business/portfolio sites
-            '.hero', '.intro', '.about', '.services', '.portfolio',
-            '.company', '.team', '.mission', '.vision',
-            # Blog/news specific
-            '.post-content', '.entry-content', '.article-content',
-            # E-commerce specific
-            '.product-info', '.description', '.details'
-        ]
-        
-        content_found = False
-        for selector in enhanced_selectors:
-            elements = soup.select(selector)
-            if elements:
-                for element in elements:
-                    # Get text while preserving some structure
-                    text = element.get_text(separator=' ', strip=True)
-                    if len(text) > 50:  # Lower threshold for content detection
-                        text_parts.append(text)
-                        content_found = True
-                if content_found and len(' '.join(text_parts)) > 200:
-                    break
-        
-        # Strategy 4: If still no substantial content, extract from all visible text
-        if not content_found or len(' '.join(text_parts)) < 100:
-            # Remove navigation and other non-content elements
-            for element in soup(['nav', 'header', 'footer', 'aside', 'form', 'button']):
-                element.decompose()
-            
-            # Extract from headings and paragraphs first
-            for tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                elements = soup.find_all(tag)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if len(text) > 5:
-                        text_parts.append(f"Heading: {text}")
-            
-            # Then paragraphs and other content
-            for tag in ['p', 'div', 'span', 'section', 'li', 'td']:
-                elements = soup.find_all(tag)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    # Be more inclusive of shorter text for JS-heavy sites
-                    if len(text) > 10 and text not in text_parts:
-                        # Filter out common non-content text
-                        if not any(skip in text.lower() for skip in [
-                            'javascript', 'cookie', 'privacy policy', 'terms of service',
-                            'loading...', 'please wait', 'error', 'not found'
-                        ]):
-                            text_parts.append(text)
-        
-        # Strategy 5: Try to find content in script tags (some sites put content in JSON)
-        script_tags = soup.find_all('script')
-        for script in script_tags:
-            if script.string:
-                script_content = script.string.strip()
-                # Look for JSON data that might contain content
-                if 'content' in script_content.lower() or 'description' in script_content.lower():
-                    try:
-                        import json
-                        # Try to extract JSON from script content
-                        start_idx = script_content.find('{')
-                        end_idx = script_content.rfind('}') + 1
-                        if start_idx != -1 and end_idx > start_idx:
-                            potential_json = script_content[start_idx:end_idx]
-                            data = json.loads(potential_json)
-                            if isinstance(data, dict):
-                                for key in ['content', 'description', 'text', 'body']:
-                                    if key in data and isinstance(data[key], str) and len(data[key]) > 20:
-                                        text_parts.append(f"Script Content: {data[key]}")
-                    except:
-                        pass
-        
-        # Strategy 6: Extract text from data attributes and aria-labels
-        for element in soup.find_all(attrs={'data-content': True}):
-            content = element.get('data-content', '')
-            if content and len(content) > 10:
-                text_parts.append(content)
-        
-        for element in soup.find_all(attrs={'aria-label': True}):
-            label = element.get('aria-label', '')
-            if label and len(label) > 10:
-                text_parts.append(label)
-        
-        # Get enhanced page title and meta info
-        title = soup.title.string if soup.title else "No title"
-        
-        # Try to get a better title from og:title or h1
-        og_title = soup.find('meta', property='og:title')
-        if og_title and og_title.get('content'):
-            title = og_title.get('content')
-        elif soup.h1:
-            h1_text = soup.h1.get_text(strip=True)
-            if h1_text and len(h1_text) > len(title.strip()):
-                title = h1_text
-        
-        # Clean and combine text with better deduplication
-        unique_texts = []
-        seen_texts = set()
-        for text in text_parts:
-            # Clean the text
-            cleaned = re.sub(r'\s+', ' ', text).strip()
-            if len(cleaned) > 5:
-                # Simple deduplication based on first 50 characters
-                text_key = cleaned[:50].lower()
-                if text_key not in seen_texts:
-                    seen_texts.add(text_key)
-                    unique_texts.append(cleaned)
-        
-        combined_text = ' '.join(unique_texts)
-        
-        # Final content assembly with enhanced fallback
-        final_content = f"Title: {title}\n\nContent: {combined_text}"
-        
-        # More lenient content threshold for JS-heavy sites
-        if len(combined_text) < 30:
-            # Last resort: try to extract any visible text with better filtering
-            body_text = soup.get_text(separator=' ', strip=True)
-            if body_text:
-                # Filter out common boilerplate text
-                lines = body_text.split('\n')
-                filtered_lines = []
-                for line in lines:
-                    line = line.strip()
-                    if (len(line) > 10 and 
-                        not any(skip in line.lower() for skip in [
-                            'javascript', 'cookie', 'privacy policy', 'terms of service',
-                            'loading...', 'please wait', 'error', 'not found', 'menu',
-                            'home', 'about', 'contact', 'login', 'register', 'search'
-                        ]) and
-                        not line.lower().startswith(('©', 'copyright', 'all rights'))):
-                        filtered_lines.append(line)
-                
-                if filtered_lines:
-                    cleaned_body = ' '.join(filtered_lines[:50])  # Limit to first 50 lines
-                    cleaned_body = re.sub(r'\s+', ' ', cleaned_body).strip()
-                    if len(cleaned_body) > 30:
-                        final_content = f"Title: {title}\n\nContent: {cleaned_body[:3000]}"
-                    else:
-                        return None, "Insufficient content found. The page might require JavaScript or have access restrictions."
-                else:
-                    return None, "No readable content found after filtering. The page might be entirely JavaScript-based."
-            else:
-                return None, "No readable content found. The page might be entirely JavaScript-based or have access restrictions."
-        
-        return final_content[:20000], None
-        
-    except requests.RequestException as e:
-        return None, f"Network error: {str(e)}"
-    except Exception as e:
-        return None, f"Content extraction error: {str(e)}"
-
-def fetch_website_content(url, use_selenium=True):
-    """Main function to fetch website content with multiple strategies."""
+    # Convert **text** to <strong>text</strong> for proper HTML bold formatting
+    processed_summary = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_summary)
     
-    # Validate URL
-    validated_url, error = validate_url(url)
-    if error:
-        return f"Error: {error}", "validation_error"
+    # Convert bullet points (lines starting with * ) to proper HTML bullets
+    processed_summary = re.sub(r'^\* (.+)$', r'• \1', processed_summary, flags=re.MULTILINE)
     
-    extraction_method = ""
-    content = None
-    error_msg = None
+    # Convert *text* to <em>text</em> for italic formatting (but not for bullet points)
+    processed_summary = re.sub(r'(?<!^)\*([^*\n]+?)\*(?!\s)', r'<em>\1</em>', processed_summary, flags=re.MULTILINE)
     
-    # Disable Selenium on Streamlit Cloud due to browser limitations
-    if IS_STREAMLIT_CLOUD:
-        use_selenium = False
-        logger.info("Running on Streamlit Cloud, using enhanced requests-only mode")
+    # Convert newlines to <br> tags
+    processed_summary = processed_summary.replace('\n', '<br>')
     
-    # Try Selenium first for JavaScript content (only if not on Streamlit Cloud)
-    if use_selenium:
-        try:
-            content, error_msg = extract_with_selenium(validated_url)
-            if content:
-                extraction_method = "JavaScript-enabled (Selenium)"
-            else:
-                logger.warning(f"Selenium extraction failed: {error_msg}")
-        except Exception as e:
-            logger.error(f"Selenium method failed: {str(e)}")
-            error_msg = str(e)
+    return f"""
+    <div class="summary-container">
+        <div class="summary-title">
+            📋 Website Summary
+        </div>
+        <div class="summary-content">
+            {processed_summary}
+        </div>
+    </div>
+    """
+
+def show_performance(trace=None, seconds=None):
+    """Shows where the time of one load went and the latency percentiles of every stage so far."""
+    with st.expander("⏱️ Performance"):
+        if trace is not None:
+            st.markdown(f"**This load:** extracted in {seconds or trace.elapsed():.2f}s")
+            rows = ["| Stage | Starts at | Duration | Details |", "|---|---:|---:|---|"]
+            for entry in trace.summary():
+                details = ", ".join(f"{key}={value}" for key, value in entry.items()
+                                    if key not in ('stage', 'start', 'seconds'))
+                rows.append(f"| {entry['stage']} | {entry['start'] * 1000:,.0f} ms | "
+                            f"{entry['seconds'] * 1000:,.1f} ms | {details} |")
+            st.markdown("\n".join(rows))
+        
+        # Percentiles cover every session in this process, over the most recent samples of each stage;
+        # the per-request-type API latencies are in the JSON download
+        rows = ["| Stage | Count | p50 | p95 | p99 |", "|---|---:|---:|---:|---:|"]
+        for entry in get_metrics().snapshot().get('stage_seconds', []):
+            rows.append(f"| {entry['labels']['stage']} | {entry['count']:,} | {entry['p50'] * 1000:,.1f} ms | "
+                        f"{entry['p95'] * 1000:,.1f} ms | {entry['p99'] * 1000:,.1f} ms |")
+        if len(rows) > 2:
+            st.markdown("**All requests so far:**")
+            st.markdown("\n".join(rows))
+            st.download_button("⬇️ Download metrics (JSON)", get_metrics().to_json(), file_name="metrics.json",
+                               mime="application/json", key="metrics_download")
+        else:
+            st.caption("No timings recorded yet.")
+
+def summary_job(job, content, chunk_cache):
+    """Background job: summarizes content and returns (summary, report, chunk_summaries).
+    
+    Long pages are summarized section by section in parallel, then merged.
+    chunk_cache is a copy of the starting session's section summaries; the
+    summaries of this content are returned so that every session joining the
+    job can keep them for its next re-summary.
+    """
+    def llm(prompt):
+        job.check_cancelled()
+        return get_gemini_response(prompt, request_type="summary")
+    
+    def stream_llm(prompt):
+        job.check_cancelled()
+        return stream_gemini_response(prompt, request_type="summary")
+    
+    summarizer = MapReduceSummarizer(llm, stream_llm=stream_llm if GEMINI_STREAMING else None, chunk_cache=chunk_cache)
+    job.update("🤖 Generating summary...")
+    summary = summarizer.summarize(content, on_text=lambda text: job.update(text=text))
+    # Only the sections of this content can be reused by the next (re-)summary
+    summarizer.prune_cache()
+    return summary, summarizer.report, summarizer.chunk_cache
+
+def start_summary_job(content):
+    """Starts (or joins) the background summary of content and keeps its handle in session state."""
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    st.session_state.summary_job = get_job_manager().submit(
+        ("summary", content_hash), summary_job, content, dict(st.session_state.chunk_summaries),
+        description="Generating summary"
+    )
+
+def batch_job(job, questions, chunk_index, page_context):
+    """Background job: answers a list of questions in batched calls; returns (results, report)."""
+    job.update(f"🤖 Answering {len(questions)} questions...")
+    cached_content = page_context.ensure() if page_context else None
     
-    # Fallback to enhanced requests method
-    if not content:
+    def llm(prompt, request_type):
+        job.check_cancelled()
         try:
-            content, fallback_error = extract_with_requests(validated_url)
-            if content:
-                extraction_method = "Enhanced Static HTML (Requests)" + (" - Fallback" if use_selenium else " - Cloud Mode")
-            else:
-                # Provide more helpful error message for Streamlit Cloud
-                if IS_STREAMLIT_CLOUD:
-                    error_msg = f"Content extraction failed. This website might be heavily JavaScript-dependent. {fallback_error} Note: JavaScript rendering is not available on Streamlit Cloud, so some dynamic content may not be accessible."
-                else:
-                    error_msg = fallback_error
-        except Exception as e:
-            if IS_STREAMLIT_CLOUD:
-                error_msg = f"All extraction methods failed on Streamlit Cloud: {str(e)}. This website might require JavaScript rendering which is not available in this environment."
-            else:
-                error_msg = f"All extraction methods failed: {str(e)}"
-    
-    if content:
-        # Calculate content statistics
-        stats = {
-            'character_count': len(content),
-            'word_count': len(content.split()),
-            'extraction_method': extraction_method
-        }
-        return content, extraction_method, stats
+            return get_gemini_response(prompt, request_type=request_type, cached_content=cached_content,
+                                       on_usage=page_context.record if cached_content else None)
+        except GeminiError:
+            # The next question re-uploads the page instead of referencing a rejected entry
+            if cached_content:
+                page_context.invalidate()
+            raise
+    
+    questioner = BatchQuestioner(llm, chunk_index, cached_context=bool(cached_content))
+    results = questioner.answer(questions)
+    return results, questioner.report
+
+def start_load_job(url, crawl=False, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, revalidate=False):
+    """Starts (or joins) the background extraction of url and keeps its handle in session state."""
+    manager = get_job_manager()
+    if st.session_state.load_job is not None:
+        manager.cancel(st.session_state.load_job)
+    url = url.strip()
+    if crawl:
+        key = ("crawl", url, max_depth, max_pages)
     else:
-        return f"Error: {error_msg}", "error", {}
+        key = ("reload" if revalidate else "load", url)
+    st.session_state.load_job = manager.submit(key, load_website_job, url, crawl=crawl, max_depth=max_depth,
+                                               max_pages=max_pages, revalidate=revalidate, description=f"Loading {url}")
 
-def get_gemini_response(prompt):
-    """Enhanced Gemini API call with better error handling."""
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-    
-    data = {
-        "contents": [{
-            "parts": [{"text": prompt}]
-        }],
-        "generationConfig": {
-            "maxOutputTokens": 2048,
-            "temperature": 0.7
-        },
-        "safetySettings": [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
-    }
-    
-    headers = {"Content-Type": "application/json"}
-    
-    try:
-        response = requests.post(url, json=data, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        if "candidates" in result and result["candidates"]:
-            candidate = result["candidates"][0]
-            if "content" in candidate and "parts" in candidate["content"]:
-                answer = candidate["content"]["parts"][0]["text"].strip()
-                return answer
-            else:
-                return "Error: Invalid response structure from API"
-        else:
-            return "Error: No candidates in API response"
+def load_website_job(job, url, crawl=False, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, revalidate=False):
+    """Background job: returns the result of fetch_website_content or crawl_website_content."""
+    if crawl:
+        job.update("🕸️ Crawling the website...")
+        return crawl_website_content(
+            url, max_depth=max_depth, max_pages=max_pages, cancel_event=job.cancel_event,
+            on_progress=lambda report: job.update(
+                f"🕸️ {report['pages']} pages crawled · {report['queued']} queued · "
+                f"{report['in_flight']} in flight · {report['failures']} failed · "
+                f"{report['pages_per_second']:.1f} pages/s"
+            )
+        )
+    job.update("🔄 Loading website content...")
+    return fetch_website_content(url, revalidate=revalidate, cancel_event=job.cancel_event)
+
+def finish_load_job(job):
+    """Applies a finished extraction job to the session and reports the outcome.
+    
+    A failed reload keeps the content that was already loaded. A successful one is
+    diffed block by block against it: unchanged content keeps the summary, and
+    changed content keeps the chunk index entries and section summaries of the
+    blocks that did not change, so only the edits are processed again.
+    """
+    if job.status == CANCELLED:
+        return
+    reload = job.key[0] == "reload"
+    result = job.result if job.status == DONE else (f"Error: {str(job.error)}", "error", {})
+    if len(result) == 3:
+        content, extraction_method, stats = result
+        if reload and "Error:" in content:
+            st.markdown(f'<div class="error-message">❌ Reload failed, keeping the loaded content. {content}</div>',
+                        unsafe_allow_html=True)
+        elif "Error:" not in content:
+            previous = st.session_state.content
+            changes = diff_content(previous, content) if reload and previous else None
+            summary_refreshing = False
+            st.session_state.content = content
+            st.session_state.extraction_method = extraction_method
+            st.session_state.content_stats = stats
+            st.session_state.error = None
+            # Indexing and rendering join the trace of the load, so the panel shows the whole request
+            trace = stats.get('trace')
+            if content != previous or st.session_state.chunk_index is None:
+                with start_trace(trace=trace), span('index'):
+                    st.session_state.chunk_index = ChunkIndex(content, previous=st.session_state.chunk_index)
+            if content != previous:
+                # Section summaries of unchanged blocks stay in chunk_summaries, so a refresh only pays for the edits
+                summary_refreshing = reload and bool(st.session_state.summary)
+                st.session_state.summary = ""
+                st.session_state.summary_report = {}
+                st.session_state.batch_report = {}
+                if summary_refreshing:
+                    start_summary_job(content)
+            # Unchanged content keeps its cached context; anything else replaces it
+            page_context = st.session_state.page_context
+            if not page_context or not page_context.matches(content):
+                if page_context:
+                    page_context.release()
+                st.session_state.page_context = new_page_context(content)
+            
+            # Cache, browser pool and crawl details, only shown when relevant
+            pool_stats = stats.get('browser_pool')
+            crawl_stats = stats.get('crawl')
+            details_line = ""
+            if crawl_stats:
+                details_line += (f"<br>🕸️ Crawl: {crawl_stats['pages']} pages in {crawl_stats['seconds']:.1f}s "
+                                 f"({crawl_stats['pages_per_second']:.1f} pages/s), {crawl_stats['failures']} failed, "
+                                 f"{crawl_stats['duplicates']} duplicates")
+            if stats.get('page_count'):
+                details_line += f"<br>📄 Pages: {stats['pages']:,} of {stats['page_count']:,} read"
+            if stats.get('cache') in ("hit", "revalidated"):
+                details_line += "<br>⚡ Served from content cache"
+            if changes is not None and not has_changes(changes):
+                details_line += "<br>🔁 No changes since the last load"
+            elif changes is not None:
+                details_line += (f"<br>🔁 Changes since the last load: {len(changes['changed'])} changed, "
+                                 f"{len(changes['added'])} added and {len(changes['removed'])} removed of "
+                                 f"{changes['blocks']} blocks ({changes['changed_share']:.0%} of the content)"
+                                 + ("; refreshing the summary from the unchanged sections" if summary_refreshing else ""))
+            if pool_stats:
+                details_line += (f"<br>🧭 Browser Pool: {pool_stats['hits']} warm / {pool_stats['misses']} cold starts, "
+                             f"avg wait {pool_stats['avg_wait'] * 1000:.0f} ms")
             
-    except requests.RequestException as e:
-        return f"Error: API request failed - {str(e)}"
-    except (KeyError, IndexError) as e:
-        return f"Error: Invalid API response structure - {str(e)}"
-    except Exception as e:
-        return f"Error: Unexpected error - {str(e)}"
+            # Success message
+            with start_trace(trace=trace), span('render'):
+                st.markdown(f"""
+                <div class="success-message">
+                    ✅ <strong>Website loaded successfully!</strong><br>
+                    📊 Extraction Method: {extraction_method}<br>
+                    📝 Content Length: {stats.get('character_count', 0):,} characters<br>
+                    📖 Word Count: {stats.get('word_count', 0):,} words{details_line}
+                </div>
+                """, unsafe_allow_html=True)
+                if changes is not None and has_changes(changes):
+                    with st.expander("🔍 What changed"):
+                        st.code(format_diff(changes), language="diff")
+            show_performance(trace, stats.get('seconds'))
+        else:
+            st.session_state.error = content
+            st.markdown(f'<div class="error-message">❌ {content}</div>', unsafe_allow_html=True)
+    else:
+        st.session_state.error = result[0] if result else "Unknown error occurred"
+        st.markdown(f'<div class="error-message">❌ {st.session_state.error}</div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(state_key, render=None):
+    """Shows a running job's progress, refreshed on a timer without rerunning the whole app.
+    
+    Once the job is over the app reruns, and the code that started the job
+    applies its result. render optionally draws the job's progress values.
+    """
+    job = st.session_state.get(state_key)
+    if job is None or job.done():
+        st.rerun()
+    message, progress = job.snapshot()
+    status_col, cancel_col = st.columns([4, 1])
+    with status_col:
+        st.caption(f"⏳ {message or job.description} ({job.elapsed():.0f}s)")
+    with cancel_col:
+        if st.button("✖ Cancel", key=f"cancel_{state_key}", use_container_width=True):
+            get_job_manager().cancel(job)
+            st.session_state[state_key] = None
+            st.rerun()
+    if render:
+        render(progress)
 
 st.markdown('<h1 class="main-title">🤖 AI Agent To Chat With Websites</h1>', unsafe_allow_html=True)
 st.markdown('<p class="subtitle">Engage in a natural, interactive conversation about website content!</p>', unsafe_allow_html=True)
@@ -673,84 +459,70 @@ url = st.text_input(
     key="url_input"
 )
 
+# Optional multi-page crawl of the whole site
+crawl_col, depth_col, pages_col = st.columns([2, 1, 1])
+with crawl_col:
+    crawl_site = st.checkbox("🕸️ Crawl whole site", key="crawl_site",
+                             help="Follow links on the same website and chat with all crawled pages together")
+if crawl_site:
+    with depth_col:
+        crawl_depth = st.number_input("Link depth", min_value=0, max_value=5, value=CRAWL_MAX_DEPTH, key="crawl_depth")
+    with pages_col:
+        crawl_pages = st.number_input("Max pages", min_value=1, max_value=500, value=CRAWL_MAX_PAGES, key="crawl_pages")
+
 if st.button("🔍 Load Website", key="load_button"):
     if url:
-        with st.spinner("🔄 Loading website content..."):
-            result = fetch_website_content(url)
-            
-            if len(result) == 3:
-                content, extraction_method, stats = result
-                if "Error:" not in content:
-                    st.session_state.content = content
-                    st.session_state.extraction_method = extraction_method
-                    st.session_state.content_stats = stats
-                    st.session_state.error = None
-                    st.session_state.summary = ""
-                    
-                    # Success message
-                    st.markdown(f"""
-                    <div class="success-message">
-                        ✅ <strong>Website loaded successfully!</strong><br>
-                        📊 Extraction Method: {extraction_method}<br>
-                        📝 Content Length: {stats.get('character_count', 0):,} characters<br>
-                        📖 Word Count: {stats.get('word_count', 0):,} words
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.session_state.error = content
-                    st.markdown(f'<div class="error-message">❌ {content}</div>', unsafe_allow_html=True)
-            else:
-                st.session_state.error = result[0] if result else "Unknown error occurred"
-                st.markdown(f'<div class="error-message">❌ {st.session_state.error}</div>', unsafe_allow_html=True)
+        if crawl_site:
+            start_load_job(url, crawl=True, max_depth=int(crawl_depth), max_pages=int(crawl_pages))
+        else:
+            start_load_job(url)
     else:
         st.markdown('<div class="error-message">⚠️ Please enter a valid URL</div>', unsafe_allow_html=True)
 
+# Extraction runs in the background; reruns keep polling the same job until it is over
+if st.session_state.load_job is not None:
+    load_job = st.session_state.load_job
+    if load_job.done():
+        st.session_state.load_job = None
+        finish_load_job(load_job)
+    else:
+        show_job_progress("load_job")
+
 # Chat interface with enhanced styling
 if st.session_state.content and not st.session_state.error:
     st.markdown("---")
     
     # Summary section with separate output
-    if st.button("📋 Generate Summary", key="summary_button", help="Get an AI-generated summary of the website content"):
-        with st.spinner("🤖 Generating summary..."):
-            summary_prompt = f"""
-            Please provide a comprehensive summary of the following website content. 
-            Include key points, main topics, and important information:
-            
-            {st.session_state.content[:8000]}
-            """
-            
-            summary = get_gemini_response(summary_prompt)
-            if summary and not summary.startswith("Error"):
-                st.session_state.summary = summary
-            else:
+    summary_clicked = st.button("📋 Generate Summary", key="summary_button", help="Get an AI-generated summary of the website content")
+    if summary_clicked:
+        start_summary_job(st.session_state.content)
+    
+    summary_placeholder = st.empty()
+    if st.session_state.summary_job is not None:
+        job = st.session_state.summary_job
+        if job.done():
+            st.session_state.summary_job = None
+            if job.status == DONE:
+                st.session_state.summary, st.session_state.summary_report, chunk_summaries = job.result
+                # Sessions that joined the job share its result, so each keeps a copy of its own
+                st.session_state.chunk_summaries = dict(chunk_summaries)
+            elif job.status == FAILED:
                 st.session_state.summary = "Unable to generate summary. Please try again."
+        else:
+            # Render tokens of the final summary as they arrive
+            show_job_progress("summary_job", render=lambda progress: st.markdown(
+                render_summary_html(progress['text'] + " ▌"), unsafe_allow_html=True) if progress.get('text') else None)
     
-    if st.session_state.summary:
-        # Process the summary text to handle Markdown formatting
-        processed_summary = st.session_state.summary
-        
-        # Convert **text** to <strong>text</strong> for proper HTML bold formatting
-        processed_summary = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_summary)
-        
-        # Convert bullet points (lines starting with * ) to proper HTML bullets
-        processed_summary = re.sub(r'^\* (.+)$', r'• \1', processed_summary, flags=re.MULTILINE)
+    if st.session_state.summary and st.session_state.summary_job is None:
+        summary_placeholder.markdown(render_summary_html(st.session_state.summary), unsafe_allow_html=True)
         
-        # Convert *text* to <em>text</em> for italic formatting (but not for bullet points)
-        processed_summary = re.sub(r'(?<!^)\*([^*\n]+?)\*(?!\s)', r'<em>\1</em>', processed_summary, flags=re.MULTILINE)
-        
-        # Convert newlines to <br> tags
-        processed_summary = processed_summary.replace('\n', '<br>')
-        
-        st.markdown(f"""
-        <div class="summary-container">
-            <div class="summary-title">
-                📋 Website Summary
-            </div>
-            <div class="summary-content">
-                {processed_summary}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        report = st.session_state.summary_report
+        if report.get('total'):
+            total = report['total']
+            stage_times = " / ".join(f"{stage['name']} {stage['seconds']:.1f}s" for stage in report['stages'])
+            st.caption(f"📊 {total['chunks']} section(s), {total['calls']} API call(s), "
+                       f"{total['cached']} cached section(s), ~{total['input_tokens'] + total['output_tokens']:,} tokens, "
+                       f"{total['seconds']:.1f}s ({stage_times})")
     
     # Chat interface
     st.subheader("💬 Chat with the Website")
@@ -792,55 +564,157 @@ if st.session_state.content and not st.session_state.error:
     
     # Process message sending
     if send_clicked and question.strip():
-        with st.spinner("🤖 AI is thinking..."):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            prompt = f"""
-            Based on the following website content, please answer the user's question comprehensively and accurately:
-            
-            Website Content:
-            {st.session_state.content}
-            
-            User Question: {question}
-            
-            Please provide a detailed, helpful response based solely on the website content provided.
-            """
-            
-            response = get_gemini_response(prompt)
-            
-            if response and not response.startswith("Error"):
-                st.session_state.conversation.append({
-                    'question': question,
-                    'answer': response,
-                    'timestamp': timestamp
-                })
-                st.rerun()
-            else:
-                st.markdown('<div class="error-message">❌ Sorry, I encountered an error processing your question. Please try again.</div>', unsafe_allow_html=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        # Only send the chunks of the page that are relevant to the question
+        if st.session_state.chunk_index is None:
+            st.session_state.chunk_index = ChunkIndex(st.session_state.content)
+        # Large pages are uploaded once to a Gemini cached context and referenced by every question
+        page_context = st.session_state.page_context
+        cached_content = page_context.ensure() if page_context else None
+        on_usage = page_context.record if cached_content else None
+        
+        # The prompt keeps the most relevant chunks, the conversation summary and recent turns that fit the token budget
+        with span('prompt_build'):
+            memory_summary, recent_turns = st.session_state.memory.context(st.session_state.conversation)
+            prompt, prompt_report = question_prompt(question, st.session_state.chunk_index, recent_turns,
+                                                    memory_summary, cached_context=bool(cached_content))
+        logger.info(f"Question prompt: ~{prompt_report['tokens']:,} of {prompt_report['budget']:,} tokens, "
+                    f"sections {prompt_report['sections']}")
+        
+        if GEMINI_STREAMING:
+            # Show the question right away and render the answer as tokens arrive
+            st.markdown(f"""
+            <div class="user-message">
+                👤 {question}
+                <div class="timestamp">Asked at {timestamp}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        def answer(prompt, cached_content=None, on_usage=None):
+            if not GEMINI_STREAMING:
+                with st.spinner("🤖 AI is thinking..."):
+                    return get_gemini_response(prompt, cached_content=cached_content, on_usage=on_usage)
+            answer_placeholder = st.empty()
+            response = ""
+            try:
+                # Includes the API call; the llm span and time to first token are recorded separately
+                with span('answer_render'):
+                    for chunk in stream_gemini_response(prompt, cached_content=cached_content, on_usage=on_usage):
+                        response += chunk
+                        answer_placeholder.markdown(f'<div class="ai-message">🤖 {response} ▌</div>',
+                                                    unsafe_allow_html=True)
+            finally:
+                answer_placeholder.empty()
+            return response
+        
+        response = ""
+        error = None
+        try:
+            try:
+                response = answer(prompt, cached_content, on_usage)
+            except GeminiError:
+                if not cached_content:
+                    raise
+                # The cached context expired or was rejected; answer from retrieved chunks instead
+                page_context.invalidate()
+                prompt, prompt_report = question_prompt(question, st.session_state.chunk_index, recent_turns, memory_summary)
+                response = answer(prompt)
+        except GeminiError as e:
+            logger.error(f"Question failed: {str(e)}")
+            error = e
+        
+        if response:
+            st.session_state.conversation.append({
+                'question': question,
+                'answer': response.strip(),
+                'timestamp': timestamp
+            })
+            # Fold turns that left the recent window into the summary in the background
+            st.session_state.memory.update(
+                st.session_state.conversation,
+                lambda memory_prompt: get_gemini_response(memory_prompt, request_type="memory")
+            )
+            st.rerun()
+        elif isinstance(error, GeminiStreamInterrupted):
+            # A cut-off answer is shown as such but kept out of the conversation and its memory
+            st.markdown(f'<div class="ai-message">🤖 {error.partial}</div>', unsafe_allow_html=True)
+            st.markdown('<div class="error-message">⚠️ The answer was cut off before it was complete and was not '
+                        'added to the conversation. Please ask again.</div>', unsafe_allow_html=True)
+        elif isinstance(error, GeminiRateLimitError):
+            st.markdown('<div class="error-message">⏳ The Gemini API rate limit was reached. Please wait a moment and try again.</div>', unsafe_allow_html=True)
+        else:
+            st.markdown('<div class="error-message">❌ Sorry, I encountered an error processing your question. Please try again.</div>', unsafe_allow_html=True)
     elif send_clicked and not question.strip():
         st.markdown('<div class="error-message">⚠️ Please enter a question</div>', unsafe_allow_html=True)
     
+    # Batch mode: a list of questions answered with as few API calls as the token budget allows
+    with st.expander("📋 Ask Several Questions at Once"):
+        batch_text = st.text_area(
+            "Questions, one per line",
+            placeholder="What does the product cost?\nWhich regions is it available in?\nHow is support provided?",
+            key="batch_input",
+            height=150
+        )
+        if st.button("Answer All", key="batch_button", use_container_width=True):
+            questions = parse_questions(batch_text)
+            if not questions:
+                st.markdown('<div class="error-message">⚠️ Please enter at least one question</div>', unsafe_allow_html=True)
+            else:
+                if st.session_state.chunk_index is None:
+                    st.session_state.chunk_index = ChunkIndex(st.session_state.content)
+                content_hash = hashlib.sha256(st.session_state.content.encode('utf-8')).hexdigest()
+                st.session_state.batch_job = get_job_manager().submit(
+                    ("batch", content_hash, tuple(questions)), batch_job, questions, st.session_state.chunk_index,
+                    st.session_state.page_context, description=f"Answering {len(questions)} questions"
+                )
+        
+        if st.session_state.batch_job is not None:
+            job = st.session_state.batch_job
+            if not job.done():
+                show_job_progress("batch_job")
+            else:
+                st.session_state.batch_job = None
+                results, st.session_state.batch_report = job.result if job.status == DONE else ([], {})
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                answered = [result for result in results if result['answer']]
+                st.session_state.conversation.extend(
+                    {'question': result['question'], 'answer': result['answer'], 'timestamp': timestamp}
+                    for result in answered
+                )
+                if answered:
+                    st.session_state.memory.update(
+                        st.session_state.conversation,
+                        lambda memory_prompt: get_gemini_response(memory_prompt, request_type="memory")
+                    )
+                    st.rerun()
+                elif job.status != CANCELLED:
+                    st.markdown('<div class="error-message">❌ Sorry, none of the questions could be answered. Please try again.</div>', unsafe_allow_html=True)
+        
+        report = st.session_state.batch_report
+        if report:
+            st.caption(f"📊 Last batch: {report['questions']} question(s) in {report['calls']} API call(s) "
+                       f"({report['fallbacks']} asked individually, {report['failures']} failed), "
+                       f"{report['seconds']:.1f}s and ~{report['input_tokens']:,} input tokens; one by one: "
+                       f"~{report['sequential_seconds']:.1f}s and ~{report['sequential_input_tokens']:,} input tokens")
+    
     # Action buttons
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("🗑️ Clear Chat", key="clear_button", use_container_width=True):
             st.session_state.conversation = []
+            st.session_state.memory.reset()
+            # The next question uploads a fresh cached context
+            if st.session_state.page_context:
+                st.session_state.page_context.release()
             st.rerun()
     
     with col2:
         if st.button("🔄 Reload Website", key="reload_button", use_container_width=True):
             if url:
-                with st.spinner("🔄 Reloading..."):
-                    result = fetch_website_content(url)
-                    if len(result) == 3:
-                        content, method, stats = result
-                        if "Error:" not in content:
-                            st.session_state.content = content
-                            st.session_state.extraction_method = method
-                            st.session_state.content_stats = stats
-                            st.session_state.summary = ""
-                            st.success("✅ Website reloaded successfully!")
-                            st.rerun()
+                start_load_job(url, revalidate=True)
+                st.rerun()
 
 else:
     # Welcome message when no content is loaded
@@ -852,6 +726,56 @@ else:
     </div>
     """, unsafe_allow_html=True)
 
+# Cache effectiveness across all sessions in this process
+with st.expander("📈 Cache Statistics"):
+    content_cache = get_content_cache()
+    response_cache = get_response_cache()
+    if content_cache:
+        content_cache_stats = content_cache.stats()
+        st.markdown(f"**Website content cache:** {content_cache_stats['entries']:,} pages, "
+                    f"{content_cache_stats['bytes'] / 1024:,.0f} KB, "
+                    f"hit ratio {content_cache_stats['hit_ratio']:.0%}")
+    if response_cache:
+        response_cache_stats = response_cache.stats()
+        st.markdown(f"**AI response cache:** {response_cache_stats['hits']:,} hits, "
+                    f"{response_cache_stats['coalesced']:,} shared in-flight, "
+                    f"{response_cache_stats['misses']:,} misses "
+                    f"(hit ratio {response_cache_stats['hit_ratio']:.0%})")
+    if not content_cache and not response_cache:
+        st.markdown("Caching is disabled.")
+    job_stats = get_job_manager().stats()
+    if job_stats['submitted']:
+        st.markdown(f"**Background jobs:** {job_stats['submitted']:,} started, "
+                    f"{job_stats['deduplicated']:,} joined an identical running job, "
+                    f"{job_stats['active']:,} running, {job_stats['failed']:,} failed, "
+                    f"{job_stats['cancelled']:,} cancelled")
+
+with st.expander("🧮 Token Usage"):
+    token_stats = get_token_counter().stats()
+    if token_stats['by_type']:
+        for request_type, totals in token_stats['by_type'].items():
+            st.markdown(f"**{request_type.capitalize()} calls:** {totals['calls']:,}, "
+                        f"{totals['prompt_tokens']:,} prompt and {totals['output_tokens']:,} output tokens reported, "
+                        f"{totals['estimated']:,} estimated (error {totals['error_ratio']:.0%})")
+        st.caption(f"Local estimates are scaled by {token_stats['ratio']:.2f} to match the API's token counts.")
+    else:
+        st.markdown("No API calls with token counts yet.")
+    
+    client_stats = get_gemini_client(API_KEY).stats()
+    if client_stats['requests']:
+        limiter_stats = client_stats['limiter']
+        st.caption(f"API connection: {client_stats['requests']:,} HTTP request(s), {client_stats['retries']:,} retried, "
+                   f"{client_stats['rate_limited']:,} rate limited, {client_stats['failures']:,} failed; "
+                   f"{limiter_stats['waited']:,} waited {limiter_stats['wait_seconds']:.1f}s for quota")
+    
+    page_context = st.session_state.page_context
+    if page_context and page_context.savings['calls']:
+        savings = page_context.savings
+        st.markdown(f"**Context cache (this session):** {savings['calls']:,} questions reused "
+                    f"{savings['cached_tokens']:,} cached input tokens after a {savings['uploaded_tokens']:,}-token upload")
+    elif page_context and page_context.unavailable:
+        st.caption(f"Context cache not used for this page: {page_context.unavailable}")
+
 # Instructions and tips
 with st.expander("ℹ️ How to Use & Tips"):
     st.markdown("""
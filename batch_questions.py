@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from retrieval import RAG_TOP_K
+from prompt_builder import PromptBuilder, question_prompt, input_budget, output_tokens
+from token_counter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Batch question configuration (overridable through environment variables)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "10"))
+BATCH_ANSWER_TOKENS = int(os.getenv("BATCH_ANSWER_TOKENS", "350"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+
+# Share of a batch prompt's budget the questions themselves may take; the rest is page content
+QUESTION_BUDGET_SHARE = 0.25
+
+# Gemini structured output: one {id, answer} object per question
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "answer": {"type": "STRING"}
+        },
+        "required": ["id", "answer"]
+    }
+}
+
+_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+def parse_questions(text):
+    """Splits pasted text into questions: one per line, list markers removed, duplicates dropped."""
+    questions = []
+    seen = set()
+    for line in text.splitlines():
+        question = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+        if question and question.lower() not in seen:
+            seen.add(question.lower())
+            questions.append(question)
+    return questions
+
+def group_questions(questions, max_questions=BATCH_MAX_QUESTIONS, answer_tokens=BATCH_ANSWER_TOKENS):
+    """Packs questions in order into as few groups as the batch token budgets allow.
+
+    A group is closed when its answers would no longer fit in the batch output
+    limit or its questions would crowd the page content out of the prompt.
+    """
+    max_questions = max(1, min(max_questions, output_tokens('batch') // max(1, answer_tokens)))
+    question_budget = int(input_budget('batch') * QUESTION_BUDGET_SHARE)
+
+    groups = []
+    current = []
+    current_tokens = 0
+    for question in questions:
+        tokens = estimate_tokens(question) + 3
+        if current and (len(current) >= max_questions or current_tokens + tokens > question_budget):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(question)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def batch_prompt(questions, chunk_index, top_k=None, budget=None, cached_context=False):
+    """Builds one prompt asking all questions at once; returns (prompt, report).
+
+    Every question contributes its best-ranked chunks, taken round-robin so
+    that each question gets its top chunk before any gets a second one. With
+    cached_context the page is already held in a Gemini cached context.
+    """
+    builder = PromptBuilder('batch', budget=budget)
+    if cached_context:
+        builder.add('instructions', "Using the website content you were given, answer each of the numbered "
+                                    "questions below comprehensively and accurately.", priority=0)
+    else:
+        rankings = [(chunk_index.rank(question) or list(range(len(chunk_index.chunks))))[:top_k or RAG_TOP_K]
+                    for question in questions]
+        ranked = []
+        for rank in range(max(len(r) for r in rankings)):
+            for ranking in rankings:
+                if rank < len(ranking) and ranking[rank] not in ranked:
+                    ranked.append(ranking[rank])
+        builder.add('instructions', "Based on the following excerpts from a website, answer each of the numbered "
+                                    "questions below comprehensively and accurately.", priority=0)
+        builder.add('title', f"Website Title: {chunk_index.title}", priority=1)
+        builder.add('description', f"Website Description: {chunk_index.description}" if chunk_index.description else "",
+                    priority=4)
+        builder.add_items('content', [chunk_index.chunks[i] for i in ranked], priority=2, truncate=True,
+                          heading="Relevant Website Content:", order=ranked, separator="\n\n---\n\n")
+    builder.add('questions', "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1)),
+                priority=0, heading="Questions:", truncate=False)
+    builder.add('closing', "Answer based solely on the website content provided. Reply with a JSON array holding "
+                           "one object per question, {\"id\": <question number>, \"answer\": <answer text>}, and "
+                           f"keep each answer under {BATCH_ANSWER_TOKENS * 3 // 4} words.", priority=0)
+    prompt = builder.build()
+    return prompt, builder.report
+
+def parse_answers(text, count):
+    """Reads the answers of a batch reply; returns {question number: answer} for the usable ones."""
+    try:
+        data = json.loads(_FENCE_PATTERN.sub("", text.strip()))
+    except ValueError:
+        return {}
+    if isinstance(data, dict):
+        data = data.get('answers', [])
+    answers = {}
+    for item in data if isinstance(data, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            number = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        answer = str(item.get('answer') or "").strip()
+        if 1 <= number <= count and answer:
+            answers[number] = answer
+    return answers
+
+class BatchQuestioner:
+    """Answers many questions about one page with as few model calls as possible.
+
+    llm is a blocking (prompt, request_type) -> text function that raises on
+    failure. Questions are packed into groups answered by one "batch" call each
+    with JSON output, and groups run concurrently. Questions a batch reply left
+    unanswered (a failed call, malformed or truncated JSON) are retried as
+    single "question" calls. The report compares tokens and time with
+    submitting every question on its own.
+    """
+
+    def __init__(self, llm, chunk_index, cached_context=False, max_workers=BATCH_MAX_WORKERS):
+        self.llm = llm
+        self.chunk_index = chunk_index
+        self.cached_context = cached_context
+        self.max_workers = max(1, max_workers)
+        self.report = {}
+        self._lock = threading.Lock()
+
+    def answer(self, questions):
+        """Returns one {'question', 'answer', 'error'} dict per question, in the order given."""
+        start = time.monotonic()
+        groups = group_questions(questions)
+        self.report = {'questions': len(questions), 'groups': len(groups), 'calls': 0, 'fallbacks': 0,
+                       'failures': 0, 'input_tokens': 0, 'output_tokens': 0, 'call_seconds': 0.0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            replies = list(executor.map(self._ask_group, groups))
+
+            results = []
+            missing = []
+            for group, answers in zip(groups, replies):
+                for number, question in enumerate(group, 1):
+                    if number not in answers:
+                        missing.append(len(results))
+                    results.append({'question': question, 'answer': answers.get(number, ""), 'error': None})
+
+            # Anything the batch replies missed is asked on its own
+            self.report['fallbacks'] = len(missing)
+            for index, (answer, error) in zip(missing, executor.map(lambda i: self._ask_single(results[i]['question']),
+                                                                   missing)):
+                results[index]['answer'] = answer
+                results[index]['error'] = error
+                if error:
+                    self.report['failures'] += 1
+
+        sequential_tokens = sum(estimate_tokens(question_prompt(question, self.chunk_index,
+                                                                cached_context=self.cached_context)[0])
+                                for question in questions)
+        seconds_per_call = self.report['call_seconds'] / self.report['calls'] if self.report['calls'] else 0.0
+        self.report.update({
+            'seconds': time.monotonic() - start,
+            'sequential_input_tokens': sequential_tokens,
+            # Each question would have been one call of about the average batch call time
+            'sequential_seconds': seconds_per_call * len(questions)
+        })
+        return results
+
+    def _ask_group(self, group):
+        """Asks one group of questions in a single call; returns {question number: answer}."""
+        if len(group) == 1:
+            return {}
+        prompt, _ = batch_prompt(group, self.chunk_index, cached_context=self.cached_context)
+        try:
+            reply = self._call(prompt, 'batch')
+        except Exception as e:
+            logger.warning(f"Batch of {len(group)} questions failed, asking them one by one: {str(e)}")
+            return {}
+        answers = parse_answers(reply, len(group))
+        if len(answers) < len(group):
+            logger.warning(f"Batch reply answered {len(answers)} of {len(group)} questions")
+        return answers
+
+    def _ask_single(self, question):
+        """Asks one question on its own; returns (answer, error)."""
+        prompt, _ = question_prompt(question, self.chunk_index, cached_context=self.cached_context)
+        try:
+            return self._call(prompt, 'question').strip(), None
+        except Exception as e:
+            logger.error(f"Question failed: {str(e)}")
+            return "", e
+
+    def _call(self, prompt, request_type):
+        """Runs one model call and adds its estimated tokens and duration to the report."""
+        start = time.monotonic()
+        reply = ""
+        try:
+            reply = self.llm(prompt, request_type) or ""
+            return reply
+        finally:
+            with self._lock:
+                self.report['calls'] += 1
+                self.report['call_seconds'] += time.monotonic() - start
+                self.report['input_tokens'] += estimate_tokens(prompt)
+                self.report['output_tokens'] += estimate_tokens(reply)
+
+def run_benchmark(questions=24, latency=1.5, seconds_per_token=0.004):
+    """Answers synthetic questions with a mock model and compares batching with one call per question."""
+    from retrieval import ChunkIndex
+
+    topics = [f"topic{i}" for i in range(questions)]
+    content = "Title: Benchmark Page\n\nContent: " + " ".join(
+        f"The {topic} section explains how {topic} works, what {topic} costs and who supports {topic}. " * 8
+        for topic in topics)
+    chunk_index = ChunkIndex(content)
+    asked = [f"What does the page say about {topic}?" for topic in topics]
+
+    def mock_llm(prompt, request_type):
+        if request_type == 'batch':
+            count = len(re.findall(r"^\d+\. ", prompt, re.MULTILINE))
+            reply = json.dumps([{"id": i, "answer": f"Mock answer {i}. " * 20} for i in range(1, count + 1)])
+        else:
+            reply = "Mock answer. " * 20
+        time.sleep(latency + estimate_tokens(reply) * seconds_per_token)
+        return reply
+
+    start = time.monotonic()
+    for question in asked:
+        mock_llm(question_prompt(question, chunk_index)[0], 'question')
+    sequential_seconds = time.monotonic() - start
+
+    questioner = BatchQuestioner(mock_llm, chunk_index)
+    results = questioner.answer(asked)
+    report = questioner.report
+    print(f"{questions} questions, {report['groups']} batch call(s), {report['fallbacks']} fallback(s), "
+          f"{sum(1 for r in results if r['answer'])} answered")
+    print(f"  sequential: {sequential_seconds:.1f}s, ~{report['sequential_input_tokens']:,} input tokens")
+    print(f"  batched:    {report['seconds']:.1f}s, ~{report['input_tokens']:,} input tokens")
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    run_benchmark()
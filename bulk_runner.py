@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from retrieval import ChunkIndex
+from summarizer import MapReduceSummarizer
+from batch_questions import BatchQuestioner, parse_questions
+from web_agent import fetch_website_content, get_gemini_response, API_KEY
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Bulk processing configuration (overridable through environment variables)
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "4"))
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", "10"))
+
+def read_lines(path):
+    """Reads non-empty, non-comment lines from a text file."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def read_checkpoint(path):
+    """Returns the URLs an earlier run already wrote successful records for.
+
+    The JSONL output doubles as the checkpoint: every finished URL is flushed as
+    one line, so a run that was interrupted leaves at most one partial line,
+    which is ignored. Failed URLs are processed again.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('status') == 'ok':
+                done.add(record.get('url'))
+    return done
+
+def drop_partial_line(path):
+    """Truncates a JSONL file after its last complete line, so appended records start on a line of their own."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def process_url(url, questions=(), summarize=True, use_selenium=True):
+    """Extracts one URL and optionally summarizes it and answers questions about it; returns a JSON-ready record.
+
+    Runs without Streamlit, so it can be called from worker threads or processes.
+    """
+    start = time.monotonic()
+    record = {'url': url, 'status': 'ok', 'error': None, 'timings': {}}
+
+    result = fetch_website_content(url, use_selenium=use_selenium)
+    content, extraction_method = result[0], result[1]
+    stats = result[2] if len(result) == 3 else {}
+    record['timings']['extract'] = time.monotonic() - start
+    if content.startswith("Error:"):
+        record.update(status='error', error=content[len("Error:"):].strip(),
+                      seconds=time.monotonic() - start)
+        return record
+    record.update({
+        'extraction_method': extraction_method,
+        'cache': stats.get('cache'),
+        'characters': stats.get('character_count', len(content)),
+        'words': stats.get('word_count', len(content.split()))
+    })
+    if stats.get('trace'):
+        record['spans'] = stats['trace'].summary()
+
+    if summarize:
+        stage_start = time.monotonic()
+        summarizer = MapReduceSummarizer(lambda prompt: get_gemini_response(prompt, request_type="summary"))
+        try:
+            record['summary'] = summarizer.summarize(content)
+        except Exception as e:
+            record.update(status='error', error=f"Summary failed: {str(e)}")
+        record['timings']['summary'] = time.monotonic() - stage_start
+
+    if questions:
+        stage_start = time.monotonic()
+        questioner = BatchQuestioner(lambda prompt, request_type: get_gemini_response(prompt, request_type=request_type),
+                                     ChunkIndex(content))
+        answers = questioner.answer(list(questions))
+        record['answers'] = [{'question': a['question'], 'answer': a['answer'],
+                              'error': str(a['error']) if a['error'] else None} for a in answers]
+        if any(a['error'] for a in answers):
+            record.update(status='error', error=record['error'] or "Some questions could not be answered")
+        record['timings']['questions'] = time.monotonic() - stage_start
+
+    record['seconds'] = time.monotonic() - start
+    return record
+
+class BulkRunner:
+    """Processes many URLs on a thread or process pool and streams one JSONL record per URL.
+
+    Records are written in completion order and flushed immediately, so the
+    output can be tailed while the run is going and serves as the checkpoint
+    for resume. At most two tasks per worker are in flight at a time, which
+    keeps memory flat for long URL lists. With processes, every worker process
+    has its own browser pool, caches in memory and Gemini rate limiter.
+    """
+
+    def __init__(self, questions=(), summarize=True, use_selenium=True, workers=BULK_WORKERS, processes=False):
+        self.questions = list(questions)
+        self.summarize = summarize
+        self.use_selenium = use_selenium
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.report = {}
+
+    def run(self, urls, output, resume=False, on_record=None):
+        """Processes urls and writes records to the output path; returns the throughput report."""
+        checkpoint = read_checkpoint(output) if resume else set()
+        if resume:
+            # An interrupted run can leave half a record behind; the next write must not continue it
+            drop_partial_line(output)
+        unique = list(dict.fromkeys(urls))
+        pending = [url for url in unique if url not in checkpoint]
+        start = time.monotonic()
+        self.report = {'urls': len(pending), 'skipped': len(unique) - len(pending), 'ok': 0, 'failed': 0,
+                       'timings': {}, 'seconds': 0.0, 'urls_per_second': 0.0}
+        last_progress = start
+
+        pool_class = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with open(output, 'a' if resume else 'w', encoding='utf-8') as out, pool_class(max_workers=self.workers) as pool:
+            remaining = iter(pending)
+            in_flight = {}
+            while True:
+                while len(in_flight) < self.workers * 2:
+                    url = next(remaining, None)
+                    if url is None:
+                        break
+                    in_flight[pool.submit(process_url, url, self.questions, self.summarize, self.use_selenium)] = url
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    url = in_flight.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        logger.error(f"Processing {url} failed: {str(e)}")
+                        record = {'url': url, 'status': 'error', 'error': str(e), 'timings': {}}
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    self._count(record)
+                    if on_record:
+                        on_record(record)
+
+                now = time.monotonic()
+                if now - last_progress >= BULK_PROGRESS_INTERVAL:
+                    last_progress = now
+                    done = self.report['ok'] + self.report['failed']
+                    logger.info(f"{done}/{len(pending)} URLs processed, {done / (now - start):.2f} URLs/s")
+
+        self.report['seconds'] = time.monotonic() - start
+        done = self.report['ok'] + self.report['failed']
+        self.report['urls_per_second'] = done / self.report['seconds'] if self.report['seconds'] else 0.0
+        return self.report
+
+    def _count(self, record):
+        """Adds one record to the throughput report."""
+        self.report['ok' if record['status'] == 'ok' else 'failed'] += 1
+        for stage, seconds in record.get('timings', {}).items():
+            self.report['timings'][stage] = self.report['timings'].get(stage, 0.0) + seconds
+        if self.processes:
+            # Worker processes time stages into registries of their own; replay the load spans here
+            for entry in record.get('spans', ()):
+                get_metrics().observe('stage_seconds', entry['seconds'], stage=entry['stage'])
+
+def main(argv=None):
+    """Command line entry point; see --help."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract, summarize and question many websites without the web UI.")
+    parser.add_argument("urls", help="text file with one URL per line")
+    parser.add_argument("-q", "--questions", help="text file with questions to ask about every URL")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL output file (default: results.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=BULK_WORKERS, help="parallel workers")
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--resume", action="store_true", help="skip URLs the output file already has results for")
+    parser.add_argument("--no-summary", action="store_true", help="only extract (and answer questions)")
+    parser.add_argument("--static-only", action="store_true", help="never start a browser")
+    parser.add_argument("--metrics", help="write stage latency percentiles to this JSON file when done")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    questions = parse_questions("\n".join(read_lines(args.questions))) if args.questions else []
+    if (questions or not args.no_summary) and not API_KEY:
+        parser.error("GEMINI_API_KEY is not set; use --no-summary without --questions to only extract")
+
+    runner = BulkRunner(questions, summarize=not args.no_summary, use_selenium=not args.static_only,
+                        workers=args.workers, processes=args.processes)
+    report = runner.run(read_lines(args.urls), args.output, resume=args.resume)
+
+    stage_times = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in report['timings'].items())
+    print(f"{report['ok'] + report['failed']} URL(s) in {report['seconds']:.1f}s "
+          f"({report['urls_per_second']:.2f} URLs/s): {report['ok']} ok, {report['failed']} failed, "
+          f"{report['skipped']} skipped from checkpoint", file=sys.stderr)
+    if stage_times:
+        print(f"  time per stage, summed over workers: {stage_times}", file=sys.stderr)
+    if args.metrics:
+        # With --processes, API latencies stay in the workers and only the load stages are included
+        get_metrics().dump(args.metrics)
+        print(f"  stage latencies written to {args.metrics}", file=sys.stderr)
+    return 0 if not report['failed'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration (overridable through environment variables)
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+CONTENT_CACHE_ENABLED = os.getenv("CONTENT_CACHE_ENABLED", "true").lower() == "true"
+CONTENT_CACHE_TTL = float(os.getenv("CONTENT_CACHE_TTL", "3600"))
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_PERSIST = os.getenv("RESPONSE_CACHE_PERSIST", "false").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+class SQLiteCache:
+    """Size-bounded LRU cache of JSON values, stored compressed in SQLite."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._conn.commit()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def get(self, key, max_age=None):
+        """Returns (value, stored_at) for a key, or (None, None) when absent or older than max_age."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (max_age is not None and now - row[1] > max_age):
+                self._stats['misses'] += 1
+                return None, None
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._stats['hits'] += 1
+
+        try:
+            return json.loads(zlib.decompress(row[0]).decode('utf-8')), row[1]
+        except (zlib.error, ValueError) as e:
+            logger.warning(f"Dropping corrupt cache entry {key}: {str(e)}")
+            self.delete(key)
+            return None, None
+
+    def set(self, key, value):
+        """Stores a JSON-serializable value and evicts least recently used entries over the size limit."""
+        blob = zlib.compress(json.dumps(value).encode('utf-8'))
+        if len(blob) > self.max_bytes:
+            logger.info(f"Not caching {key}: {len(blob)} bytes exceeds cache limit")
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now)
+            )
+            self._stats['writes'] += 1
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, key):
+        """Marks an entry as freshly stored, e.g. after a successful revalidation."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self._conn.commit()
+
+    def delete(self, key):
+        """Removes an entry if present."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters along with the current entry count and size."""
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            snapshot = dict(self._stats)
+        snapshot['entries'] = count
+        snapshot['bytes'] = size
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self._stats['evictions'] += 1
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache bounded by total size and entry age."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None when absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        """Stores a value of the given size in bytes, evicting least recently used entries."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        """Returns the current entry count and size."""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _remove(self, key):
+        """Drops an entry; the caller must hold the lock."""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+class _Flight:
+    """An in-progress computation that concurrent callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class ResponseCache:
+    """Process-wide cache of model responses with single-flight deduplication.
+
+    Identical concurrent requests share one in-flight call: the first caller
+    computes the value while the others wait for its result.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, disk=None):
+        self.ttl = ttl
+        self._memory = MemoryCache(max_bytes, ttl)
+        self._disk = disk
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    @staticmethod
+    def make_key(model, generation_config, prompt):
+        """Hashes everything that influences a response into a cache key."""
+        payload = json.dumps({
+            'model': model,
+            'generation_config': generation_config,
+            'prompt': prompt
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns a cached response from memory or disk, or None."""
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+
+        if self._disk is not None:
+            value, _ = self._disk.get(key, max_age=self.ttl)
+            if value is not None:
+                self._memory.set(key, value, len(key) + len(value.encode('utf-8')))
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                return value
+        return None
+
+    def set(self, key, value):
+        """Stores a response in memory and, when persistence is enabled, on disk."""
+        self._memory.set(key, value, len(key) + len(value.encode('utf-8')))
+        if self._disk is not None:
+            self._disk.set(key, value)
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """Returns the cached response for key, or computes it once for all concurrent callers.
+
+        If compute raises, the exception propagates to every waiting caller and nothing is cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self._stats['hits'] += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats['misses'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            if flight.result is not None and cacheable(flight.result):
+                self.set(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stream_or_compute(self, key, stream):
+        """Yields the response for key as text chunks, streaming it once for all concurrent callers.
+
+        stream() returns an iterator of text chunks. The first caller streams
+        them as they arrive and caches the joined text; concurrent callers wait
+        and get the complete text as one chunk. If the stream raises, the
+        exception propagates to every waiting caller and nothing is cached. If
+        the first caller stops reading early, a waiting caller streams anew.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                with self._lock:
+                    self._stats['hits'] += 1
+                yield value
+                return
+
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                    self._stats['misses'] += 1
+                else:
+                    self._stats['coalesced'] += 1
+
+            if leader:
+                break
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.result is not None:
+                yield flight.result
+                return
+
+        parts = []
+        try:
+            for text in stream():
+                parts.append(text)
+                yield text
+            flight.result = "".join(parts).strip()
+            self.set(key, flight.result)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        """Returns hit/miss counters and the cache size."""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(self._memory.stats())
+        lookups = snapshot['hits'] + snapshot['misses'] + snapshot['coalesced']
+        snapshot['hit_ratio'] = (snapshot['hits'] + snapshot['coalesced']) / lookups if lookups else 0.0
+        return snapshot
+
+_content_cache = None
+_response_cache = None
+_cache_lock = threading.Lock()
+
+def get_content_cache():
+    """Returns the process-wide website content cache, or None when disabled."""
+    global _content_cache
+    if not CONTENT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _content_cache is None:
+            try:
+                _content_cache = SQLiteCache(os.path.join(CACHE_DIR, "content.sqlite3"), CONTENT_CACHE_MAX_BYTES)
+                atexit.register(_content_cache.close)
+            except sqlite3.Error as e:
+                logger.error(f"Content cache unavailable: {str(e)}")
+                return None
+        return _content_cache
+
+def get_response_cache():
+    """Returns the process-wide model response cache, or None when disabled."""
+    global _response_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _response_cache is None:
+            disk = None
+            if RESPONSE_CACHE_PERSIST:
+                try:
+                    disk = SQLiteCache(os.path.join(CACHE_DIR, "responses.sqlite3"), RESPONSE_CACHE_MAX_BYTES)
+                    atexit.register(disk.close)
+                except sqlite3.Error as e:
+                    logger.error(f"Persistent response cache unavailable, using memory only: {str(e)}")
+            _response_cache = ResponseCache(disk=disk)
+        return _response_cache
@@ -0,0 +1,151 @@
+import difflib
+import hashlib
+import logging
+import os
+from summarizer import split_stable_chunks
+
+logger = logging.getLogger(__name__)
+
+# Content diff configuration (overridable through environment variables)
+DIFF_BLOCK_SIZE = int(os.getenv("DIFF_BLOCK_SIZE", "800"))
+
+# Longest excerpt of one changed block shown to the user
+DIFF_EXCERPT_CHARS = 300
+
+def split_content(content):
+    """Splits extracted content into its title and body."""
+    title, _, body = content.partition("\n\nContent: ")
+    if not body:
+        return "", content
+    return title.replace("Title: ", "", 1).strip(), body
+
+def content_blocks(content, block_size=DIFF_BLOCK_SIZE):
+    """Splits the body of extracted content into (hash, text) blocks.
+
+    Block boundaries are content-defined (see split_stable_chunks), so an edit
+    only changes the hashes of the blocks around it.
+    """
+    _, body = split_content(content)
+    return [(hashlib.sha256(block.encode('utf-8')).hexdigest(), block)
+            for block in split_stable_chunks(body, block_size)]
+
+def diff_content(old, new, block_size=DIFF_BLOCK_SIZE):
+    """Compares two extractions of a page block by block; returns a change report.
+
+    The report lists the blocks added, removed and changed (as (old, new)
+    pairs), counts the unchanged ones and gives the share of the new content
+    that differs, which is what a reload has to send to the model again.
+    """
+    old_title, _ = split_content(old)
+    new_title, new_body = split_content(new)
+    old_blocks = content_blocks(old, block_size)
+    new_blocks = content_blocks(new, block_size)
+
+    report = {'title_changed': old_title != new_title, 'title': new_title, 'blocks': len(new_blocks),
+              'unchanged': 0, 'added': [], 'removed': [], 'changed': [], 'changed_chars': 0, 'changed_share': 0.0}
+    matcher = difflib.SequenceMatcher(None, [h for h, _ in old_blocks], [h for h, _ in new_blocks], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        removed = [text for _, text in old_blocks[i1:i2]]
+        added = [text for _, text in new_blocks[j1:j2]]
+        if tag == 'equal':
+            report['unchanged'] += i2 - i1
+        elif tag == 'insert':
+            report['added'].extend(added)
+        elif tag == 'delete':
+            report['removed'].extend(removed)
+        else:
+            report['changed'].append((' '.join(removed), ' '.join(added)))
+        if tag in ('insert', 'replace'):
+            report['changed_chars'] += sum(len(text) + 1 for text in added)
+
+    report['changed_share'] = report['changed_chars'] / len(new_body) if new_body else 0.0
+    report['identical'] = old == new
+    return report
+
+def has_changes(report):
+    """Checks whether a diff report found any difference."""
+    return bool(report['title_changed'] or report['added'] or report['removed'] or report['changed'])
+
+def _excerpt(old, new):
+    """Trims an (old, new) pair of changed blocks to the part that differs, with a little context."""
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    start = max(0, start - 40)
+    old_part = old[start:len(old) - max(0, end - 40)]
+    new_part = new[start:len(new) - max(0, end - 40)]
+    prefix = "…" if start else ""
+    return prefix + old_part[:DIFF_EXCERPT_CHARS], prefix + new_part[:DIFF_EXCERPT_CHARS]
+
+def format_diff(report, max_blocks=20):
+    """Renders the changes of a diff report as diff-style lines for display."""
+    lines = []
+    if report['title_changed']:
+        lines.append(f"~ Title: {report['title']}")
+    for old, new in report['changed'][:max_blocks]:
+        old_part, new_part = _excerpt(old, new)
+        lines.extend([f"- {old_part}", f"+ {new_part}", ""])
+    for text in report['added'][:max_blocks]:
+        lines.append(f"+ {text[:DIFF_EXCERPT_CHARS]}")
+    for text in report['removed'][:max_blocks]:
+        lines.append(f"- {text[:DIFF_EXCERPT_CHARS]}")
+    hidden = sum(max(0, len(report[key]) - max_blocks) for key in ('changed', 'added', 'removed'))
+    if hidden:
+        lines.append(f"… {hidden} more changed block(s)")
+    return "\n".join(lines).strip()
+
+def run_benchmark(paragraphs=400, edits=3):
+    """Reloads a generated page with a few edited paragraphs and compares full with incremental work.
+
+    A mock model counts the tokens a re-summary sends when every section is
+    summarized again against reusing the cached summaries of unchanged
+    sections, and the chunk index reports how many chunks it could keep.
+    """
+    import random
+    import time
+    from retrieval import ChunkIndex
+    from summarizer import MapReduceSummarizer
+    from token_counter import estimate_tokens
+
+    rng = random.Random(7)
+    words = "product price support plan team release feature customer account service data report".split()
+    texts = [' '.join(rng.choice(words) for _ in range(60)).capitalize() + f" paragraph {i}." for i in range(paragraphs)]
+    old = "Title: Benchmark Page\n\nContent: " + ' '.join(texts)
+    for i in rng.sample(range(paragraphs), edits):
+        texts[i] = texts[i].replace("paragraph", "updated paragraph", 1)
+    new = "Title: Benchmark Page\n\nContent: " + ' '.join(texts)
+
+    start = time.perf_counter()
+    report = diff_content(old, new)
+    diff_ms = (time.perf_counter() - start) * 1000
+    print(f"{report['blocks']} blocks, {report['unchanged']} unchanged, {len(report['changed'])} changed, "
+          f"{len(report['added'])} added, {len(report['removed'])} removed "
+          f"({report['changed_share']:.1%} of the content) in {diff_ms:.1f} ms")
+
+    old_index = ChunkIndex(old)
+    new_index = ChunkIndex(new, previous=old_index)
+    print(f"chunk index: {new_index.reused} of {len(new_index.chunks)} chunks reused")
+
+    sent = {'tokens': 0}
+
+    def mock_llm(prompt):
+        sent['tokens'] += estimate_tokens(prompt)
+        return "Mock section summary. " * 20
+
+    chunk_cache = {}
+    MapReduceSummarizer(mock_llm, chunk_size=4000, chunk_cache=chunk_cache).summarize(old)
+    for label, cache in (("full re-summary", {}), ("incremental re-summary", chunk_cache)):
+        sent['tokens'] = 0
+        summarizer = MapReduceSummarizer(mock_llm, chunk_size=4000, chunk_cache=cache)
+        summarizer.summarize(new)
+        total = summarizer.report['total']
+        print(f"{label:<24} {total['calls']:3d} calls, {total['cached']:3d} cached sections, "
+              f"~{sent['tokens']:,} input tokens")
+    return report
+
+if __name__ == "__main__":
+    run_benchmark()
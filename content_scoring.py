@@ -0,0 +1,412 @@
+import logging
+import os
+import re
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Scoring configuration (overridable through environment variables)
+CONTENT_MIN_CHARS = int(os.getenv("CONTENT_MIN_CHARS", "250"))
+CONTENT_MAX_LINK_DENSITY = float(os.getenv("CONTENT_MAX_LINK_DENSITY", "0.5"))
+
+# Class and id fragments that mark content or page chrome (after Readability)
+POSITIVE_CLASSES = re.compile(
+    r"article|body|content|entry|hentry|h-entry|main|page|post|text|blog|story|prose|description",
+    re.IGNORECASE
+)
+NEGATIVE_CLASSES = re.compile(
+    r"hidden|banner|combx|comment|com-|contact|foot|masthead|media|meta|outbrain|promo|related|"
+    r"scroll|share|shoutbox|sidebar|skyscraper|sponsor|shopping|tags|tool|widget|cookie|consent|"
+    r"modal|popup|newsletter|subscribe|social|breadcrumb|menu|navbar|pagination|advert|\bads?\b",
+    re.IGNORECASE
+)
+
+# Starting score of a candidate container by tag
+TAG_BASE_SCORES = {
+    'main': 10, 'article': 10, 'div': 5, 'section': 3, 'pre': 3, 'td': 3, 'blockquote': 3,
+    'address': -3, 'ol': -3, 'ul': -3, 'dl': -3, 'dd': -3, 'dt': -3, 'li': -3, 'form': -3,
+    'h1': -5, 'h2': -5, 'h3': -5, 'h4': -5, 'h5': -5, 'h6': -5, 'th': -5
+}
+
+# Containers that are never discarded on their own, whatever their classes say
+NEVER_EXCLUDED_TAGS = frozenset(['html', 'body', 'main', 'article'])
+
+PARAGRAPH_TAGS = frozenset(['p', 'pre', 'blockquote', 'td', 'dd', 'li', 'div', 'section'])
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+# Characters per element below which a container is treated as markup-heavy
+TEXT_DENSITY_NORM = 20
+
+_WORD_RE = re.compile(r"\w+")
+
+def class_weight(attrs):
+    """Scores an element's class and id attributes: +25 per content hint, -25 per chrome hint."""
+    weight = 0
+    for name in ('class', 'id'):
+        value = attrs.get(name)
+        if value:
+            if NEGATIVE_CLASSES.search(value):
+                weight -= 25
+            if POSITIVE_CLASSES.search(value):
+                weight += 25
+    return weight
+
+def score_document(document, max_link_density=CONTENT_MAX_LINK_DENSITY):
+    """Selects the main content of a parsed document by scoring its text blocks.
+
+    Every statistic is computed in linear passes over the block tree the parser
+    built: subtree text, link text and element counts, and per tag-path totals
+    that expose templated link lists such as menus. Paragraph-like blocks score
+    their ancestors as in Readability. The best container and its qualifying
+    siblings form the main content. Returns a dict with 'main' (text runs in
+    document order), 'others' (remaining blocks, best first) and 'candidate'
+    (the winning container's tag, or None).
+    """
+    blocks = document.blocks
+    count = len(blocks)
+    if not count:
+        return {'main': [], 'others': [], 'candidate': None}
+
+    # Subtree totals; children always come after their parent in the block list
+    chars = [block['chars'] for block in blocks]
+    links = [block['link_chars'] for block in blocks]
+    tags = [block['tags'] for block in blocks]
+    for index in range(count - 1, 0, -1):
+        parent = blocks[index]['parent']
+        if parent is not None:
+            chars[parent] += chars[index]
+            links[parent] += links[index]
+            tags[parent] += tags[index]
+
+    # Tag-path statistics: blocks at the same path are usually produced by one template
+    path_counts, path_chars, path_links = Counter(), Counter(), Counter()
+    for block in blocks:
+        path_counts[block['path']] += 1
+        path_chars[block['path']] += block['chars']
+        path_links[block['path']] += block['link_chars']
+
+    excluded = [False] * count
+    for index, block in enumerate(blocks):
+        parent = block['parent']
+        if parent is not None and excluded[parent]:
+            excluded[index] = True
+        elif block['tag'] in NEVER_EXCLUDED_TAGS:
+            continue
+        elif block['boilerplate'] or block['weight'] < 0:
+            excluded[index] = True
+        elif block['chars'] and block['link_chars'] / block['chars'] > max_link_density:
+            excluded[index] = True
+        else:
+            path = block['path']
+            if (path_counts[path] >= 3 and path_chars[path]
+                    and path_links[path] / path_chars[path] > max_link_density):
+                excluded[index] = True
+
+    # Paragraphs score their ancestors, with less credit the further up they are
+    scores = {}
+    for index, block in enumerate(blocks):
+        if excluded[index] or block['chars'] < 25 or block['tag'] in HEADING_TAGS:
+            continue
+        content_score = (1 + block['commas'] + min(block['chars'] // 100, 3)) * (1 - block['link_chars'] / block['chars'])
+        ancestor, level = block['parent'], 0
+        while ancestor is not None and level < 5:
+            if ancestor not in scores:
+                scores[ancestor] = TAG_BASE_SCORES.get(blocks[ancestor]['tag'], 0) + blocks[ancestor]['weight']
+            scores[ancestor] += content_score / (1 if level == 0 else 2 if level == 1 else level * 3)
+            ancestor, level = blocks[ancestor]['parent'], level + 1
+
+    # Link-heavy and markup-heavy containers lose most of their score
+    for index in scores:
+        if chars[index]:
+            density = chars[index] / max(1, tags[index])
+            scores[index] *= (1 - links[index] / chars[index]) * min(1.0, density / TEXT_DENSITY_NORM)
+        else:
+            scores[index] = 0
+
+    candidate = max((i for i in scores if not excluded[i]), key=scores.get, default=None)
+    selected = []
+    if candidate is not None:
+        threshold = max(10, scores[candidate] * 0.2)
+        parent = blocks[candidate]['parent']
+        siblings = [candidate] if parent is None else [
+            i for i in range(parent + 1, blocks[parent]['block_end'] or count) if blocks[i]['parent'] == parent
+        ]
+        for index in siblings:
+            if index == candidate:
+                selected.append(index)
+            elif excluded[index] or not chars[index]:
+                continue
+            elif scores.get(index, 0) >= threshold:
+                selected.append(index)
+            elif (blocks[index]['tag'] in PARAGRAPH_TAGS and chars[index] > 80
+                    and links[index] / chars[index] < 0.25):
+                selected.append(index)
+
+    # Main content as runs of text per block, in document order
+    main = []
+    covered = set()
+    for index in selected:
+        block = blocks[index]
+        covered.update(range(index, block['block_end'] or count))
+        run, run_owner = [], None
+        for position in range(block['start'], block['end'] if block['end'] is not None else len(document.pieces)):
+            owner = document.piece_blocks[position]
+            if owner is not None and excluded[owner]:
+                continue
+            if owner != run_owner and run:
+                main.append(' '.join(run))
+                run = []
+            run_owner = owner
+            run.append(document.pieces[position])
+        if run:
+            main.append(' '.join(run))
+
+    ranked = sorted(
+        (
+            (block['chars'] * (1 - block['link_chars'] / block['chars']) + scores.get(index, 0), index)
+            for index, block in enumerate(blocks)
+            if index not in covered and not excluded[index] and block['chars'] >= 25
+        ),
+        reverse=True
+    )
+    others = [' '.join(blocks[index]['parts']) for _, index in ranked]
+
+    return {
+        'main': main,
+        'others': others,
+        'candidate': blocks[candidate]['tag'] if candidate is not None else None
+    }
+
+def _token_counts(text):
+    """Returns lowercase word counts for precision/recall scoring."""
+    return Counter(_WORD_RE.findall(text.lower()))
+
+def _precision_recall(extracted, gold):
+    """Returns bag-of-words (precision, recall, f1) of extracted text against gold text."""
+    extracted_tokens = _token_counts(extracted)
+    gold_tokens = _token_counts(gold)
+    overlap = sum((extracted_tokens & gold_tokens).values())
+    precision = overlap / sum(extracted_tokens.values()) if extracted_tokens else 0.0
+    recall = overlap / sum(gold_tokens.values()) if gold_tokens else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+# Vocabulary of the generated evaluation pages; main text and page chrome draw on the same words
+_CORPUS_WORDS = (
+    "the a of to and in for with on that this is are was from by as it at our your new can will more "
+    "price plan support team release feature customer account service data report update guide install "
+    "configure server network model battery garden recipe travel city market energy policy research "
+    "student design camera performance security storage payment delivery order review product"
+).split()
+
+# Page templates of the generated corpus: how the main text is wrapped and which chrome surrounds it
+CORPUS_TEMPLATES = ('news', 'docs', 'product', 'blog', 'recipe', 'forum')
+
+def _sentence(rng, words=(8, 22)):
+    """Returns one generated sentence."""
+    text = ' '.join(rng.choice(_CORPUS_WORDS) for _ in range(rng.randint(*words)))
+    return text[0].upper() + text[1:] + '.'
+
+def _paragraph(rng, sentences=(2, 5)):
+    """Returns one generated paragraph."""
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(*sentences)))
+
+def _link_list(rng, count, css_class=None):
+    """Returns an HTML list of generated links, as found in menus, sidebars and footers."""
+    items = ''.join(f'<li><a href="/{i}">{_sentence(rng, (2, 6))[:-1]}</a></li>' for i in range(count))
+    return f'<ul class="{css_class}">{items}</ul>' if css_class else f'<ul>{items}</ul>'
+
+def _chrome(rng):
+    """Returns the (before, after) boilerplate around the main content: menus, banners, sidebar, teasers, footer."""
+    before = (
+        f'<header class="site-header"><div class="logo"><a href="/">{_sentence(rng, (1, 2))[:-1]}</a></div>'
+        f'<nav class="navbar">{_link_list(rng, 8)}</nav></header>'
+        f'<div class="cookie-consent"><p>{_sentence(rng)} {_sentence(rng)}</p><button>Accept all</button></div>'
+        f'<div class="breadcrumb"><a href="/">Home</a> › <a href="/section">{_sentence(rng, (1, 3))[:-1]}</a></div>'
+    )
+    teasers = ''.join(f'<div class="teaser"><a href="/t{i}">{_sentence(rng, (4, 8))[:-1]}</a>'
+                      f'<p>{_sentence(rng)}</p></div>' for i in range(4))
+    after = (
+        f'<aside class="sidebar"><h3>Popular</h3>{_link_list(rng, 6)}'
+        f'<div class="newsletter"><p>{_sentence(rng)}</p><form><input type="email"><button>Subscribe</button>'
+        f'</form></div></aside>'
+        f'<section class="related"><h3>Related</h3>{teasers}</section>'
+        f'<footer class="site-footer"><p>© 2024 {_sentence(rng, (1, 3))[:-1]}. All rights reserved.</p>'
+        f'{_link_list(rng, 10, "footer-links")}</footer>'
+    )
+    return before, after
+
+def _main_content(template, rng):
+    """Returns (html, gold_text) of the main content of one page."""
+    title = _sentence(rng, (4, 9))[:-1]
+    gold = [title]
+    parts = [f'<h1>{title}</h1>']
+
+    def add(tag, text, attrs=''):
+        gold.append(text)
+        parts.append(f'<{tag}{attrs}>{text}</{tag}>')
+
+    if template == 'news':
+        for section in range(rng.randint(2, 4)):
+            if section:
+                add('h2', _sentence(rng, (3, 7))[:-1])
+            for _ in range(rng.randint(2, 4)):
+                add('p', _paragraph(rng))
+        add('blockquote', _sentence(rng))
+        return f'<article class="story">{"".join(parts)}</article>', gold
+    if template == 'docs':
+        for _ in range(rng.randint(3, 5)):
+            add('h2', _sentence(rng, (2, 5))[:-1])
+            add('p', _paragraph(rng, (1, 3)))
+            steps = [_sentence(rng, (5, 12)) for _ in range(rng.randint(3, 5))]
+            gold.extend(steps)
+            parts.append('<ol>' + ''.join(f'<li>{step}</li>' for step in steps) + '</ol>')
+            add('pre', ' '.join(rng.choice(_CORPUS_WORDS) for _ in range(12)))
+        return f'<main><div class="content">{"".join(parts)}</div></main>', gold
+    if template == 'product':
+        add('p', _paragraph(rng, (3, 5)), ' class="description"')
+        features = [_sentence(rng, (6, 14)) for _ in range(rng.randint(4, 7))]
+        gold.extend(features)
+        parts.append('<ul class="features">' + ''.join(f'<li>{feature}</li>' for feature in features) + '</ul>')
+        add('p', _paragraph(rng, (2, 4)))
+        reviews = ''.join(f'<div class="review"><p>{_sentence(rng)}</p></div>' for _ in range(5))
+        return (f'<div id="product" class="product-page">{"".join(parts)}</div>'
+                f'<div class="reviews widget"><h3>Reviews</h3>{reviews}</div>'), gold
+    if template == 'blog':
+        for _ in range(rng.randint(5, 9)):
+            add('p', _paragraph(rng))
+        comments = ''.join(f'<div class="comment"><p>{_paragraph(rng, (1, 2))}</p></div>' for _ in range(4))
+        # No semantic tags at all, only nested divs
+        return (f'<div class="wrapper"><div class="post-body">{"".join(parts)}</div></div>'
+                f'<div id="comments">{comments}</div>'), gold
+    if template == 'recipe':
+        add('p', _paragraph(rng, (2, 3)))
+        add('h2', "Ingredients")
+        ingredients = [_sentence(rng, (3, 6)) for _ in range(rng.randint(6, 10))]
+        gold.extend(ingredients)
+        parts.append('<ul>' + ''.join(f'<li>{item}</li>' for item in ingredients) + '</ul>')
+        add('h2', "Method")
+        for _ in range(rng.randint(4, 6)):
+            add('p', _paragraph(rng, (1, 3)))
+        return f'<article class="recipe h-entry">{"".join(parts)}</article>', gold
+    # forum: the opening post is the content, replies are page chrome
+    for _ in range(rng.randint(3, 5)):
+        add('p', _paragraph(rng))
+    replies = ''.join(f'<div class="reply"><p>{_sentence(rng)}</p><div class="meta">reply {i}</div></div>'
+                      for i in range(6))
+    return (f'<div class="thread"><div class="post first">{"".join(parts)}</div>'
+            f'<div class="replies">{replies}</div></div>'), gold
+
+# Layout tags the scorer knows, replaced by plain divs in neutral pages
+_SEMANTIC_TAG_RE = re.compile(r"<(/?)(?:header|nav|main|article|section|aside|footer)\b")
+_CLASS_ATTR_RE = re.compile(r'\b(class|id)="[^"]*"')
+
+def _neutralize(html, rng):
+    """Replaces layout tags with divs and class/id names with random tokens, as CSS-module builds emit."""
+    html = _SEMANTIC_TAG_RE.sub(r"<\1div", html)
+    return _CLASS_ATTR_RE.sub(lambda m: f'{m.group(1)}="css-{rng.getrandbits(32):08x}"', html)
+
+def build_corpus(corpus_dir, pages_per_template=3, seed=13, neutral=False):
+    """Writes a generated evaluation corpus (page.html next to page.txt) to corpus_dir; returns the page count.
+
+    The pages follow the layouts of news articles, documentation, product
+    pages, div-only blog posts, recipes and forum threads. Each sits among
+    menus, a cookie banner, a sidebar, teasers with their own prose and a
+    footer. A fixed seed makes every run score the same pages.
+
+    The markup is labelled with the same class names POSITIVE_CLASSES and
+    NEGATIVE_CLASSES look for, so scores on it only check that the scorer
+    is consistent with its own vocabulary. With neutral set, every layout tag
+    is a div and every class and id is a random token, which leaves text and
+    link density as the only evidence.
+    """
+    import random
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(seed)
+    count = 0
+    for template in CORPUS_TEMPLATES:
+        for number in range(pages_per_template):
+            before, after = _chrome(rng)
+            main, gold = _main_content(template, rng)
+            html = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{gold[0]}</title></head>'
+                    f'<body>{before}{main}{after}</body></html>')
+            if neutral:
+                html = _neutralize(html, rng)
+            stem = os.path.join(corpus_dir, f"{template}-{number + 1}")
+            with open(stem + '.html', 'w', encoding='utf-8') as f:
+                f.write(html)
+            with open(stem + '.txt', 'w', encoding='utf-8') as f:
+                f.write('\n'.join(gold))
+            count += 1
+    return count
+
+def run_evaluation(corpus_dir):
+    """Scores extraction against a corpus of saved pages and prints precision, recall and time per page.
+
+    The corpus is a directory of page.html files, each next to a page.txt file
+    holding the page's main text. "All text" is the baseline of keeping every
+    visible piece of text on the page.
+    """
+    import time
+    from html_extractor import parse_document, build_content
+
+    rows = []
+    for name in sorted(os.listdir(corpus_dir)):
+        stem, extension = os.path.splitext(name)
+        gold_path = os.path.join(corpus_dir, stem + '.txt')
+        if extension.lower() not in ('.html', '.htm') or not os.path.exists(gold_path):
+            continue
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            html = f.read()
+        with open(gold_path, encoding='utf-8') as f:
+            gold = f.read()
+
+        start = time.perf_counter()
+        document = parse_document(html)
+        content, _ = build_content(document, max_chars=10 ** 9)
+        elapsed = time.perf_counter() - start
+
+        _, _, extracted = (content or '').partition("\n\nContent: ")
+        scored = _precision_recall(extracted, gold)
+        baseline = _precision_recall(' '.join(document.pieces), gold)
+        rows.append((stem, scored, baseline, elapsed))
+        print(f"{stem[:30]:30s}  P {scored[0]:.3f}  R {scored[1]:.3f}  F1 {scored[2]:.3f}  "
+              f"(all text F1 {baseline[2]:.3f})  {elapsed * 1000:7.1f} ms")
+
+    if not rows:
+        print(f"No page.html/page.txt pairs found in {corpus_dir}")
+        return rows
+
+    def mean(values):
+        values = list(values)
+        return sum(values) / len(values)
+
+    print(f"\n{len(rows)} pages")
+    for label, column in (("Scored extraction", 1), ("All text", 2)):
+        print(f"{label:18s}  P {mean(r[column][0] for r in rows):.3f}  R {mean(r[column][1] for r in rows):.3f}  "
+              f"F1 {mean(r[column][2] for r in rows):.3f}")
+    times = sorted(r[3] for r in rows)
+    print(f"Time per page: mean {mean(times) * 1000:.1f} ms, median {times[len(times) // 2] * 1000:.1f} ms, "
+          f"max {times[-1] * 1000:.1f} ms")
+    return rows
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    if len(sys.argv) == 3 and sys.argv[1] in ("--build", "--build-neutral"):
+        count = build_corpus(sys.argv[2], neutral=sys.argv[1] == "--build-neutral")
+        print(f"Wrote {count} pages to {sys.argv[2]}")
+    elif len(sys.argv) == 2:
+        run_evaluation(sys.argv[1])
+    elif len(sys.argv) == 1:
+        # Without a corpus of saved pages, score the generated ones
+        for neutral, label in ((False, "Labelled markup (self-consistency check)"),
+                               (True, "Neutral markup (random class names, div-only layout)")):
+            print(f"== {label}")
+            with tempfile.TemporaryDirectory() as corpus_dir:
+                build_corpus(corpus_dir, neutral=neutral)
+                run_evaluation(corpus_dir)
+            print()
+    else:
+        print("Usage: python content_scoring.py [CORPUS_DIR | --build CORPUS_DIR | --build-neutral CORPUS_DIR]")
+        sys.exit(1)
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from gemini_client import GeminiClient, GeminiError, TokenBucketLimiter
+from token_counter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Context cache configuration (overridable through environment variables)
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "1800"))
+# The API rejects cached contents below a model-specific minimum size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+GEMINI_CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL", "gemini-1.5-flash-001")
+
+# Entries are refreshed or recreated this long before they expire
+EXPIRY_MARGIN = 60
+
+SYSTEM_INSTRUCTION = ("You answer questions about the website content provided. "
+                      "Base your answers solely on that content.")
+
+class ContextCacheError(GeminiError):
+    """Raised when the cachedContents API rejects or fails a request."""
+
+class ContextCacheClient:
+    """Creates, refreshes and deletes entries of the Gemini cachedContents API.
+
+    Requests go through the shared GeminiClient, so they use its connection
+    pool, retries and rate limiter.
+    """
+
+    def __init__(self, gemini_client, model=GEMINI_CACHE_MODEL, ttl=CONTEXT_CACHE_TTL):
+        self.gemini_client = gemini_client
+        self.model = model
+        self.ttl = ttl
+
+    def create(self, content, system_instruction=SYSTEM_INSTRUCTION):
+        """Uploads content as a cached context; returns (name, token_count)."""
+        body = {
+            "model": f"models/{self.model}",
+            "systemInstruction": {"parts": [{"text": system_instruction}]},
+            "contents": [{"role": "user", "parts": [{"text": content}]}],
+            "ttl": f"{self.ttl}s"
+        }
+        result = self._request("POST", "cachedContents", json=body)
+        return result["name"], result.get("usageMetadata", {}).get("totalTokenCount", 0)
+
+    def refresh(self, name):
+        """Extends the entry's time to live."""
+        self._request("PATCH", name, params={"updateMask": "ttl"}, json={"ttl": f"{self.ttl}s"})
+
+    def delete(self, name):
+        """Deletes the entry; an entry that already expired counts as deleted."""
+        try:
+            self._request("DELETE", name)
+        except ContextCacheError as e:
+            if e.status_code != 404:
+                raise
+
+    def _request(self, method, path, params=None, json=None):
+        """Sends one API request and returns the decoded JSON body."""
+        try:
+            return self.gemini_client.request_json(method, path, params=params, json=json)
+        except GeminiError as e:
+            raise ContextCacheError(f"Context cache request failed - {str(e)}", e.status_code)
+
+class PageContext:
+    """One chat session's page content held in the Gemini context cache.
+
+    The content is uploaded on the first question and referenced by every
+    later one until the entry expires, the page is reloaded with different
+    content or the chat is cleared. Content below the API minimum and failed
+    uploads fall back to regular prompts. Savings are the cached tokens the
+    API reports for each call instead of billing them as fresh input.
+    """
+
+    def __init__(self, content, client, min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.content = content
+        self.content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        self.client = client
+        self.min_tokens = min_tokens
+        self.name = None
+        self.expires_at = 0.0
+        self.unavailable = None
+        self.savings = {'calls': 0, 'cached_tokens': 0, 'prompt_tokens': 0, 'uploaded_tokens': 0}
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        """Returns the cached content name to reference, creating the entry if needed, or None."""
+        with self._lock:
+            if self.unavailable:
+                return None
+            if self.name and time.time() < self.expires_at - EXPIRY_MARGIN:
+                return self.name
+
+            if self.name is None and estimate_tokens(self.content) < self.min_tokens:
+                self.unavailable = "content below the context cache minimum"
+                return None
+
+            try:
+                if self.name:
+                    self.client.refresh(self.name)
+                else:
+                    self.name, tokens = self.client.create(self.content)
+                    self.savings['uploaded_tokens'] = tokens
+                self.expires_at = time.time() + self.client.ttl
+            except ContextCacheError as e:
+                # An entry that vanished is recreated; anything else disables caching for this load
+                if self.name and e.status_code in (403, 404):
+                    self.name = None
+                    return None
+                logger.warning(f"Context cache unavailable, sending content with each question: {str(e)}")
+                self.unavailable = str(e)
+                self.name = None
+                return None
+            return self.name
+
+    def invalidate(self):
+        """Forgets an entry the API no longer accepts; the next ensure() uploads again."""
+        with self._lock:
+            self.name = None
+            self.expires_at = 0.0
+
+    def record(self, usage):
+        """Adds the token counts of one call that referenced the cached content."""
+        if not usage:
+            return
+        with self._lock:
+            self.savings['calls'] += 1
+            self.savings['cached_tokens'] += usage.get('cachedContentTokenCount', 0)
+            self.savings['prompt_tokens'] += usage.get('promptTokenCount', 0)
+
+    def matches(self, content):
+        """Checks whether the cached entry holds exactly this content."""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest() == self.content_hash
+
+    def release(self):
+        """Deletes the cached entry, e.g. when the chat is cleared or another page is loaded."""
+        with self._lock:
+            name, self.name = self.name, None
+            self.expires_at = 0.0
+        if name:
+            try:
+                self.client.delete(name)
+            except ContextCacheError as e:
+                logger.info(f"Cached content {name} could not be deleted, it expires by itself: {str(e)}")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_context_cache_client(gemini_client):
+    """Returns the process-wide context cache client, or None when caching is disabled."""
+    global _client
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = ContextCacheClient(gemini_client)
+        return _client
+
+def run_mock_demo(questions=10, content_tokens=40000):
+    """Runs a chat session against a local mock of the API and prints the input tokens saved."""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    entries = {}
+
+    class MockGemini(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        def do_POST(self):
+            body = self._body()
+            if self.path.startswith("/cachedContents"):
+                tokens = estimate_tokens(body["contents"][0]["parts"][0]["text"])
+                name = f"cachedContents/{len(entries) + 1}"
+                entries[name] = tokens
+                self._reply(200, {"name": name, "usageMetadata": {"totalTokenCount": tokens}})
+                return
+            cached = entries.get(body.get("cachedContent"), 0)
+            if body.get("cachedContent") and not cached:
+                self._reply(404, {"error": {"message": "cached content not found"}})
+                return
+            prompt_tokens = cached + estimate_tokens(body["contents"][0]["parts"][0]["text"])
+            self._reply(200, {
+                "candidates": [{"content": {"parts": [{"text": "Mock answer."}]}}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "cachedContentTokenCount": cached,
+                                  "candidatesTokenCount": 3, "totalTokenCount": prompt_tokens + 3}
+            })
+
+        def do_PATCH(self):
+            self._body()
+            self._reply(200 if self.path.split("?")[0].lstrip("/") in entries else 404, {})
+
+        def do_DELETE(self):
+            self._reply(200 if entries.pop(self.path.lstrip("/"), None) is not None else 404, {})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    content = "Mock page sentence about products and prices. " * (content_tokens // 8)
+    gemini_client = GeminiClient("mock-key", api_base=api_base, limiter=TokenBucketLimiter(0, 0))
+    context = PageContext(content, ContextCacheClient(gemini_client))
+    plain_tokens = 0
+    for i in range(questions):
+        question = f"User Question: what does the page say about topic {i}?"
+        plain_tokens += estimate_tokens(content) + estimate_tokens(question)
+        name = context.ensure()
+        _, usage = gemini_client.generate(question, {"maxOutputTokens": 64}, cached_content=name,
+                                          request_type="mock", model=GEMINI_CACHE_MODEL)
+        context.record(usage)
+    context.release()
+    server.shutdown()
+
+    savings = context.savings
+    print(f"{questions} questions over {estimate_tokens(content):,} tokens of page content")
+    print(f"  without context cache: {plain_tokens:,} input tokens sent")
+    print(f"  with context cache:    {savings['prompt_tokens'] - savings['cached_tokens']:,} fresh input tokens, "
+          f"{savings['cached_tokens']:,} served from the cache after one {savings['uploaded_tokens']:,}-token upload")
+    return savings
+
+if __name__ == "__main__":
+    run_mock_demo()
@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from prompt_builder import fit_text, format_turn, input_budget, PROMPT_MAX_TURNS
+
+logger = logging.getLogger(__name__)
+
+# Memory configuration (overridable through environment variables)
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "400"))
+
+def memory_prompt(summary, turns, summary_tokens=MEMORY_SUMMARY_TOKENS):
+    """Builds the prompt that folds older conversation turns into the running summary."""
+    # The turns get whatever the budget leaves after the instructions and the current summary
+    turns_text = fit_text("\n\n".join(format_turn(turn) for turn in turns),
+                          input_budget('memory') - summary_tokens - 150)
+    return f"""
+            You are maintaining a running summary of a conversation between a user and an
+            assistant about a website. Update the summary with the new turns below. Keep the
+            user's goals, the questions asked, and the facts, names and figures in the answers
+            that later questions may refer to. Answer with the updated summary only, in at most
+            {summary_tokens * 3 // 4} words.
+
+            Current summary:
+            {summary or "(none yet)"}
+
+            New turns:
+            {turns_text}
+            """
+
+class ConversationMemory:
+    """Bounded memory of one chat: recent turns verbatim, older turns folded into a summary.
+
+    Folding runs on a background executor after each answer, so the next
+    question never waits for it. Until a fold has finished, the turns it covers
+    are offered verbatim and the prompt budget decides how many are kept.
+    """
+
+    def __init__(self, recent_turns=PROMPT_MAX_TURNS, summary_tokens=MEMORY_SUMMARY_TOKENS):
+        self.recent_turns = max(1, recent_turns)
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.summarized = 0
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def context(self, conversation):
+        """Returns (summary, turns): the running summary and the turns to include verbatim."""
+        self._collect()
+        # Besides the recent window, this includes older turns a pending or failed fold has not covered yet
+        return self.summary, list(conversation[self.summarized:])
+
+    def update(self, conversation, llm):
+        """Starts folding turns that left the recent window into the summary.
+
+        llm is a blocking prompt -> text function; if it raises, the summary is
+        left unchanged and the turns are retried after the next answer.
+        """
+        self._collect()
+        split = max(0, len(conversation) - self.recent_turns)
+        with self._lock:
+            if self._pending is not None or split <= self.summarized:
+                return
+            prompt = memory_prompt(self.summary, conversation[self.summarized:split], self.summary_tokens)
+            self._pending = (get_memory_executor().submit(llm, prompt), split)
+
+    def reset(self):
+        """Forgets the summary, e.g. when the chat is cleared."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[0].cancel()
+            self._pending = None
+            self.summary = ""
+            self.summarized = 0
+
+    def stats(self):
+        """Returns the summary size and how many turns it covers."""
+        with self._lock:
+            return {
+                'summarized_turns': self.summarized,
+                'summary_chars': len(self.summary),
+                'pending': self._pending is not None
+            }
+
+    def _collect(self):
+        """Applies a finished background fold without waiting for an unfinished one."""
+        with self._lock:
+            if self._pending is None or not self._pending[0].done():
+                return
+            future, upto = self._pending
+            self._pending = None
+            if future.cancelled():
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Conversation summary failed: {str(e)}")
+                return
+            if result and result.strip():
+                self.summary = fit_text(result.strip(), self.summary_tokens)
+                self.summarized = upto
+            else:
+                logger.warning("Conversation summary came back empty")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_memory_executor():
+    """Returns the process-wide executor for background conversation summaries."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="conversation-memory")
+        return _executor
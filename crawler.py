@@ -0,0 +1,352 @@
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+import requests
+from bs4 import BeautifulSoup
+from text_encoding import decode_html
+from fetcher import FETCH_MAX_BYTES, FETCH_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Crawl configuration (overridable through environment variables)
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "25"))
+CRAWL_MAX_WORKERS = int(os.getenv("CRAWL_MAX_WORKERS", "4"))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.5"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "15"))
+CRAWL_USER_AGENT = "Mozilla/5.0 (compatible; AIWebAgent/1.0; +https://github.com/Niketan77/AI-Assistant-For-Websites)"
+# Product token matched against robots.txt User-agent lines
+CRAWL_ROBOTS_AGENT = "AIWebAgent"
+
+# Links to files that never contain page text
+SKIPPED_EXTENSIONS = (
+    '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.css', '.js', '.zip', '.gz',
+    '.tar', '.mp3', '.mp4', '.avi', '.mov', '.woff', '.woff2', '.ttf', '.exe', '.dmg'
+)
+
+def canonicalize_url(url):
+    """Normalizes a URL so equivalent spellings of one page dedupe to the same key; returns None if it is malformed."""
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:
+        return None
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+
+    path = parsed.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+
+    # Tracking parameters do not change the page; sorting makes the order irrelevant
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not k.lower().startswith('utm_') and k.lower() not in ('fbclid', 'gclid'))
+    return urlunparse((scheme, host, path, '', urlencode(query), ''))
+
+def site_of(url):
+    """Returns the host a URL belongs to for same-site checks, ignoring scheme, "www." and default ports.
+
+    Sites commonly redirect example.com to www.example.com or http to https,
+    so links on the start page must still count as the same site.
+    """
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:
+        return None
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[len("www."):]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    return host
+
+class HostLimiter:
+    """Per-host politeness: caps concurrent requests and spaces their start times."""
+
+    def __init__(self, concurrency=CRAWL_PER_HOST_CONCURRENCY, delay=CRAWL_HOST_DELAY):
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_allowed = {}
+
+    def set_delay(self, delay):
+        """Raises the minimum spacing between requests, e.g. to honor a robots.txt Crawl-delay."""
+        self.delay = max(self.delay, delay)
+
+    def acquire(self, host):
+        """Blocks until a request to host may start."""
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.Semaphore(self.concurrency))
+        semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = start_at + self.delay
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def release(self, host):
+        """Frees the host slot taken by acquire."""
+        self._semaphores[host].release()
+
+class SiteCrawler:
+    """Crawls same-site pages from a start URL and extracts each one into a combined corpus.
+
+    extract_html is the single-page extractor (html -> (content, error)) so that
+    crawled pages go through the same strategies as a single loaded page.
+    """
+
+    def __init__(self, start_url, extract_html, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+                 max_workers=CRAWL_MAX_WORKERS, limiter=None):
+        self.start_url = start_url
+        self.extract_html = extract_html
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_workers = max(1, max_workers)
+        self.limiter = limiter or HostLimiter()
+        self.origin = (urlparse(start_url).scheme, urlparse(start_url).netloc.lower())
+        self.site = site_of(start_url)
+        self.robots = None
+        self._local = threading.local()
+        self.report = {}
+
+    def crawl(self, on_progress=None, cancel_event=None):
+        """Crawls the site and returns the extracted pages as a list of dicts.
+
+        on_progress is called from the calling thread with the live report after
+        every finished page, so it can safely update the UI. Once cancel_event is
+        set, no new pages are started and the pages finished so far are returned.
+        """
+        start = time.monotonic()
+        self.report = {
+            'pages': 0, 'failures': 0, 'skipped': 0, 'duplicates': 0,
+            'queued': 0, 'in_flight': 0, 'pages_per_second': 0.0, 'seconds': 0.0
+        }
+
+        seen = set()
+        queue = deque()
+
+        def enqueue(url, depth):
+            canonical = canonicalize_url(url)
+            if canonical is None or canonical in seen or not self._is_crawlable(url):
+                return
+            seen.add(canonical)
+            queue.append((url, depth))
+
+        # Rules and Crawl-delay must be known before the start page is admitted and fetched
+        self._load_robots()
+        enqueue(self.start_url, 0)
+        for url in self._sitemap_urls():
+            enqueue(url, 1)
+
+        pages = []
+        canonical_pages = set()
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while queue or in_flight:
+                if cancel_event is not None and cancel_event.is_set():
+                    queue.clear()
+                # Keep the pool busy without starting more pages than the limit allows
+                while queue and len(in_flight) < self.max_workers and len(pages) + len(in_flight) < self.max_pages:
+                    url, depth = queue.popleft()
+                    in_flight[executor.submit(self._fetch_page, url)] = (url, depth)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = in_flight.pop(future)
+                    page = future.result()
+
+                    if page.get('error'):
+                        self.report['failures'] += 1
+                        logger.info(f"Crawl failed for {url}: {page['error']}")
+                    elif page.get('skipped'):
+                        self.report['skipped'] += 1
+                    elif page['canonical'] in canonical_pages:
+                        # Different URL, same page according to <link rel="canonical">
+                        self.report['duplicates'] += 1
+                    else:
+                        canonical_pages.add(page['canonical'])
+                        pages.append(page)
+
+                    if depth < self.max_depth:
+                        for link in page.get('links', []):
+                            enqueue(link, depth + 1)
+
+                elapsed = time.monotonic() - start
+                self.report.update({
+                    'pages': len(pages),
+                    'queued': len(queue),
+                    'in_flight': len(in_flight),
+                    'seconds': elapsed,
+                    'pages_per_second': len(pages) / elapsed if elapsed else 0.0
+                })
+                if on_progress:
+                    on_progress(dict(self.report))
+
+                if len(pages) >= self.max_pages:
+                    queue.clear()
+
+        return pages
+
+    def _session(self):
+        """Returns this worker thread's HTTP session."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': CRAWL_USER_AGENT,
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+            })
+            self._local.session = session
+        return session
+
+    def _get(self, url, stream=False):
+        """Fetches a URL while respecting the per-host politeness limits."""
+        host = urlparse(url).netloc.lower()
+        self.limiter.acquire(host)
+        try:
+            return self._session().get(url, timeout=CRAWL_TIMEOUT, allow_redirects=True, stream=stream)
+        finally:
+            self.limiter.release(host)
+
+    def _load_robots(self):
+        """Loads robots.txt rules for the site; a missing file allows everything."""
+        robots_url = urlunparse((self.origin[0], self.origin[1], '/robots.txt', '', '', ''))
+        robots = RobotFileParser(robots_url)
+        try:
+            response = self._get(robots_url)
+            if response.status_code in (401, 403):
+                robots.disallow_all = True
+            elif response.ok:
+                robots.parse(response.text.splitlines())
+            else:
+                robots.allow_all = True
+        except requests.RequestException as e:
+            logger.info(f"robots.txt unavailable, crawling without it: {str(e)}")
+            robots.allow_all = True
+
+        crawl_delay = robots.crawl_delay(CRAWL_ROBOTS_AGENT)
+        if crawl_delay:
+            self.limiter.set_delay(float(crawl_delay))
+        self.robots = robots
+
+    def _sitemap_urls(self, limit=None):
+        """Returns same-site page URLs listed in the site's sitemaps."""
+        limit = limit or self.max_pages * 4
+        sitemaps = deque((self.robots.site_maps() if self.robots else None) or [])
+        if not sitemaps:
+            sitemaps.append(urlunparse((self.origin[0], self.origin[1], '/sitemap.xml', '', '', '')))
+
+        urls = []
+        visited = set()
+        while sitemaps and len(urls) < limit and len(visited) < 10:
+            sitemap_url = sitemaps.popleft()
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+            try:
+                response = self._get(sitemap_url)
+                if not response.ok:
+                    continue
+                root = ET.fromstring(response.content)
+            except (requests.RequestException, ET.ParseError) as e:
+                logger.info(f"Sitemap {sitemap_url} unavailable: {str(e)}")
+                continue
+
+            for element in root.iter():
+                if not element.tag.endswith('loc') or not element.text:
+                    continue
+                loc = element.text.strip()
+                # A sitemap index points at further sitemaps rather than pages
+                if root.tag.endswith('sitemapindex'):
+                    sitemaps.append(loc)
+                elif len(urls) < limit:
+                    urls.append(loc)
+        return urls
+
+    def _is_crawlable(self, url):
+        """Checks that a URL is on the same site, looks like a page and is allowed by robots.txt."""
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or site_of(url) != self.site:
+            return False
+        if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+            return False
+        return self.robots is None or self.robots.can_fetch(CRAWL_ROBOTS_AGENT, url)
+
+    def _fetch_page(self, url):
+        """Downloads and extracts one page, returning its content and outgoing links."""
+        try:
+            # Headers first: binary files are skipped without downloading them and pages are read
+            # up to the same byte cap as single-page loads
+            with self._get(url, stream=True) as response:
+                response.raise_for_status()
+                if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                    return {'url': url, 'skipped': True}
+                body = read_capped(response)
+        except requests.RequestException as e:
+            return {'url': url, 'error': f"Network error: {str(e)}"}
+
+        html, _, _ = decode_html(body, response.headers.get('Content-Type'))
+        soup = BeautifulSoup(html, 'html.parser')
+        links = []
+        for a in soup.find_all('a', href=True):
+            try:
+                links.append(urljoin(response.url, a['href']))
+            except ValueError:
+                # e.g. an unterminated IPv6 host; a broken link must not fail the page
+                continue
+        canonical = None
+        canonical_tag = soup.find('link', rel='canonical', href=True)
+        if canonical_tag:
+            try:
+                canonical = canonicalize_url(urljoin(response.url, canonical_tag['href']))
+            except ValueError:
+                pass
+        canonical = canonical or canonicalize_url(response.url)
+
+        content, error = self.extract_html(html)
+        if error:
+            return {'url': url, 'links': links, 'error': error}
+
+        title, _, text = content.partition("\n\nContent: ")
+        return {
+            'url': response.url,
+            'canonical': canonical,
+            'title': title.replace("Title: ", "", 1).strip(),
+            'text': text,
+            'links': links
+        }
+
+def read_capped(response, max_bytes=FETCH_MAX_BYTES):
+    """Reads a streamed requests response up to max_bytes and drops the rest."""
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+        chunks.append(chunk[:max_bytes - size])
+        size += len(chunks[-1])
+        if size >= max_bytes:
+            logger.info(f"Stopped reading {response.url} at the {max_bytes:,}-byte limit")
+            break
+    return b"".join(chunks)
+
+def combine_pages(pages, max_chars):
+    """Joins crawled pages into one corpus in the "Title: ...\\n\\nContent: ..." format."""
+    if not pages:
+        return ""
+    sections = [f"[Page: {page['title']} ({page['url']})] {page['text']}" for page in pages]
+    return f"Title: {pages[0]['title']}\n\nContent: {' '.join(sections)}"[:max_chars]
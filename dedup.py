@@ -0,0 +1,67 @@
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Deduplication configuration (overridable through environment variables)
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "4"))
+DEDUP_CONTAINMENT_THRESHOLD = float(os.getenv("DEDUP_CONTAINMENT_THRESHOLD", "0.8"))
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def shingle_hashes(text, size=DEDUP_SHINGLE_SIZE):
+    """Returns the hashes of the overlapping word n-grams of a text.
+
+    Words are lowercased and punctuation is ignored, so blocks that differ only
+    in case, spacing or punctuation share all their shingles. Texts shorter than
+    one shingle hash as a whole.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {hash(tuple(words) or text)}
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+def contained_hashes(text, size=DEDUP_SHINGLE_SIZE):
+    """Returns the shingle hashes of a text plus those of its whole sentences shorter than one shingle.
+
+    A text shorter than one shingle hashes as a whole (see shingle_hashes), so
+    it matches a kept text only where it is that entire text or one entire
+    sentence of it, such as a repeated "Contact us today." Short words inside
+    a longer sentence do not match, so a heading like "Installation" is kept
+    next to a paragraph that mentions the installation.
+    """
+    hashes = shingle_hashes(text, size)
+    for sentence in _SENTENCE_RE.split(text):
+        words = _WORD_RE.findall(sentence.lower())
+        if 0 < len(words) < size:
+            hashes.add(hash(tuple(words)))
+    return hashes
+
+def deduplicate_blocks(texts, threshold=DEDUP_CONTAINMENT_THRESHOLD, shingle_size=DEDUP_SHINGLE_SIZE):
+    """Removes exact, near-duplicate and contained text blocks; returns the rest in their original order.
+
+    Blocks are visited longest first against one set of shingle hashes, so a
+    parent container is kept and the child blocks it already contains are
+    dropped, whichever came first in the document. A block is dropped when at
+    least threshold of its shingles were already seen; blocks shorter than one
+    shingle are dropped when they equal a kept block or a whole sentence of
+    one. Each word is hashed a fixed number of times, so the cost is linear in
+    the amount of text.
+    """
+    seen = set()
+    keep = [False] * len(texts)
+    # sorted() is stable, so among equally long blocks the earlier one wins
+    for index in sorted(range(len(texts)), key=lambda i: -len(texts[i])):
+        shingles = shingle_hashes(texts[index], shingle_size)
+        overlap = sum(1 for shingle in shingles if shingle in seen)
+        if overlap >= threshold * len(shingles):
+            continue
+        seen.update(contained_hashes(texts[index], shingle_size))
+        keep[index] = True
+
+    unique = [text for text, kept in zip(texts, keep) if kept]
+    if len(unique) < len(texts):
+        logger.debug(f"Deduplication dropped {len(texts) - len(unique)} of {len(texts)} blocks")
+    return unique
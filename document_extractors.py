@@ -0,0 +1,407 @@
+import html
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+from fetcher import media_type
+from text_encoding import stream_decoder, ENCODING_SAMPLE_BYTES
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Document extraction configuration (overridable through environment variables)
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "100"))
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", "2"))
+
+PDF = "pdf"
+TEXT = "text"
+JSON = "json"
+XML = "xml"
+FEED = "feed"
+SITEMAP = "sitemap"
+
+# Shown as the extraction method; XML documents are labelled by what their root element turned out to be
+DOCUMENT_LABELS = {
+    PDF: "PDF",
+    TEXT: "Plain Text",
+    JSON: "JSON",
+    XML: "XML",
+    FEED: "RSS/Atom Feed",
+    SITEMAP: "Sitemap",
+}
+
+DOCUMENT_MEDIA_TYPES = {
+    'application/pdf': PDF,
+    'application/x-pdf': PDF,
+    'text/plain': TEXT,
+    'text/markdown': TEXT,
+    'text/x-markdown': TEXT,
+    'application/json': JSON,
+    'application/ld+json': JSON,
+    'application/feed+json': JSON,
+    'application/xml': XML,
+    'text/xml': XML,
+    'application/rss+xml': XML,
+    'application/atom+xml': XML,
+}
+
+# Only consulted when the server sends no specific Content-Type
+DOCUMENT_EXTENSIONS = {
+    '.pdf': PDF,
+    '.txt': TEXT,
+    '.md': TEXT,
+    '.markdown': TEXT,
+    '.json': JSON,
+    '.xml': XML,
+    '.rss': XML,
+    '.atom': XML,
+}
+
+# Served for any kind of file, so the URL's extension has to tell
+GENERIC_MEDIA_TYPES = ('application/octet-stream', 'binary/octet-stream')
+
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+def document_kind(content_type=None, url=None):
+    """Returns the document kind served with a Content-Type, or None for HTML and unknown types.
+
+    A missing or generic Content-Type falls back to the URL's file extension.
+    """
+    media = media_type(content_type)
+    if media in DOCUMENT_MEDIA_TYPES:
+        return DOCUMENT_MEDIA_TYPES[media]
+    if media.endswith('+json'):
+        return JSON
+    if media.endswith('+xml') and media != 'application/xhtml+xml':
+        return XML
+    if (not media or media in GENERIC_MEDIA_TYPES) and url:
+        path = urlparse(url).path.lower()
+        return DOCUMENT_EXTENSIONS.get(os.path.splitext(path)[1])
+    return None
+
+def _clean(text):
+    """Collapses whitespace the way HTML extraction does."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+def _format(title, parts, max_chars):
+    """Assembles extracted parts in the "Title: ...\\n\\nContent: ..." format; returns (content, error)."""
+    combined = ' '.join(part for part in parts if part)
+    if len(combined) < 30:
+        return None, "No readable content found in the document."
+    return f"Title: {title or 'No title'}\n\nContent: {combined}"[:max_chars], None
+
+def extract_text(chunks, max_chars, content_type=None, stats=None):
+    """Passes plain text and Markdown through, decoding it as it streams in; returns (content, error)."""
+    pieces = []
+    collected = 0
+    prefix = b""
+    decoder = None
+    stopped_early = False
+    for chunk in chunks:
+        if decoder is None:
+            prefix += chunk
+            if len(prefix) < ENCODING_SAMPLE_BYTES:
+                continue
+            decoder, encoding, source, bom_length = stream_decoder(prefix, content_type)
+            chunk = prefix[bom_length:]
+        text = decoder.decode(chunk)
+        pieces.append(text)
+        collected += len(text)
+        if collected >= max_chars:
+            stopped_early = True
+            break
+    if decoder is None:
+        decoder, encoding, source, bom_length = stream_decoder(prefix, content_type)
+        pieces.append(decoder.decode(prefix[bom_length:]))
+    pieces.append(decoder.decode(b"", final=True))
+
+    text = ''.join(pieces)
+    first_line = next((line for line in text.splitlines() if line.strip()), "")
+    if stats is not None:
+        stats.update({'stopped_early': stopped_early, 'encoding': encoding, 'encoding_source': source})
+    return _format(_clean(first_line.lstrip('#'))[:200], [_clean(text)], max_chars)
+
+def flatten_json(data, max_chars, path=""):
+    """Yields "path: value" lines for the scalar values of a JSON document, up to about max_chars."""
+    stack = [(path, data)]
+    collected = 0
+    while stack and collected < max_chars:
+        path, value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(reversed([(f"{path}.{key}" if path else str(key), item) for key, item in value.items()]))
+        elif isinstance(value, list):
+            stack.extend(reversed([(f"{path}[{i}]", item) for i, item in enumerate(value)]))
+        elif value is not None and value != "":
+            line = f"{path}: {value}" if path else str(value)
+            collected += len(line) + 1
+            yield line
+
+def extract_json(chunks, max_chars, content_type=None, stats=None):
+    """Flattens a JSON document into "path: value" lines; returns (content, error).
+
+    JSON has to be complete to parse, so the body is read up to the byte
+    limit first. A document cut off by the limit is passed through as text.
+    """
+    data = b"".join(chunks)
+    try:
+        document = json.loads(data)
+    except ValueError as e:
+        logger.info(f"JSON document could not be parsed ({str(e)}), reading it as text")
+        return extract_text([data], max_chars, content_type, stats)
+
+    title = "JSON document"
+    if isinstance(document, dict):
+        title = next((document[key] for key in ('title', 'name', 'headline')
+                      if isinstance(document.get(key), str)), title)
+    if stats is not None:
+        stats['stopped_early'] = False
+    return _format(_clean(title), [_clean(line) + ';' for line in flatten_json(document, max_chars)], max_chars)
+
+def _local_name(tag):
+    """Strips the namespace from an ElementTree tag."""
+    return tag.rsplit('}', 1)[-1].lower() if isinstance(tag, str) else ''
+
+def _strip_markup(text):
+    """Turns the HTML that feeds embed in descriptions into plain text."""
+    return _clean(html.unescape(_TAG_PATTERN.sub(' ', text or '')))
+
+def extract_xml(chunks, max_chars, content_type=None, stats=None):
+    """Extracts RSS/Atom feeds, sitemaps and other XML with an incremental parser; returns (content, error).
+
+    The root element decides the format: feed items become "title (date) link:
+    summary" entries, sitemaps a list of their URLs, and anything else the
+    text of its elements. Finished elements are cleared as parsing goes and
+    reading stops once max_chars of text were collected, so large feeds and
+    sitemaps never sit in memory whole. stats['document_type'] is set to the
+    format found.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    kind = None
+    title = None
+    parts = []
+    collected = 0
+    urls = 0
+    depth = 0
+    stopped_early = False
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                name = _local_name(element.tag)
+                if event == 'start':
+                    depth += 1
+                    if kind is None:
+                        kind = (FEED if name in ('rss', 'rdf', 'feed')
+                                else SITEMAP if name in ('urlset', 'sitemapindex') else XML)
+                    continue
+
+                depth -= 1
+                text = None
+                if kind == FEED and name in ('item', 'entry'):
+                    fields = {_local_name(child.tag): child for child in element}
+                    link = fields.get('link')
+                    link = (link.get('href') or link.text or '').strip() if link is not None else ''
+                    summary = next((fields[key].text for key in ('description', 'summary', 'content', 'encoded')
+                                    if key in fields and fields[key].text), '')
+                    date = next((fields[key].text for key in ('pubdate', 'published', 'updated', 'date')
+                                 if key in fields and fields[key].text), '')
+                    heading = _strip_markup(fields['title'].text if 'title' in fields else '')
+                    text = (f"[{heading}{f' ({date.strip()})' if date else ''}{f' {link}' if link else ''}] "
+                            f"{_strip_markup(summary)}")
+                    element.clear()
+                elif kind == FEED and name == 'title' and title is None and depth <= 2:
+                    title = _strip_markup(element.text)
+                elif kind == SITEMAP and name == 'loc' and element.text:
+                    urls += 1
+                    text = element.text.strip()
+                elif kind == SITEMAP and name in ('url', 'sitemap'):
+                    element.clear()
+                elif kind == XML:
+                    if name == 'title' and title is None and element.text:
+                        title = _strip_markup(element.text)
+                    text = _strip_markup(element.text)
+                    # Children were already visited, so their text is not needed any more
+                    element.clear()
+
+                if text:
+                    parts.append(text)
+                    collected += len(text) + 1
+            if collected >= max_chars:
+                stopped_early = True
+                break
+    except ET.ParseError as e:
+        if not parts:
+            return None, f"Invalid XML document: {str(e)}"
+        logger.info(f"XML document ended early ({str(e)}), keeping what was parsed")
+
+    if stats is not None:
+        stats.update({'document_type': kind or XML, 'stopped_early': stopped_early})
+    if kind == SITEMAP:
+        title = title or "Sitemap"
+        parts.insert(0, f"Sitemap listing {urls}{'+' if stopped_early else ''} URLs:")
+    return _format(title or DOCUMENT_LABELS[kind or XML], parts, max_chars)
+
+def extract_pdf(data, max_chars, max_pages=PDF_MAX_PAGES):
+    """Extracts text page by page from a PDF; returns (content, error, pages_read, page_count).
+
+    Runs in a worker process (see extract_document), so it only takes and
+    returns plain picklable values.
+    """
+    if PdfReader is None:
+        return None, "PDF support requires the pypdf package.", 0, 0
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if reader.is_encrypted:
+            reader.decrypt("")
+        page_count = len(reader.pages)
+        metadata_title = reader.metadata.title if reader.metadata else None
+    except Exception as e:
+        return None, f"Could not read PDF: {str(e)}", 0, 0
+
+    parts = []
+    collected = 0
+    pages_read = 0
+    for number, page in enumerate(reader.pages[:max_pages], 1):
+        try:
+            text = _clean(page.extract_text() or '')
+        except Exception as e:
+            logger.info(f"Skipping unreadable PDF page {number}: {str(e)}")
+            continue
+        pages_read = number
+        if text:
+            parts.append(f"[Page {number}] {text}")
+            collected += len(parts[-1]) + 1
+        if collected >= max_chars:
+            break
+
+    title = _clean(metadata_title or '') or next((part.split('] ', 1)[1][:120] for part in parts), None)
+    content, error = _format(title, parts, max_chars)
+    if error:
+        error = "No extractable text in the PDF. It might be a scanned document without a text layer."
+    return content, error, pages_read, page_count
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_document_executor():
+    """Returns the process pool that parses PDFs off the web server's threads.
+
+    Workers are spawned rather than forked: the server process runs the
+    fetcher's event loop, pool reapers and job threads, and a fork could copy
+    one of their locks in a held state.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(1, DOCUMENT_WORKERS),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def extract_document(kind, chunks, max_chars, content_type=None, stats=None):
+    """Extracts a non-HTML document from its streamed body; returns (content, error).
+
+    Text, JSON and XML are parsed as the chunks arrive. PDFs need their
+    cross-reference table at the end of the file, so they are read whole (up
+    to the fetcher's byte limit) and parsed in a worker process, keeping long
+    documents from holding the GIL that every session shares. stats receives
+    the bytes read, the document type and, for PDFs, the pages read.
+    """
+    counted = {'bytes_read': 0}
+
+    def counting(chunks):
+        for chunk in chunks:
+            counted['bytes_read'] += len(chunk)
+            yield chunk
+
+    stats = stats if stats is not None else {}
+    stats['document_type'] = kind
+    if kind == PDF:
+        data = b"".join(counting(chunks))
+        content, error, pages_read, page_count = get_document_executor().submit(
+            extract_pdf, data, max_chars, PDF_MAX_PAGES).result()
+        stats.update({'pages': pages_read, 'page_count': page_count, 'stopped_early': pages_read < page_count})
+    elif kind == TEXT:
+        content, error = extract_text(counting(chunks), max_chars, content_type, stats)
+    elif kind == JSON:
+        content, error = extract_json(counting(chunks), max_chars, content_type, stats)
+    elif kind == XML:
+        content, error = extract_xml(counting(chunks), max_chars, content_type, stats)
+    else:
+        raise ValueError(f"Unknown document kind: {kind}")
+    stats['bytes_read'] = counted['bytes_read']
+    return content, error
+
+def _synthetic_documents(size_bytes):
+    """Builds a large RSS feed, sitemap, JSON document and text file for benchmarking."""
+    item = ('<item><title>Release {i}</title><link>https://example.com/news/{i}</link>'
+            '<pubDate>Mon, 01 Jan 2024 00:00:00 GMT</pubDate><description>&lt;p&gt;Version {i} improves '
+            'indexing speed and fixes several crashes.&lt;/p&gt;</description></item>')
+    items = ''.join(item.format(i=i) for i in range(size_bytes // len(item)))
+    feed = f'<?xml version="1.0"?><rss version="2.0"><channel><title>Example News</title>{items}</channel></rss>'
+
+    entry = '<url><loc>https://example.com/page/{i}</loc><lastmod>2024-01-01</lastmod></url>'
+    entries = ''.join(entry.format(i=i) for i in range(size_bytes // len(entry)))
+    sitemap = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+    record = {"name": "Product", "price": 19.99, "tags": ["fast", "small"], "description": "A product record."}
+    records = json.dumps({"title": "Product catalogue", "items": [dict(record, id=i)
+                                                                 for i in range(size_bytes // 110)]})
+
+    paragraph = "Plain text paragraph describing the product, its price and its support options.\n"
+    text = "# Product notes\n\n" + paragraph * (size_bytes // len(paragraph))
+    return [("RSS feed", XML, feed.encode('utf-8')), ("sitemap", XML, sitemap.encode('utf-8')),
+            ("JSON", JSON, records.encode('utf-8')), ("text", TEXT, text.encode('utf-8'))]
+
+def run_benchmark(paths=None, size_mb=5, max_chars=200000):
+    """Prints extraction time, peak memory and bytes read for large documents.
+
+    Generated documents stand in unless files are given; those are dispatched
+    by extension, so PDFs can be measured by passing one.
+    """
+    import time
+    import tracemalloc
+
+    documents = []
+    if paths:
+        for path in paths:
+            kind = document_kind(url=path)
+            if kind is None:
+                print(f"{path}: not a supported document type")
+                continue
+            with open(path, 'rb') as f:
+                documents.append((os.path.basename(path), kind, f.read()))
+    else:
+        documents = _synthetic_documents(size_mb * 1024 * 1024)
+
+    def chunks():
+        return (data[i:i + 65536] for i in range(0, len(data), 65536))
+
+    for name, kind, data in documents:
+        stats = {}
+        start = time.perf_counter()
+        content, error = extract_document(kind, chunks(), max_chars, stats=stats)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        extract_document(kind, chunks(), max_chars)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pages = f", {stats['pages']}/{stats['page_count']} pages" if 'pages' in stats else ""
+        print(f"{name:<12} {DOCUMENT_LABELS[stats['document_type']]:<14} {len(data) / 1024 / 1024:6.1f} MB  "
+              f"{elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:6.1f} MB  read {stats['bytes_read'] / 1024 / 1024:5.1f} MB"
+              f"{pages}  {len(content or '') / 1024:6.0f} KB text{'  ' + error if error else ''}")
+
+if __name__ == "__main__":
+    import sys
+    run_benchmark(sys.argv[1:])
@@ -0,0 +1,219 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (overridable through environment variables)
+SELENIUM_POOL_SIZE = int(os.getenv("SELENIUM_POOL_SIZE", "2"))
+SELENIUM_MAX_PAGES_PER_DRIVER = int(os.getenv("SELENIUM_MAX_PAGES_PER_DRIVER", "50"))
+SELENIUM_IDLE_TIMEOUT = float(os.getenv("SELENIUM_IDLE_TIMEOUT", "300"))
+SELENIUM_CHECKOUT_TIMEOUT = float(os.getenv("SELENIUM_CHECKOUT_TIMEOUT", "30"))
+
+def setup_selenium_driver():
+    """Sets up a headless Chrome driver for JavaScript rendering."""
+    try:
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        # Return control at DOMContentLoaded; page_readiness decides when the page has settled
+        chrome_options.page_load_strategy = 'eager'
+
+        driver = webdriver.Chrome(options=chrome_options)
+        return driver, None
+    except Exception as e:
+        logger.error(f"Selenium setup failed: {str(e)}")
+        return None, f"Browser setup failed: {str(e)}. Please ensure Chrome and ChromeDriver are installed."
+
+class PooledDriver:
+    """A Chrome driver owned by the pool, with usage bookkeeping."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class DriverPool:
+    """Bounded pool of warm headless Chrome drivers shared by all sessions."""
+
+    def __init__(self, factory=setup_selenium_driver, max_size=SELENIUM_POOL_SIZE,
+                 max_pages=SELENIUM_MAX_PAGES_PER_DRIVER, idle_timeout=SELENIUM_IDLE_TIMEOUT):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.max_pages = max(1, max_pages)
+        self.idle_timeout = idle_timeout
+
+        # Every live driver is either idle or held by a checkout, and new drivers
+        # are only launched while holding a slot with no idle driver available,
+        # so the semaphore caps the number of Chrome processes.
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'launch_failures': 0,
+            'recycled': 0,
+            'evicted_idle': 0,
+            'unhealthy': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+        if self.idle_timeout > 0:
+            reaper = threading.Thread(target=self._reap_idle_loop, name="driver-pool-reaper", daemon=True)
+            reaper.start()
+
+    def acquire(self, timeout=SELENIUM_CHECKOUT_TIMEOUT):
+        """Checks out a healthy driver, launching one on a pool miss."""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._stats['checkout_timeouts'] += 1
+            return None, "Browser pool exhausted. Too many pages are being rendered right now, please try again."
+
+        wait = time.monotonic() - start
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['total_wait'] += wait
+            self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+
+        self._evict_idle()
+
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                break
+            if self._is_healthy(pooled):
+                with self._lock:
+                    self._stats['hits'] += 1
+                return pooled, None
+            with self._lock:
+                self._stats['unhealthy'] += 1
+            self._quit(pooled)
+
+        with span('browser_launch'):
+            driver, error = self._factory()
+        if error:
+            with self._lock:
+                self._stats['launch_failures'] += 1
+            self._slots.release()
+            return None, error
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return PooledDriver(driver), None
+
+    def release(self, pooled, broken=False):
+        """Returns a driver to the pool, recycling it when worn out or crashed."""
+        try:
+            pooled.pages += 1
+            pooled.last_used = time.monotonic()
+
+            if broken or self._closed or pooled.pages >= self.max_pages or not self._reset(pooled):
+                with self._lock:
+                    self._stats['recycled'] += 1
+                self._quit(pooled)
+                return
+
+            with self._lock:
+                self._idle.append(pooled)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """Returns a snapshot of pool usage counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['idle'] = len(self._idle)
+
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = snapshot['hits'] / lookups if lookups else 0.0
+        snapshot['avg_wait'] = snapshot['total_wait'] / snapshot['checkouts'] if snapshot['checkouts'] else 0.0
+        snapshot['max_size'] = self.max_size
+        return snapshot
+
+    def close(self):
+        """Quits all idle drivers and stops handing out new ones."""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._quit(pooled)
+
+    def _reset(self, pooled):
+        """Clears cookies, storage, cache and service workers of every site so the next checkout starts fresh.
+
+        delete_all_cookies() and localStorage.clear() would only reach the
+        origin currently loaded, so the browser-wide DevTools commands are used;
+        a browser that does not support them is recycled instead.
+        """
+        driver = pooled.driver
+        try:
+            # Leave the page first so it cannot write new state while it is cleared
+            driver.get("about:blank")
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {'origin': '*', 'storageTypes': 'all'})
+            return True
+        except Exception as e:
+            logger.warning(f"Browser reset failed, recycling driver: {str(e)}")
+            return False
+
+    def _is_healthy(self, pooled):
+        """Checks that the browser process still answers commands."""
+        try:
+            return pooled.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _evict_idle(self):
+        """Quits drivers that have been idle longer than the idle timeout."""
+        if self.idle_timeout <= 0:
+            return
+
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [p for p in self._idle if p.last_used < cutoff]
+            self._idle = [p for p in self._idle if p.last_used >= cutoff]
+            self._stats['evicted_idle'] += len(expired)
+        for pooled in expired:
+            self._quit(pooled)
+
+    def _reap_idle_loop(self):
+        """Periodically evicts idle drivers so an unused pool releases Chrome."""
+        interval = max(1.0, self.idle_timeout / 2)
+        while not self._closed:
+            time.sleep(interval)
+            self._evict_idle()
+
+    def _quit(self, pooled):
+        """Terminates a driver, ignoring errors from already-dead browsers."""
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.debug(f"Driver quit failed: {str(e)}")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_driver_pool():
+    """Returns the process-wide driver pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close)
+        return _pool
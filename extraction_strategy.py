@@ -0,0 +1,106 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Strategy configuration (overridable through environment variables)
+EXTRACTION_STRATEGY = os.getenv("EXTRACTION_STRATEGY", "parallel")
+QUALITY_MIN_CHARS = int(os.getenv("QUALITY_MIN_CHARS", "500"))
+QUALITY_MIN_TEXT_DENSITY = float(os.getenv("QUALITY_MIN_TEXT_DENSITY", "0.02"))
+STRATEGY_MEMORY_MIN_WINS = int(os.getenv("STRATEGY_MEMORY_MIN_WINS", "2"))
+
+STATIC = "static"
+BROWSER = "browser"
+
+# Phrases that single-page-app shells and bot walls show instead of content
+JAVASCRIPT_REQUIRED_MARKERS = re.compile(
+    r"enable javascript|javascript is (?:required|disabled)|requires javascript|"
+    r"turn on javascript|please enable js|you need to enable javascript|"
+    r"browser (?:is not|isn't) supported|checking your browser",
+    re.IGNORECASE
+)
+
+def assess_content_quality(content, html_bytes=None):
+    """Decides whether statically extracted content is good enough to skip the browser.
+
+    Returns (acceptable, reason). html_bytes is the size of the downloaded HTML,
+    used for text density: pages that ship lots of markup and script but little
+    text are usually rendered client-side.
+    """
+    if not content:
+        return False, "no content"
+
+    _, _, text = content.partition("\n\nContent: ")
+    text = text or content
+    if len(text) < QUALITY_MIN_CHARS:
+        return False, f"only {len(text)} characters"
+
+    if JAVASCRIPT_REQUIRED_MARKERS.search(text[:5000]):
+        return False, "page asks for JavaScript"
+
+    # Below a few thousand characters, a low text-to-markup ratio suggests an app shell
+    if html_bytes and len(text) < 5000 and len(text) / html_bytes < QUALITY_MIN_TEXT_DENSITY:
+        return False, f"text density {len(text) / html_bytes:.3f}"
+
+    return True, "ok"
+
+class StrategyMemory:
+    """Remembers per domain which extraction strategy produced the content."""
+
+    def __init__(self, min_wins=STRATEGY_MEMORY_MIN_WINS):
+        self.min_wins = max(1, min_wins)
+        self._lock = threading.Lock()
+        self._winners = {}
+
+    @staticmethod
+    def domain(url):
+        """Returns the memory key for a URL."""
+        return urlparse(url).netloc.lower()
+
+    def preferred(self, url):
+        """Returns the strategy that has won enough consecutive loads for this domain, or None."""
+        with self._lock:
+            winner, streak = self._winners.get(self.domain(url), (None, 0))
+        return winner if streak >= self.min_wins else None
+
+    def record(self, url, strategy):
+        """Records the winning strategy of one load."""
+        key = self.domain(url)
+        with self._lock:
+            winner, streak = self._winners.get(key, (None, 0))
+            self._winners[key] = (strategy, streak + 1 if winner == strategy else 1)
+
+    def stats(self):
+        """Returns the number of domains that currently skip one strategy."""
+        with self._lock:
+            settled = [w for w, streak in self._winners.values() if streak >= self.min_wins]
+        return {
+            'domains': len(self._winners),
+            'static_only': settled.count(STATIC),
+            'browser_only': settled.count(BROWSER)
+        }
+
+_memory = None
+_executor = None
+_lock = threading.Lock()
+
+def get_strategy_memory():
+    """Returns the process-wide strategy memory."""
+    global _memory
+    with _lock:
+        if _memory is None:
+            _memory = StrategyMemory()
+        return _memory
+
+def get_browser_executor():
+    """Returns the process-wide executor for background browser renders."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Browser jobs wait on the driver pool, so a few extra threads are enough
+            _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="browser-render")
+        return _executor
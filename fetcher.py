@@ -0,0 +1,410 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import httpx
+from metrics import record_span
+
+logger = logging.getLogger(__name__)
+
+# Fetch configuration (overridable through environment variables)
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "15"))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "2"))
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "0.5"))
+FETCH_BACKOFF_MAX = float(os.getenv("FETCH_BACKOFF_MAX", "8"))
+FETCH_HEDGE_DELAY = float(os.getenv("FETCH_HEDGE_DELAY", "2"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "6"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "100"))
+FETCH_HTTP2 = os.getenv("FETCH_HTTP2", "true").lower() == "true"
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "65536"))
+
+# Statuses worth retrying after a backoff; other 4xx answers are final
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Connection-level events (reported by httpcore's trace hook) and the timing each one adds to
+_TRACE_STAGES = {
+    'connect_tcp': 'connect',
+    'start_tls': 'connect',
+    'send_request_headers': 'ttfb',
+    'send_request_body': 'ttfb',
+    'receive_response_headers': 'ttfb',
+}
+
+class FetchError(Exception):
+    """Raised when a URL could not be fetched successfully."""
+
+    def __init__(self, message, status_code=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+class UnsupportedContentError(FetchError):
+    """Raised when a response's Content-Type is not one the caller accepts."""
+
+    def __init__(self, message, content_type=None, status_code=None):
+        super().__init__(message, status_code=status_code)
+        self.content_type = content_type
+
+def media_type(content_type):
+    """Returns the lower-cased media type of a Content-Type header without its parameters."""
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+class StreamingResponse:
+    """A response whose body is read in chunks from synchronous code, up to max_bytes.
+
+    Status and headers are available as soon as open() returns; the body is
+    only downloaded while iter_bytes() is consumed. Reading stops at max_bytes
+    and sets truncated, and the connection goes back to the pool on close()
+    (or once iteration ends), so abandoning a huge body costs nothing more.
+    The per-host slot of the request is held until then as well.
+
+    timings holds the connect and time-to-first-byte seconds of the request
+    (there is no connect on a reused keep-alive connection) and, once the body is
+    read, the seconds spent waiting for it as download.
+    """
+
+    def __init__(self, response, loop, max_bytes=FETCH_MAX_BYTES, chunk_size=FETCH_CHUNK_SIZE):
+        self.status_code = response.status_code
+        self.reason_phrase = response.reason_phrase
+        self.headers = response.headers
+        self.url = response.url
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.truncated = False
+        self.timings = {stage: seconds for stage, (_, seconds) in response.extensions.get('timings', {}).items()}
+        self._download_started = None
+        self._response = response
+        self._loop = loop
+        self._chunks = response.aiter_bytes(chunk_size)
+        self._content = None
+        self._closed = False
+
+    @property
+    def content_length(self):
+        """The declared body size, or None if the server did not send a usable Content-Length."""
+        try:
+            return int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
+    def iter_bytes(self):
+        """Yields the body in chunks as it arrives, stopping at max_bytes."""
+        waited = 0.0
+        try:
+            while not self._closed:
+                start = time.perf_counter()
+                if self._download_started is None:
+                    self._download_started = start
+                chunk = asyncio.run_coroutine_threadsafe(self._next_chunk(), self._loop).result()
+                # Only the wait for the network counts, not what the caller does between chunks
+                waited += time.perf_counter() - start
+                if chunk is None:
+                    return
+                remaining = self.max_bytes - self.bytes_read
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                    self.truncated = True
+                self.bytes_read += len(chunk)
+                if chunk:
+                    yield chunk
+                if self.truncated:
+                    logger.info(f"Stopped reading {self.url} at the {self.max_bytes:,}-byte limit")
+                    return
+        finally:
+            if self._download_started is not None:
+                self.timings['download'] = self.timings.get('download', 0.0) + waited
+                record_span('download', waited, start=self._download_started, bytes=self.bytes_read)
+            self.close()
+
+    def read(self):
+        """Reads the rest of the (capped) body and returns it."""
+        if self._content is None:
+            self._content = b"".join(self.iter_bytes())
+        return self._content
+
+    @property
+    def content(self):
+        """The whole (capped) body, read on first access."""
+        return self.read()
+
+    def close(self):
+        """Releases the connection without reading the rest of the body."""
+        if self._closed:
+            return
+        self._closed = True
+        asyncio.run_coroutine_threadsafe(_close_response(self._response), self._loop).result()
+
+    async def _next_chunk(self):
+        """Reads the next chunk on the fetcher's loop; returns None at the end of the body."""
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+        except httpx.TimeoutException as e:
+            raise FetchError(f"Reading the response timed out: {str(e) or type(e).__name__}")
+        except httpx.TransportError as e:
+            raise FetchError(f"Connection failed while reading the response: {str(e) or type(e).__name__}")
+
+class AsyncFetcher:
+    """Shared asyncio HTTP client with pooled keep-alive connections.
+
+    The client runs on a dedicated event loop thread, so synchronous callers
+    such as the Streamlit script thread can use get() while every caller
+    shares one connection pool and the per-host connection limits.
+    """
+
+    def __init__(self, connect_timeout=FETCH_CONNECT_TIMEOUT, read_timeout=FETCH_READ_TIMEOUT,
+                 max_retries=FETCH_MAX_RETRIES, hedge_delay=FETCH_HEDGE_DELAY,
+                 per_host_limit=FETCH_PER_HOST_LIMIT, max_connections=FETCH_MAX_CONNECTIONS, http2=FETCH_HTTP2):
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=read_timeout)
+        self.max_retries = max_retries
+        self.hedge_delay = hedge_delay
+        self.per_host_limit = max(1, per_host_limit)
+        self._host_semaphores = {}
+        self._stats = {'requests': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'failures': 0}
+        self._stats_lock = threading.Lock()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-fetcher", daemon=True)
+        self._thread.start()
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        try:
+            self._client = httpx.AsyncClient(http2=http2, limits=limits, timeout=self.timeout, follow_redirects=True)
+        except ImportError:
+            logger.info("HTTP/2 support (h2) is not installed, using HTTP/1.1")
+            self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True)
+
+    def get(self, url, headers=None, alternate_headers=None, method="GET", timeout=None, max_bytes=FETCH_MAX_BYTES):
+        """Fetches a URL from synchronous code and returns the response with its body read (up to max_bytes)."""
+        response = self.open(url, headers=headers, alternate_headers=alternate_headers, method=method,
+                             timeout=timeout, max_bytes=max_bytes)
+        response.read()
+        return response
+
+    def open(self, url, headers=None, alternate_headers=None, method="GET", timeout=None, accept=None,
+             max_bytes=FETCH_MAX_BYTES):
+        """Fetches a URL from synchronous code and returns a StreamingResponse before reading its body.
+
+        accept is an optional tuple of media types (a trailing "/" matches a
+        whole family such as "text/"); anything else raises
+        UnsupportedContentError without downloading the body. A response
+        without a Content-Type is accepted.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.fetch(url, headers=headers, alternate_headers=alternate_headers, method=method, accept=accept),
+            self._loop
+        )
+        response = future.result(timeout)
+        # The request ran on the fetcher's loop; its timings join the caller's trace here
+        for stage, (start, seconds) in response.extensions.get('timings', {}).items():
+            record_span(stage, seconds, start=start)
+        return StreamingResponse(response, self._loop, max_bytes=max_bytes)
+
+    async def fetch(self, url, headers=None, alternate_headers=None, method="GET", accept=None):
+        """Sends a request with hedging and exponential-backoff retries; returns the response with its body unread."""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Full jitter keeps retries from many sessions from arriving in lockstep
+                delay = random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * 2 ** attempt))
+                self._count('retries')
+                await asyncio.sleep(delay)
+            try:
+                return await self._hedged_fetch(url, headers, alternate_headers, method, accept)
+            except FetchError as e:
+                last_error = e
+                if not e.retryable:
+                    break
+
+        self._count('failures')
+        raise last_error
+
+    async def _hedged_fetch(self, url, headers, alternate_headers, method, accept):
+        """Races the primary request against the alternate headers once the primary is slow or fails."""
+        primary = asyncio.ensure_future(self._request(url, headers, method, accept))
+        if not alternate_headers:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done and not primary.exception():
+            return primary.result()
+        if done and isinstance(primary.exception(), UnsupportedContentError):
+            # Another User-Agent will not turn a PDF into a page
+            raise primary.exception()
+
+        self._count('hedged')
+        alternate = asyncio.ensure_future(self._request(url, alternate_headers, method, accept))
+        pending = {primary, alternate}
+        errors = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is alternate:
+                        self._count('hedge_wins')
+                    # A second success in the same wakeup must give its connection back
+                    for task in done - {winner}:
+                        if task.exception() is None:
+                            await _close_response(task.result())
+                    return winner.result()
+                errors.extend(task.exception() for task in done)
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_close_unused)
+
+        # Retry only if every attempt failed in a retryable way
+        retryable = all(getattr(e, 'retryable', False) for e in errors)
+        raise FetchError(str(errors[-1]), getattr(errors[-1], 'status_code', None), retryable)
+
+    async def _request(self, url, headers, method, accept=None):
+        """Sends one request under the per-host connection limit and checks its status and type before the body.
+
+        The per-host slot stays taken while the body is read; it is given back
+        when the returned response is closed through _close_response.
+        """
+        host = urlparse(url).netloc.lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+
+        self._count('requests')
+        timings = {}
+        started = {}
+
+        async def trace(event, info):
+            # Events look like "http11.send_request_headers.started"; redirects add to the same totals
+            step, _, phase = event.partition(".")[2].rpartition(".")
+            stage = _TRACE_STAGES.get(step)
+            if stage is None:
+                return
+            now = time.perf_counter()
+            if phase == "started":
+                started.setdefault(stage, now)
+                timings.setdefault(stage, [now, 0.0])
+            elif phase in ("complete", "failed") and stage in started:
+                timings[stage][1] += now - started.pop(stage)
+
+        await semaphore.acquire()
+        try:
+            request = self._client.build_request(method, url, headers=headers, extensions={'trace': trace})
+            response = await self._client.send(request, stream=True)
+        except httpx.TimeoutException as e:
+            semaphore.release()
+            raise FetchError(f"Request timed out: {str(e) or type(e).__name__}", retryable=True)
+        except httpx.TransportError as e:
+            semaphore.release()
+            raise FetchError(f"Connection failed: {str(e) or type(e).__name__}", retryable=True)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        response.extensions['timings'] = timings
+        response.extensions['release'] = semaphore.release
+        if response.status_code >= 400:
+            await _close_response(response)
+            raise FetchError(
+                f"{response.status_code} {response.reason_phrase} for url: {response.url}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUSES
+            )
+        content_type = response.headers.get('Content-Type')
+        if accept and content_type and response.status_code != 304:
+            if not media_type(content_type).startswith(tuple(accept)):
+                await _close_response(response)
+                raise UnsupportedContentError(f"Unsupported content type {media_type(content_type)} for url: "
+                                              f"{response.url}", content_type, response.status_code)
+        return response
+
+    def stats(self):
+        """Returns request, retry and hedging counters."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        """Closes the connection pool and stops the event loop."""
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _count(self, key):
+        """Increments a stats counter."""
+        with self._stats_lock:
+            self._stats[key] += 1
+
+async def _close_response(response):
+    """Closes a response from _request and gives its per-host slot back (once)."""
+    try:
+        await response.aclose()
+    finally:
+        release = response.extensions.pop('release', None)
+        if release is not None:
+            release()
+
+def _close_unused(task):
+    """Closes the response of a hedged request that finished after the race was decided."""
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(_close_response(task.result()))
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    """Returns the process-wide fetcher, creating it on first use."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = AsyncFetcher()
+        return _fetcher
+
+def run_benchmark(requests_count=200, concurrency=8, latency=0.05):
+    """Compares a new connection per request against the shared fetcher on a local server."""
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    body = b"<html><head><title>Bench</title></head><body>" + b"<p>Benchmark paragraph.</p>" * 2000 + b"</body></html>"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    def fresh_client():
+        with httpx.Client(timeout=10) as client:
+            client.get(url).raise_for_status()
+
+    fetcher = AsyncFetcher(http2=False)
+    results = {}
+    for name, fetch_once in (("new connection per request", fresh_client), ("shared AsyncFetcher", lambda: fetcher.get(url))):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda _: fetch_once(), range(requests_count)))
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"{name:30s} {requests_count / elapsed:8.1f} req/s  ({elapsed:.2f}s for {requests_count} requests)")
+
+    fetcher.close()
+    server.shutdown()
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
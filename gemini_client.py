@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from token_counter import estimate_tokens, get_token_counter
+from metrics import observe, record_span
+
+logger = logging.getLogger(__name__)
+
+# Gemini API configuration (overridable through environment variables)
+GEMINI_MODEL = "gemini-1.5-flash"
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "20"))
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "15"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+
+# Statuses worth retrying after a backoff; other errors are final
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+class GeminiError(Exception):
+    """Raised when a Gemini API call fails."""
+
+    def __init__(self, message, status_code=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+class GeminiRateLimitError(GeminiError):
+    """Raised when the API keeps answering 429 after all retries."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status_code=429, retryable=True)
+        self.retry_after = retry_after
+
+class GeminiResponseError(GeminiError):
+    """Raised when the API answers successfully but without usable text (e.g. blocked content)."""
+
+class GeminiStreamInterrupted(GeminiError):
+    """Raised when a streamed answer breaks off after some text arrived; partial holds that text."""
+
+    def __init__(self, message, partial=""):
+        super().__init__(message, retryable=True)
+        self.partial = partial
+
+class TokenBucketLimiter:
+    """Client-side limiter for requests and tokens per minute, shared by all callers.
+
+    Both quotas refill continuously. A 429 from the API pauses every caller for
+    the advertised delay, so concurrent sessions back off together instead of
+    each retrying into the limit.
+    """
+
+    def __init__(self, requests_per_minute=GEMINI_RPM_LIMIT, tokens_per_minute=GEMINI_TPM_LIMIT):
+        self.capacity = {'requests': requests_per_minute, 'tokens': tokens_per_minute}
+        self._levels = {name: float(limit) for name, limit in self.capacity.items()}
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+        self._stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'pauses': 0}
+
+    def acquire(self, tokens=0):
+        """Blocks until one request with about this many tokens fits in both quotas."""
+        wanted = {'requests': 1, 'tokens': tokens}
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    shortfalls = [
+                        (min(wanted[name], limit) - self._levels[name]) * 60 / limit
+                        for name, limit in self.capacity.items() if limit > 0
+                    ]
+                    wait = max(shortfalls + [0])
+                if wait <= 0:
+                    for name, limit in self.capacity.items():
+                        if limit > 0:
+                            self._levels[name] -= min(wanted[name], limit)
+                    waited = now - start
+                    self._stats['acquired'] += 1
+                    if waited > 0.001:
+                        self._stats['waited'] += 1
+                        self._stats['wait_seconds'] += waited
+                    return waited
+                self._condition.wait(wait)
+
+    def pause(self, seconds):
+        """Holds back every caller for the given time, e.g. after a 429."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._stats['pauses'] += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """Returns how often callers had to wait for quota."""
+        with self._condition:
+            return dict(self._stats)
+
+    def _refill(self, now):
+        """Adds the quota that accrued since the last call."""
+        elapsed = now - self._updated
+        self._updated = now
+        for name, limit in self.capacity.items():
+            if limit > 0:
+                self._levels[name] = min(limit, self._levels[name] + elapsed * limit / 60)
+
+class GeminiClient:
+    """Long-lived Gemini API client with pooled keep-alive connections.
+
+    One client serves every Streamlit session in the process: requests share the
+    HTTPS connection pool and the rate limiter, are retried with jittered
+    backoff on 429/5xx (honoring Retry-After), and failures raise GeminiError.
+    """
+
+    def __init__(self, api_key, api_base=GEMINI_API_BASE, model=GEMINI_MODEL, connect_timeout=GEMINI_CONNECT_TIMEOUT,
+                 read_timeout=GEMINI_READ_TIMEOUT, max_retries=GEMINI_MAX_RETRIES, limiter=None, pool_size=GEMINI_POOL_SIZE):
+        self.api_base = api_base.rstrip('/')
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.limiter = limiter or get_rate_limiter()
+        self._stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0}
+        self._stats_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # The key travels in a header so it never shows up in URLs, logs or error messages
+        self.session.headers.update({'x-goog-api-key': api_key, 'Content-Type': 'application/json'})
+
+    @staticmethod
+    def build_request(prompt, generation_config, cached_content=None):
+        """Builds the request body shared by the blocking and streaming endpoints."""
+        data = {
+            "contents": [{
+                "parts": [{"text": prompt}]
+            }],
+            "generationConfig": generation_config,
+            "safetySettings": SAFETY_SETTINGS
+        }
+        if cached_content:
+            data["cachedContent"] = cached_content
+        return data
+
+    def generate(self, prompt, generation_config, cached_content=None, request_type="question", model=None):
+        """Returns (text, usageMetadata) for one prompt."""
+        start = time.perf_counter()
+        body = self.build_request(prompt, generation_config, cached_content)
+        response = self._send("POST", f"models/{model or self.model}:generateContent",
+                               json=body, tokens=estimate_tokens(prompt))
+        try:
+            result = response.json()
+        except ValueError as e:
+            raise GeminiResponseError(f"Invalid API response - {str(e)}")
+
+        usage = result.get("usageMetadata")
+        get_token_counter().record_usage(request_type, prompt, usage)
+        text = "".join(_candidate_texts(result)).strip()
+        if not text:
+            raise GeminiResponseError(_empty_reason(result))
+        _record_latency(start, request_type)
+        return text, usage
+
+    def stream(self, prompt, generation_config, cached_content=None, request_type="question", model=None, on_usage=None):
+        """Yields the answer text in chunks as the server-sent events arrive."""
+        start = time.perf_counter()
+        body = self.build_request(prompt, generation_config, cached_content)
+        response = self._send("POST", f"models/{model or self.model}:streamGenerateContent", params={"alt": "sse"},
+                              json=body, tokens=estimate_tokens(prompt), stream=True)
+        usage = None
+        last_event = {}
+        produced = False
+        # SSE is UTF-8 by definition; without a charset requests would yield bytes or decode as Latin-1
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Each SSE event carries one partial GenerateContentResponse
+                if not line or not line.startswith("data:"):
+                    continue
+                last_event = json.loads(line[len("data:"):].strip())
+                # The final event carries the token counts for the whole call
+                usage = last_event.get("usageMetadata") or usage
+                for text in _candidate_texts(last_event):
+                    if text:
+                        if not produced:
+                            ttft = time.perf_counter() - start
+                            observe('llm_ttft_seconds', ttft, request_type=request_type)
+                            record_span('llm_first_token', ttft, start=start, request_type=request_type)
+                        produced = True
+                        yield text
+        except (requests.RequestException, ValueError) as e:
+            raise GeminiError(f"Response stream interrupted - {str(e)}", retryable=True)
+        finally:
+            response.close()
+
+        get_token_counter().record_usage(request_type, prompt, usage)
+        if on_usage:
+            on_usage(usage)
+        if not produced:
+            raise GeminiResponseError(_empty_reason(last_event))
+        _record_latency(start, request_type)
+
+    def request_json(self, method, path, params=None, json=None):
+        """Sends a request to another API resource (e.g. cachedContents) and returns the decoded body."""
+        response = self._send(method, path, params=params, json=json)
+        try:
+            return response.json() if response.content else {}
+        except ValueError as e:
+            raise GeminiResponseError(f"Invalid API response - {str(e)}")
+
+    def stats(self):
+        """Returns request, retry and rate-limit counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['limiter'] = self.limiter.stats()
+        return stats
+
+    def _send(self, method, path, tokens=0, stream=False, **kwargs):
+        """Sends one logical request, retrying transient failures; returns the successful response."""
+        url = f"{self.api_base}/{path}"
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            self._count('requests')
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, stream=stream, **kwargs)
+            except requests.Timeout as e:
+                error, retry_after = GeminiError(f"API request timed out - {str(e)}", retryable=True), None
+            except requests.RequestException as e:
+                error, retry_after = GeminiError(f"API request failed - {str(e)}", retryable=True), None
+            else:
+                if response.status_code < 400:
+                    return response
+                error, retry_after = _error_from_response(response), _retry_after(response)
+                response.close()
+                if response.status_code == 429:
+                    self._count('rate_limited')
+                    # Everyone in the process waits, not just this caller
+                    self.limiter.pause(retry_after or GEMINI_BACKOFF_BASE * 2 ** attempt)
+
+            if not error.retryable or attempt == self.max_retries:
+                self._count('failures')
+                raise error
+            delay = retry_after if retry_after is not None else random.uniform(
+                0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+            self._count('retries')
+            logger.info(f"Gemini request failed ({str(error)}), retrying in {delay:.1f}s")
+            time.sleep(min(delay, GEMINI_BACKOFF_MAX))
+
+    def _count(self, key):
+        """Increments a stats counter."""
+        with self._stats_lock:
+            self._stats[key] += 1
+
+def _candidate_texts(result):
+    """Returns the text parts of the first candidate of a (partial) response."""
+    for candidate in result.get("candidates", [])[:1]:
+        for part in candidate.get("content", {}).get("parts", []):
+            yield part.get("text", "")
+
+def _record_latency(start, request_type):
+    """Records the latency of a completed call, rate-limit waits and retries included."""
+    seconds = time.perf_counter() - start
+    observe('llm_seconds', seconds, request_type=request_type)
+    record_span('llm', seconds, start=start, request_type=request_type)
+
+def _empty_reason(result):
+    """Explains why a response carried no text."""
+    block_reason = result.get("promptFeedback", {}).get("blockReason")
+    if block_reason:
+        return f"Prompt blocked by the API ({block_reason})"
+    candidates = result.get("candidates") or []
+    if candidates and candidates[0].get("finishReason") not in (None, "STOP"):
+        return f"Response stopped by the API ({candidates[0]['finishReason']})"
+    return "No candidates in API response"
+
+def _error_from_response(response):
+    """Turns an error response into the matching GeminiError."""
+    try:
+        message = response.json().get("error", {}).get("message") or response.reason
+    except ValueError:
+        message = response.reason
+    message = f"{response.status_code} {message}"
+    if response.status_code == 429:
+        return GeminiRateLimitError(f"Rate limited - {message}", retry_after=_retry_after(response))
+    return GeminiError(f"API request failed - {message}", status_code=response.status_code,
+                       retryable=response.status_code in RETRYABLE_STATUSES)
+
+def _retry_after(response):
+    """Returns the server's requested delay in seconds (Retry-After or RetryInfo), or None."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        for detail in response.json().get("error", {}).get("details", []):
+            delay = detail.get("retryDelay")
+            if delay and delay.endswith("s"):
+                return float(delay[:-1])
+    except (ValueError, AttributeError):
+        pass
+    return None
+
+_limiter = None
+_client = None
+_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Returns the process-wide rate limiter."""
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            _limiter = TokenBucketLimiter()
+        return _limiter
+
+def get_gemini_client(api_key):
+    """Returns the process-wide Gemini client, creating it on first use."""
+    global _client
+    limiter = get_rate_limiter()
+    with _lock:
+        if _client is None:
+            _client = GeminiClient(api_key, limiter=limiter)
+        return _client
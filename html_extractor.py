@@ -0,0 +1,439 @@
+import json
+import logging
+import os
+import re
+from html.parser import HTMLParser
+from dedup import deduplicate_blocks
+from content_scoring import class_weight, score_document, CONTENT_MIN_CHARS
+from text_encoding import stream_decoder, ENCODING_SAMPLE_BYTES
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# Parser backend: "lxml" (fast, C) or "html.parser" (standard library)
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "lxml" if etree is not None else "html.parser")
+# Streamed pages stop downloading once the parsed text reaches this multiple of the content limit
+HTML_STREAM_TEXT_FACTOR = float(os.getenv("HTML_STREAM_TEXT_FACTOR", "3"))
+
+# Subtrees whose text is never page content
+SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'object', 'canvas', 'head'])
+
+# Navigation and chrome; their text is only used when nothing else is found
+BOILERPLATE_TAGS = frozenset(['nav', 'header', 'footer', 'aside', 'form', 'button'])
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+# Elements that start a new block of text; inline elements flow into their block
+BLOCK_TAGS = frozenset([
+    'html', 'body', 'main', 'article', 'section', 'div', 'p', 'li', 'td', 'th', 'dd', 'dt',
+    'blockquote', 'pre', 'figcaption', 'caption', 'address', 'ul', 'ol', 'dl', 'table', 'tr',
+    'nav', 'header', 'footer', 'aside', 'form', 'details', 'summary', 'fieldset', 'legend'
+] + list(HEADING_TAGS))
+
+# HTML elements without closing tags (html.parser reports no end event for them)
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+    'source', 'track', 'wbr'
+])
+
+class _Frame:
+    """An open element on the handler's stack."""
+
+    __slots__ = ('tag', 'skip', 'boilerplate', 'block', 'link', 'capture', 'opens_block')
+
+    def __init__(self, tag, skip, boilerplate, block, link=False, capture=None, opens_block=False):
+        self.tag = tag
+        self.skip = skip
+        self.boilerplate = boilerplate
+        self.block = block
+        self.link = link
+        self.capture = capture
+        self.opens_block = opens_block
+
+class DocumentHandler:
+    """Collects everything extraction needs in a single walk over the parser events.
+
+    The handler implements the lxml parser-target interface (start/end/data/close)
+    and is also driven by the html.parser adapter, so both backends produce the
+    same document: title, meta descriptions, JSON-LD, the visible text pieces and
+    a tree of text blocks carrying the statistics content scoring needs.
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self.piece_blocks = []
+        self.blocks = []
+        self.meta = []
+        self.json_ld = []
+        self.attribute_texts = []
+        self.title = None
+        self.og_title = None
+        self.text_chars = 0
+        root = _Frame('#root', False, False, None)
+        self._stack = [root]
+
+    def start(self, tag, attrs):
+        """Handles an opening tag."""
+        tag = tag.lower() if isinstance(tag, str) else ''
+        parent = self._stack[-1]
+        attrs = attrs or {}
+
+        if tag == 'meta':
+            self._handle_meta(attrs)
+
+        for name in ('data-content', 'aria-label'):
+            value = attrs.get(name)
+            if value and len(value) > 10 and not parent.skip:
+                self.attribute_texts.append(value)
+
+        capture = None
+        if tag == 'title' or (tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json'):
+            capture = []
+
+        block = parent.block
+        boilerplate = parent.boilerplate or tag in BOILERPLATE_TAGS
+        skip = parent.skip or tag in SKIP_TAGS
+        opens_block = tag in BLOCK_TAGS and not skip
+        if opens_block:
+            parent_path = self.blocks[block]['path'] if block is not None else 0
+            classes = (attrs.get('class') or '').split()
+            block = len(self.blocks)
+            self.blocks.append({
+                'tag': tag, 'parent': parent.block, 'boilerplate': boilerplate, 'weight': class_weight(attrs),
+                'path': hash((parent_path, tag, classes[0] if classes else '')),
+                'parts': [], 'chars': 0, 'link_chars': 0, 'commas': 0, 'tags': 1,
+                'start': len(self.pieces), 'end': None, 'block_end': None
+            })
+        elif block is not None and not skip:
+            self.blocks[block]['tags'] += 1
+
+        self._stack.append(_Frame(tag, skip, boilerplate, block, parent.link or tag == 'a', capture, opens_block))
+
+    def end(self, tag):
+        """Handles a closing tag, closing any unclosed elements inside it."""
+        tag = tag.lower() if isinstance(tag, str) else ''
+        if not any(frame.tag == tag for frame in self._stack[1:]):
+            return
+        while len(self._stack) > 1:
+            frame = self._stack.pop()
+            self._close_frame(frame)
+            if frame.tag == tag:
+                break
+
+    def data(self, text):
+        """Handles a run of character data."""
+        frame = self._stack[-1]
+        if frame.capture is not None:
+            frame.capture.append(text)
+            return
+        if frame.skip:
+            return
+        text = text.strip()
+        if not text:
+            return
+        self.pieces.append(text)
+        self.piece_blocks.append(frame.block)
+        self.text_chars += len(text)
+        if frame.block is not None:
+            block = self.blocks[frame.block]
+            block['parts'].append(text)
+            block['chars'] += len(text)
+            block['commas'] += text.count(',')
+            if frame.link:
+                block['link_chars'] += len(text)
+
+    def comment(self, text):
+        """Ignores comments (part of the lxml target interface)."""
+
+    def close(self):
+        """Finishes the walk and returns the handler as the parsed document."""
+        while len(self._stack) > 1:
+            self._close_frame(self._stack.pop())
+        return self
+
+    def block_texts(self, tags=None, include_boilerplate=False):
+        """Returns (tag, text) for non-empty blocks in document order."""
+        for block in self.blocks:
+            if not block['parts'] or (block['boilerplate'] and not include_boilerplate):
+                continue
+            if tags is None or block['tag'] in tags:
+                yield block['tag'], ' '.join(block['parts'])
+
+    def _close_frame(self, frame):
+        """Finalizes an element whose end tag was reached."""
+        if frame.opens_block:
+            block = self.blocks[frame.block]
+            block['end'] = len(self.pieces)
+            block['block_end'] = len(self.blocks)
+
+        if frame.capture is None:
+            return
+        captured = ''.join(frame.capture).strip()
+        if frame.tag == 'title':
+            if self.title is None:
+                self.title = captured
+        elif captured:
+            self.json_ld.append(captured)
+
+    def _handle_meta(self, attrs):
+        """Records description and OpenGraph meta tags in document order."""
+        name = attrs.get('name')
+        prop = attrs.get('property')
+        content = attrs.get('content', '') or ''
+        if name in ('description', 'og:description', 'twitter:description'):
+            if content and len(content) > 20:
+                self.meta.append(f"Meta Description: {content}")
+        elif prop in ('og:title', 'og:description'):
+            if content and len(content) > 10:
+                self.meta.append(content)
+        if prop == 'og:title' and content and self.og_title is None:
+            self.og_title = content
+
+class _StdlibAdapter(HTMLParser):
+    """Drives a DocumentHandler from the standard library HTML parser."""
+
+    def __init__(self, handler):
+        super().__init__(convert_charrefs=True)
+        self.handler = handler
+
+    def handle_starttag(self, tag, attrs):
+        self.handler.start(tag, {k: v or '' for k, v in attrs})
+        if tag in VOID_TAGS:
+            self.handler.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handler.start(tag, {k: v or '' for k, v in attrs})
+        self.handler.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_TAGS:
+            self.handler.end(tag)
+
+    def handle_data(self, data):
+        self.handler.data(data)
+
+class HTMLExtractor:
+    """Incremental single-pass HTML parser with a pluggable backend.
+
+    Feed bytes (or text) with feed() as they arrive and call close() to get the
+    parsed DocumentHandler.
+    """
+
+    def __init__(self, backend=HTML_PARSER_BACKEND, encoding=None):
+        if backend == 'lxml' and etree is None:
+            logger.info("lxml is not installed, falling back to html.parser")
+            backend = 'html.parser'
+        self.backend = backend
+        self.encoding = encoding
+        self.handler = DocumentHandler()
+        if backend == 'lxml':
+            self._parser = etree.HTMLParser(target=self.handler, encoding=encoding, recover=True,
+                                            remove_comments=True, no_network=True)
+        else:
+            self._parser = _StdlibAdapter(self.handler)
+
+    def feed(self, data):
+        """Feeds the next chunk of the document."""
+        if not data:
+            return
+        if self.backend != 'lxml' and isinstance(data, bytes):
+            data = data.decode(self.encoding or 'utf-8', errors='replace')
+        self._parser.feed(data)
+
+    def close(self):
+        """Finishes parsing and returns the collected document."""
+        self._parser.close()
+        return self.handler.close()
+
+def parse_document(html, backend=HTML_PARSER_BACKEND, encoding=None):
+    """Parses a whole HTML document (bytes or text) in one pass."""
+    extractor = HTMLExtractor(backend=backend, encoding=encoding)
+    extractor.feed(html)
+    return extractor.close()
+
+def _json_ld_texts(document):
+    """Extracts text from common JSON-LD properties."""
+    texts = []
+    for raw in document.json_ld:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            for key in ['description', 'text', 'articleBody', 'name', 'headline']:
+                if key in data and isinstance(data[key], str):
+                    texts.append(data[key])
+    return texts
+
+def build_content(document, max_chars):
+    """Assembles page content from a parsed document: summaries, scored main content and fallbacks.
+
+    Returns (content, error) in the "Title: ...\\n\\nContent: ..." format.
+    """
+    # Structured data and meta descriptions summarize the page
+    text_parts = _json_ld_texts(document) + list(document.meta)
+
+    # Main content chosen by scoring the block tree
+    selection = score_document(document)
+    text_parts.extend(selection['main'])
+
+    # Too little main content: add the best of the remaining blocks, then attribute text
+    main_chars = sum(len(text) for text in selection['main'])
+    for text in selection['others'] + document.attribute_texts:
+        if main_chars >= CONTENT_MIN_CHARS:
+            break
+        text_parts.append(text)
+        main_chars += len(text)
+
+    # Enhanced page title from og:title or h1
+    title = document.title or "No title"
+    if document.og_title:
+        title = document.og_title
+    else:
+        first_h1 = next((text for _, text in document.block_texts({'h1'}, include_boilerplate=True)), None)
+        if first_h1 and len(first_h1) > len(title.strip()):
+            title = first_h1
+
+    # Clean and combine text, dropping repeated and nested blocks
+    cleaned_parts = (re.sub(r'\s+', ' ', text).strip() for text in text_parts)
+    unique_texts = deduplicate_blocks([text for text in cleaned_parts if len(text) > 5])
+
+    combined_text = ' '.join(unique_texts)
+    final_content = f"Title: {title}\n\nContent: {combined_text}"
+
+    # More lenient content threshold for JS-heavy sites
+    if len(combined_text) < 30:
+        # Last resort: any visible text except copyright lines
+        if not document.pieces:
+            return None, "No readable content found. The page might be entirely JavaScript-based or have access restrictions."
+
+        filtered_lines = []
+        for line in document.pieces:
+            lowered = line.lower()
+            if len(line) > 10 and not lowered.startswith(('©', 'copyright', 'all rights')):
+                filtered_lines.append(line)
+
+        if not filtered_lines:
+            return None, "No readable content found after filtering. The page might be entirely JavaScript-based."
+
+        cleaned_body = re.sub(r'\s+', ' ', ' '.join(filtered_lines[:50])).strip()
+        if len(cleaned_body) <= 30:
+            return None, "Insufficient content found. The page might require JavaScript or have access restrictions."
+        final_content = f"Title: {title}\n\nContent: {cleaned_body[:3000]}"
+
+    return final_content[:max_chars], None
+
+def extract_html_content(html, max_chars, backend=HTML_PARSER_BACKEND, encoding=None):
+    """Parses HTML in a single pass and assembles its content; returns (content, error)."""
+    return build_content(parse_document(html, backend=backend, encoding=encoding), max_chars)
+
+def extract_html_stream(chunks, max_chars, content_type=None, backend=HTML_PARSER_BACKEND, stats=None):
+    """Parses HTML as its bytes arrive and assembles its content; returns (content, error).
+
+    The encoding is resolved once from the first ENCODING_SAMPLE_BYTES, then
+    chunks are decoded and fed to the parser as they come. Reading stops once
+    the parsed text reaches HTML_STREAM_TEXT_FACTOR times max_chars, enough for
+    scoring to pick the main content, so the rest of a huge or endless page is
+    never downloaded. stats, if given, receives the bytes read, the encoding
+    and whether reading stopped early.
+    """
+    extractor = HTMLExtractor(backend=backend)
+    text_limit = max_chars * HTML_STREAM_TEXT_FACTOR
+    prefix = []
+    prefix_bytes = 0
+    bytes_read = 0
+    decoder = encoding = source = None
+    stopped_early = False
+
+    for chunk in chunks:
+        bytes_read += len(chunk)
+        if decoder is None:
+            prefix.append(chunk)
+            prefix_bytes += len(chunk)
+            if prefix_bytes < ENCODING_SAMPLE_BYTES:
+                continue
+            chunk = b"".join(prefix)
+            decoder, encoding, source, bom_length = stream_decoder(chunk, content_type)
+            chunk = chunk[bom_length:]
+        extractor.feed(decoder.decode(chunk))
+        if extractor.handler.text_chars >= text_limit:
+            stopped_early = True
+            break
+
+    if decoder is None:
+        # The whole body was shorter than the encoding sample
+        data = b"".join(prefix)
+        decoder, encoding, source, bom_length = stream_decoder(data, content_type)
+        extractor.feed(decoder.decode(data[bom_length:]))
+    extractor.feed(decoder.decode(b"", final=True))
+
+    if stats is not None:
+        stats.update({'bytes_read': bytes_read, 'stopped_early': stopped_early,
+                      'encoding': encoding, 'encoding_source': source})
+    return build_content(extractor.close(), max_chars)
+
+def _synthetic_page(size_bytes):
+    """Builds a realistic-looking HTML page of roughly size_bytes for benchmarking."""
+    head = ('<html><head><title>Benchmark page</title>'
+            '<meta name="description" content="A generated page used to benchmark extraction speed.">'
+            '<script type="application/ld+json">{"headline": "Benchmark", "description": "Generated"}</script>'
+            '<style>body { font-family: sans-serif; }</style></head><body>'
+            '<header><nav><a href="/">Home</a> <a href="/about">About</a></nav></header><main class="content">')
+    section = ('<section class="section"><h2>Section heading</h2><div class="inner"><p>Lorem ipsum dolor sit amet, '
+               'consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.</p>'
+               '<ul><li>First list item with some text</li><li>Second list item with <a href="#">a link</a></li></ul>'
+               '<table><tr><td>Cell one</td><td>Cell two</td></tr></table>'
+               '<span data-content="Data attribute text for the benchmark">x</span></div>'
+               '<script>var tracking = {"content": "not page text"};</script></section>')
+    tail = '</main><footer>Copyright 2024</footer></body></html>'
+    repeats = max(1, (size_bytes - len(head) - len(tail)) // len(section))
+    return (head + section * repeats + tail).encode('utf-8')
+
+def run_benchmark(paths=None, sizes_mb=(1, 5, 10), stream_chars=200000):
+    """Prints parse+extract time and peak memory per backend for large HTML pages.
+
+    A last row per page streams it in 64 KB chunks with a stream_chars content
+    limit and shows how much of the page had to be read.
+    """
+    import time
+    import tracemalloc
+
+    pages = []
+    if paths:
+        for path in paths:
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [(f"synthetic {size} MB", _synthetic_page(size * 1024 * 1024)) for size in sizes_mb]
+
+    backends = ['html.parser'] + (['lxml'] if etree is not None else [])
+    for name, html in pages:
+        print(f"{name} ({len(html) / 1024 / 1024:.1f} MB)")
+        for backend in backends:
+            start = time.perf_counter()
+            content, error = extract_html_content(html, max_chars=10 ** 9, backend=backend)
+            elapsed = time.perf_counter() - start
+
+            # Memory is measured in a separate run because tracing slows parsing down
+            tracemalloc.start()
+            extract_html_content(html, max_chars=10 ** 9, backend=backend)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {backend:12s} {elapsed * 1000:9.1f} ms  peak {peak / 1024 / 1024:7.1f} MB  "
+                  f"{len(content or '') / 1024:8.0f} KB text{'  ' + error if error else ''}")
+
+        stats = {}
+        chunks = (html[i:i + 65536] for i in range(0, len(html), 65536))
+        start = time.perf_counter()
+        extract_html_stream(chunks, stream_chars, stats=stats)
+        elapsed = time.perf_counter() - start
+        print(f"  {'streamed':12s} {elapsed * 1000:9.1f} ms  read {stats['bytes_read'] / 1024 / 1024:5.1f} MB"
+              f"{' (stopped early)' if stats['stopped_early'] else ''}")
+
+if __name__ == "__main__":
+    import sys
+    run_benchmark(sys.argv[1:])
@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Background job configuration (overridable through environment variables)
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "8"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class JobCancelled(Exception):
+    """Raised inside a job function to stop early after the job was cancelled."""
+
+class Job:
+    """Handle of one background task, safe to keep in session state across reruns.
+
+    The job function receives the handle as its first argument, reports progress
+    with update() and checks cancel_event (or calls check_cancelled()) between
+    steps. Readers poll status, snapshot() and result from the script thread.
+    """
+
+    def __init__(self, key, description=""):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self._message = ""
+        self._progress = {}
+        self._subscribers = 1
+        self._future = None
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, message=None, **progress):
+        """Reports progress: a status line and/or named values such as partial text."""
+        with self._lock:
+            if message is not None:
+                self._message = message
+            self._progress.update(progress)
+
+    def snapshot(self):
+        """Returns (message, progress) as last reported."""
+        with self._lock:
+            return self._message, dict(self._progress)
+
+    def check_cancelled(self):
+        """Raises JobCancelled once the job was cancelled."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def done(self):
+        """Checks whether the job has finished, failed or was cancelled."""
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def wait(self, timeout=None):
+        """Blocks until the job is over; returns whether it is."""
+        return self._finished.wait(timeout)
+
+    def elapsed(self):
+        """Seconds since the job started running (or until it finished)."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class JobManager:
+    """Runs jobs on a process-wide executor, shared by all Streamlit sessions.
+
+    Submitting a key that is already pending or running returns the existing
+    job instead of starting a second one, so sessions loading the same page
+    share one extraction. Cancelling detaches the caller; the work itself stops
+    only when no other session is waiting for it.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def submit(self, key, fn, *args, description="", **kwargs):
+        """Starts fn(job, *args, **kwargs) in the background, or joins the identical in-flight job."""
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and not job.cancel_event.is_set():
+                job._subscribers += 1
+                self._stats['deduplicated'] += 1
+                return job
+
+            job = Job(key, description)
+            self._active[key] = job
+            self._stats['submitted'] += 1
+            job._future = self._executor.submit(self._run, job, fn, args, kwargs)
+            return job
+
+    def cancel(self, job):
+        """Detaches one caller from the job; returns True if this stopped the work."""
+        with self._lock:
+            if job.done():
+                return False
+            job._subscribers -= 1
+            if job._subscribers > 0:
+                return False
+            job.cancel_event.set()
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            if job._future.cancel():
+                # Never started, so _run will not record the outcome
+                self._finish(job, CANCELLED)
+        return True
+
+    def stats(self):
+        """Returns job counters and how many jobs are in flight."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = len(self._active)
+        return stats
+
+    def _run(self, job, fn, args, kwargs):
+        """Runs one job and records its outcome."""
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            job.result = fn(job, *args, **kwargs)
+            status = CANCELLED if job.cancel_event.is_set() else DONE
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.description or job.key} failed: {str(e)}")
+            job.error = e
+            status = FAILED
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            self._finish(job, status)
+
+    def _finish(self, job, status):
+        """Marks the job as over; the caller holds the lock."""
+        job.finished = time.time()
+        job.status = status
+        self._stats['completed' if status == DONE else status] += 1
+        job._finished.set()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """Returns the process-wide job manager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
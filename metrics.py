@@ -0,0 +1,275 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Instrumentation configuration (overridable through environment variables)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond parsing to minute-long summaries
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every exported metric name
+METRICS_NAMESPACE = "webagent"
+
+_HELP = {
+    'stage_seconds': "Duration of one pipeline stage",
+    'llm_seconds': "Gemini API call latency until the complete answer, rate-limit waits and retries included",
+    'llm_ttft_seconds': "Time to the first streamed answer token",
+}
+
+class Histogram:
+    """Latency distribution: cumulative buckets for export plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=METRICS_BUCKETS, window=METRICS_WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=max(1, window))
+
+    def observe(self, value):
+        """Adds one sample."""
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self):
+        """Returns count, mean and the p50/p95/p99 of the recent samples, in seconds."""
+        ordered = sorted(self.recent)
+        summary = {'count': self.count, 'mean': self.sum / self.count if self.count else None}
+        for q in (50, 95, 99):
+            summary[f'p{q}'] = _nearest_rank(ordered, q)
+        return summary
+
+def _nearest_rank(ordered, q):
+    """Returns the q-th percentile (0-100) of sorted samples, or None without samples."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+class MetricsRegistry:
+    """Process-wide latency histograms keyed by metric name and labels.
+
+    Everything the pipeline times ends up here, whichever thread or session
+    recorded it, so percentiles describe the whole process. Worker processes
+    (PDF parsing, bulk runs with --processes) keep registries of their own.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, name, seconds, **labels):
+        """Records one duration in the histogram for name and labels."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Returns {name: [{labels, count, mean, p50, p95, p99}]} for every histogram."""
+        with self._lock:
+            items = [(name, dict(labels), histogram.summary()) for (name, labels), histogram in self._histograms.items()]
+        snapshot = {}
+        for name, labels, summary in sorted(items, key=lambda item: (item[0], sorted(item[1].items()))):
+            snapshot.setdefault(name, []).append(dict(summary, labels=labels))
+        return snapshot
+
+    def to_json(self):
+        """Returns the snapshot as a JSON document."""
+        return json.dumps({'started': self.started, 'generated': time.time(), 'metrics': self.snapshot()}, indent=2)
+
+    def dump(self, path):
+        """Writes the JSON snapshot to a file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+
+    def prometheus_text(self):
+        """Renders all histograms in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(((name, labels, list(histogram.bucket_counts), histogram.sum, histogram.count)
+                            for (name, labels), histogram in self._histograms.items()))
+        lines = []
+        described = set()
+        for name, labels, bucket_counts, total, count in items:
+            metric = f"{METRICS_NAMESPACE}_{name}"
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {metric} {_HELP.get(name, name.replace('_', ' '))}")
+                lines.append(f"# TYPE {metric} histogram")
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+            cumulative = 0
+            for bound, bucket_count in zip(METRICS_BUCKETS + ("+Inf",), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{metric}_sum{suffix} {total}")
+            lines.append(f"{metric}_count{suffix} {count}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value):
+    """Escapes a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Trace:
+    """The spans of one request, e.g. one page load, in the order they finished.
+
+    Spans can be added from any thread; work handed to executors joins the
+    trace when submitted through contextvars.copy_context().run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, start=None, **attrs):
+        """Appends a finished span; start is its perf_counter start (now - seconds by default)."""
+        start = (start if start is not None else time.perf_counter() - seconds) - self.started
+        with self._lock:
+            self.spans.append(dict(attrs, stage=stage, start=max(0.0, start), seconds=seconds))
+
+    def elapsed(self):
+        """Seconds since the trace began."""
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """Returns the spans ordered by start time."""
+        with self._lock:
+            return sorted(self.spans, key=lambda span: span['start'])
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace():
+    """Returns the trace of the request being handled in this context, or None."""
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(name=None, trace=None):
+    """Makes a new Trace (or an earlier one, to add later stages to it) current for the block and yields it."""
+    trace = trace if trace is not None else Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def record_span(stage, seconds, start=None, **attrs):
+    """Records an already measured stage duration in the histograms and the current trace."""
+    if not METRICS_ENABLED:
+        return
+    get_metrics().observe('stage_seconds', seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds, start=start, **attrs)
+
+@contextmanager
+def span(stage, **attrs):
+    """Times the block as one stage; attrs passed along are kept on the trace span.
+
+    A block that raises is still recorded, with error set on its span.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException:
+        attrs['error'] = True
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - start, start=start, **attrs)
+
+def observe(name, seconds, **labels):
+    """Records a duration in a named histogram other than stage_seconds (e.g. llm_seconds)."""
+    if METRICS_ENABLED:
+        get_metrics().observe(name, seconds, **labels)
+
+def serve_metrics(registry, port, host="0.0.0.0"):
+    """Serves /metrics (Prometheus text) and /metrics.json from a background thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body, content_type = registry.prometheus_text(), "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body, content_type = registry.to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_metrics():
+    """Returns the process-wide registry, starting the /metrics endpoint on first use if METRICS_PORT is set."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+            if METRICS_PORT:
+                try:
+                    serve_metrics(_registry, METRICS_PORT)
+                except OSError as e:
+                    # Another process (e.g. a second Streamlit worker) already serves the port
+                    logger.warning(f"Metrics endpoint not started on port {METRICS_PORT}: {str(e)}")
+        return _registry
+
+def run_benchmark(iterations=200000):
+    """Measures what a span costs and prints the percentiles of a synthetic stage."""
+    import random
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter() - start
+
+    with start_trace("benchmark") as trace:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with span("noop"):
+                pass
+        elapsed = time.perf_counter() - start
+    print(f"span overhead: {(elapsed - baseline) / iterations * 1e6:.2f} µs per span "
+          f"({len(trace.spans):,} spans traced)")
+
+    rng = random.Random(3)
+    for _ in range(10000):
+        record_span("synthetic", rng.lognormvariate(-2.5, 0.8))
+    summary = next(entry for entry in get_metrics().snapshot()['stage_seconds']
+                   if entry['labels'].get('stage') == "synthetic")
+    print(f"synthetic stage: {summary['count']:,} samples, p50 {summary['p50'] * 1000:.1f} ms, "
+          f"p95 {summary['p95'] * 1000:.1f} ms, p99 {summary['p99'] * 1000:.1f} ms (last {METRICS_WINDOW:,})")
+    return summary
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,113 @@
+import logging
+import os
+import time
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+# Readiness configuration (overridable through environment variables)
+PAGE_READY_TIMEOUT = float(os.getenv("PAGE_READY_TIMEOUT", "8"))
+PAGE_READY_SCROLL_TIMEOUT = float(os.getenv("PAGE_READY_SCROLL_TIMEOUT", "3"))
+PAGE_READY_QUIET_WINDOW = float(os.getenv("PAGE_READY_QUIET_WINDOW", "0.5"))
+PAGE_READY_POLL_INTERVAL = 0.1
+
+# Installs a mutation observer and fetch/XHR hooks once per document so the
+# probe below can tell when the DOM and the network have gone quiet.
+_INSTALL_MONITOR_JS = """
+if (!window.__pageReadiness) {
+    var state = {lastMutation: performance.now(), inflight: 0};
+    window.__pageReadiness = state;
+    try {
+        new MutationObserver(function() {
+            state.lastMutation = performance.now();
+        }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    } catch (e) {}
+
+    var done = function() { state.inflight = Math.max(0, state.inflight - 1); };
+    if (window.fetch) {
+        var originalFetch = window.fetch;
+        window.fetch = function() {
+            state.inflight++;
+            return originalFetch.apply(this, arguments).then(
+                function(r) { done(); return r; },
+                function(e) { done(); throw e; });
+        };
+    }
+    var originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        state.inflight++;
+        this.addEventListener('loadend', done);
+        return originalSend.apply(this, arguments);
+    };
+}
+"""
+
+_PROBE_JS = """
+var state = window.__pageReadiness || {lastMutation: 0, inflight: 0};
+var lastResourceEnd = 0;
+var resources = performance.getEntriesByType('resource');
+for (var i = 0; i < resources.length; i++) {
+    lastResourceEnd = Math.max(lastResourceEnd, resources[i].responseEnd);
+}
+return {
+    readyState: document.readyState,
+    now: performance.now(),
+    lastMutation: state.lastMutation,
+    lastResourceEnd: lastResourceEnd,
+    inflight: state.inflight,
+    resources: resources.length,
+    loadingIndicator: !!document.querySelector('.loading, .spinner, [data-loading]')
+};
+"""
+
+def wait_for_page_ready(driver, timeout=PAGE_READY_TIMEOUT, quiet_window=PAGE_READY_QUIET_WINDOW, cancel_event=None):
+    """Waits until the document is loaded, the network is idle and the DOM has stopped changing.
+
+    Returns early with 'cancelled' set when cancel_event is set by another thread.
+    """
+    start = time.monotonic()
+    quiet_ms = quiet_window * 1000
+    started_at = None
+    state = {}
+
+    try:
+        driver.execute_script(_INSTALL_MONITOR_JS)
+    except WebDriverException as e:
+        logger.debug(f"Readiness monitor could not be installed: {str(e)}")
+
+    while True:
+        try:
+            state = driver.execute_script(_PROBE_JS) or {}
+        except WebDriverException as e:
+            logger.debug(f"Readiness probe failed: {str(e)}")
+            state = {}
+
+        elapsed = time.monotonic() - start
+        if state:
+            if started_at is None:
+                started_at = state['now']
+            # Quiet time is measured from the last activity, but never from before
+            # this wait began, so content triggered just before (e.g. by a scroll)
+            # always gets at least one full quiet window to appear.
+            last_activity = max(state['lastMutation'], state['lastResourceEnd'], started_at)
+            quiet_for = state['now'] - last_activity
+
+            if (state['readyState'] != 'loading' and state['inflight'] == 0
+                    and not state['loadingIndicator'] and quiet_for >= quiet_ms):
+                return {'ready': True, 'elapsed': elapsed, 'resources': state['resources']}
+
+        if cancel_event is not None and cancel_event.is_set():
+            return {'ready': False, 'cancelled': True, 'elapsed': elapsed, 'resources': state.get('resources', 0)}
+
+        if elapsed >= timeout:
+            logger.info(f"Page readiness ceiling reached after {elapsed:.2f}s: {state}")
+            return {'ready': False, 'elapsed': elapsed, 'resources': state.get('resources', 0)}
+
+        time.sleep(PAGE_READY_POLL_INTERVAL)
+
+def load_lazy_content(driver, timeout=PAGE_READY_SCROLL_TIMEOUT, quiet_window=PAGE_READY_QUIET_WINDOW, cancel_event=None):
+    """Scrolls to the bottom to trigger lazy loading, waits for it to settle, then scrolls back."""
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    readiness = wait_for_page_ready(driver, timeout=timeout, quiet_window=quiet_window, cancel_event=cancel_event)
+    driver.execute_script("window.scrollTo(0, 0);")
+    return readiness
@@ -0,0 +1,175 @@
+import logging
+import os
+from retrieval import RAG_TOP_K
+from token_counter import get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Prompt budgets per request type (overridable through environment variables)
+PROMPT_INPUT_BUDGETS = {
+    'question': int(os.getenv("PROMPT_BUDGET_QUESTION", "4000")),
+    'summary': int(os.getenv("PROMPT_BUDGET_SUMMARY", "8000")),
+    'memory': int(os.getenv("PROMPT_BUDGET_MEMORY", "3000")),
+    'batch': int(os.getenv("PROMPT_BUDGET_BATCH", "8000"))
+}
+PROMPT_OUTPUT_TOKENS = {
+    'question': int(os.getenv("PROMPT_OUTPUT_TOKENS_QUESTION", "1024")),
+    'summary': int(os.getenv("PROMPT_OUTPUT_TOKENS_SUMMARY", "2048")),
+    'memory': int(os.getenv("PROMPT_OUTPUT_TOKENS_MEMORY", "600")),
+    'batch': int(os.getenv("PROMPT_OUTPUT_TOKENS_BATCH", "4096"))
+}
+PROMPT_MAX_TURNS = int(os.getenv("PROMPT_MAX_TURNS", "4"))
+
+DEFAULT_INPUT_BUDGET = 8000
+DEFAULT_OUTPUT_TOKENS = 2048
+
+def input_budget(request_type):
+    """Returns the prompt token budget for a request type."""
+    return PROMPT_INPUT_BUDGETS.get(request_type, DEFAULT_INPUT_BUDGET)
+
+def output_tokens(request_type):
+    """Returns the maxOutputTokens setting for a request type."""
+    return PROMPT_OUTPUT_TOKENS.get(request_type, DEFAULT_OUTPUT_TOKENS)
+
+def fit_text(text, max_tokens, counter=None):
+    """Shortens text at a word boundary so that it fits in max_tokens."""
+    counter = counter or get_token_counter()
+    tokens = counter.count(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    # Estimates are close to proportional to length, so the first guess rarely needs shrinking
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0 and counter.count(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    space = text.rfind(' ', 0, cut)
+    if space > cut // 2:
+        cut = space
+    return text[:cut].rstrip() + " …"
+
+class PromptBuilder:
+    """Assembles a prompt from prioritized sections within a token budget.
+
+    Sections are filled in priority order (lowest first) and each section's
+    items in preference order until the budget is spent; items that do not fit
+    are dropped, or shortened when the section allows it. The prompt renders
+    sections in the order they were added and items in their own order, so the
+    most relevant context survives while the text still reads naturally.
+    """
+
+    def __init__(self, request_type, budget=None, counter=None):
+        self.request_type = request_type
+        self.budget = budget if budget is not None else input_budget(request_type)
+        self.counter = counter or get_token_counter()
+        self._sections = []
+        self.report = {}
+
+    def add(self, name, text, priority=0, heading=None, truncate=True):
+        """Adds a single-text section; with truncate it is shortened rather than dropped."""
+        if text:
+            self.add_items(name, [text], priority=priority, heading=heading, truncate=truncate)
+        return self
+
+    def add_items(self, name, items, priority=0, heading=None, truncate=False, order=None, separator="\n\n"):
+        """Adds a section of interchangeable items listed best first.
+
+        order gives each item's position in the rendered prompt (default: as listed).
+        """
+        self._sections.append({
+            'name': name,
+            'items': list(items),
+            'order': list(order) if order is not None else list(range(len(items))),
+            'priority': priority,
+            'heading': heading,
+            'truncate': truncate,
+            'separator': separator
+        })
+        return self
+
+    def build(self):
+        """Returns the prompt text; self.report describes what each section used and dropped."""
+        remaining = self.budget
+        chosen = {}
+        sections_report = {}
+        for index, section in sorted(enumerate(self._sections), key=lambda pair: pair[1]['priority']):
+            heading_cost = self.counter.count(section['heading']) if section['heading'] else 0
+            taken = []
+            used = 0
+            dropped = 0
+            for order, item in zip(section['order'], section['items']):
+                cost = self.counter.count(item) + (heading_cost if not taken else 0)
+                if cost <= remaining:
+                    taken.append((order, item))
+                elif section['truncate'] and remaining > heading_cost + 20:
+                    item = fit_text(item, remaining - (heading_cost if not taken else 0), self.counter)
+                    cost = self.counter.count(item) + (heading_cost if not taken else 0)
+                    taken.append((order, item))
+                else:
+                    dropped += 1
+                    continue
+                remaining -= cost
+                used += cost
+            chosen[index] = taken
+            sections_report[section['name']] = {'tokens': used, 'items': len(taken), 'dropped': dropped}
+
+        parts = []
+        for index, section in enumerate(self._sections):
+            taken = chosen.get(index)
+            if not taken:
+                continue
+            body = section['separator'].join(item for _, item in sorted(taken, key=lambda pair: pair[0]))
+            parts.append(f"{section['heading']}\n{body}" if section['heading'] else body)
+
+        prompt = "\n\n".join(parts)
+        self.report = {
+            'type': self.request_type,
+            'budget': self.budget,
+            'tokens': self.budget - remaining,
+            'sections': sections_report
+        }
+        if any(s['dropped'] for s in sections_report.values()):
+            logger.debug(f"Prompt budget trimmed sections: {sections_report}")
+        return prompt
+
+def format_turn(turn):
+    """Renders one conversation turn for a prompt."""
+    return f"User: {turn['question']}\nAssistant: {turn['answer']}"
+
+def question_prompt(question, chunk_index, conversation=None, memory_summary="", top_k=None, budget=None,
+                    cached_context=False):
+    """Builds the question-answering prompt from the page's best chunks and the conversation so far.
+
+    conversation holds the turns to include verbatim and memory_summary the
+    running summary of older ones. Returns (prompt, report). The question and
+    instructions are always kept; the remaining budget goes to the title, then
+    the chunks ranked most relevant, then the conversation summary and the most
+    recent turns, then the page description. With cached_context the whole page
+    is already held in a Gemini cached context, so no page text is added.
+    """
+    turns = list(conversation or [])
+
+    builder = PromptBuilder('question', budget=budget)
+    if cached_context:
+        builder.add('instructions', "Using the website content you were given, please answer the user's question "
+                                    "comprehensively and accurately:", priority=0)
+    else:
+        ranked = chunk_index.rank(question) or list(range(len(chunk_index.chunks)))
+        ranked = ranked[:top_k or RAG_TOP_K]
+        builder.add('instructions', "Based on the following excerpts from a website, please answer the user's "
+                                    "question comprehensively and accurately:", priority=0)
+        builder.add('title', f"Website Title: {chunk_index.title}", priority=1)
+        builder.add('description', f"Website Description: {chunk_index.description}" if chunk_index.description else "",
+                    priority=4)
+        builder.add_items('content', [chunk_index.chunks[i] for i in ranked], priority=2, truncate=True,
+                          heading="Relevant Website Content:", order=ranked, separator="\n\n---\n\n")
+    builder.add('memory', memory_summary, priority=3, heading="Summary of the Conversation So Far:")
+    # Newest turns are the most useful, but they read best in chronological order
+    builder.add_items('conversation', [format_turn(turn) for turn in reversed(turns)], priority=3,
+                      heading="Earlier Conversation:", order=range(len(turns), 0, -1))
+    builder.add('question', f"User Question: {question}", priority=0)
+    builder.add('closing', "Please provide a detailed, helpful response based solely on the website content "
+                           "provided.", priority=0)
+    prompt = builder.build()
+    return prompt, builder.report
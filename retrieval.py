@@ -0,0 +1,218 @@
+import logging
+import math
+import os
+import re
+import zlib
+from collections import Counter, defaultdict
+from token_counter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Retrieval configuration (overridable through environment variables)
+# Smaller (or zero) chunk sizes are raised to this many characters
+RAG_MIN_CHUNK_SIZE = 100
+RAG_CHUNK_SIZE = max(RAG_MIN_CHUNK_SIZE, int(os.getenv("RAG_CHUNK_SIZE", "1500")))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "6"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "2000"))
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or that the
+this to was what when where which who why will with you your do does can about
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+_DESCRIPTION_PATTERN = re.compile(r"Meta Description: (.+?[.!?])(?=\s|$)")
+
+def tokenize(text):
+    """Lowercases text and splits it into index terms, dropping stopwords."""
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def chunk_text(text, chunk_size=RAG_CHUNK_SIZE, overlap=RAG_CHUNK_OVERLAP):
+    """Splits text into overlapping chunks of about chunk_size characters on sentence boundaries.
+
+    Besides filling up, a chunk also ends after a sentence whose checksum hits a
+    fixed pattern once it is half full. These content-defined boundaries make
+    chunking resynchronize right after an edit, so a page that changed in one
+    place keeps the same chunks everywhere else.
+    """
+    if chunk_size <= 0:
+        # Hard-splitting long sentences would never make progress
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    overlap = max(0, min(overlap, chunk_size // 2))
+    divisor = max(1, chunk_size // 200)
+    sentences = [s for s in _SENTENCE_PATTERN.split(text) if s.strip()]
+    chunks = []
+    current = []
+    current_len = 0
+
+    for sentence in sentences:
+        # Hard-split sentences that are longer than a whole chunk
+        while len(sentence) > chunk_size:
+            if current:
+                chunks.append(' '.join(current))
+                current, current_len = [], 0
+            chunks.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size - overlap:]
+
+        if current and current_len + len(sentence) + 1 > chunk_size:
+            chunks.append(' '.join(current))
+            # Carry trailing sentences over so context spans chunk boundaries
+            carried = []
+            carried_len = 0
+            for previous in reversed(current):
+                if carried_len + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_len += len(previous) + 1
+            current, current_len = carried, carried_len
+
+        current.append(sentence)
+        current_len += len(sentence) + 1
+
+        if current_len >= chunk_size // 2 and zlib.crc32(sentence.encode('utf-8')) % divisor == 0:
+            chunks.append(' '.join(current))
+            carried = []
+            carried_len = 0
+            for previous in reversed(current):
+                if carried_len + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_len += len(previous) + 1
+            current, current_len = carried, carried_len
+
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+class BM25Index:
+    """Okapi BM25 lexical ranker over a list of text chunks.
+
+    term_counts optionally holds each chunk's already tokenized term Counter.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75, term_counts=None):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+
+        for doc_id, chunk in enumerate(chunks):
+            terms = term_counts[doc_id] if term_counts is not None else Counter(tokenize(chunk))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings[term].append((doc_id, frequency))
+
+        self.doc_count = len(chunks)
+        self.avg_length = sum(self.doc_lengths) / self.doc_count if self.doc_count else 0.0
+
+    def score(self, query):
+        """Returns a {doc_id: score} mapping for documents matching any query term."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (self.doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+        return scores
+
+_embedding_model = None
+
+def load_embedding_model():
+    """Loads the optional local sentence embedding model, or returns None."""
+    global _embedding_model
+    if not RAG_EMBEDDING_MODEL:
+        return None
+    if _embedding_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+            _embedding_model = SentenceTransformer(RAG_EMBEDDING_MODEL)
+        except ImportError:
+            logger.warning("sentence-transformers is not installed, using BM25 retrieval only")
+            return None
+        except Exception as e:
+            logger.error(f"Embedding model could not be loaded: {str(e)}")
+            return None
+    return _embedding_model
+
+class ChunkIndex:
+    """Searchable chunks of one page's content, built once per load.
+
+    When the page is reloaded, passing the previous index as previous reuses
+    the term counts and embeddings of every chunk that did not change, so only
+    the edited parts of the page are tokenized and embedded again.
+    """
+
+    def __init__(self, content, chunk_size=RAG_CHUNK_SIZE, overlap=RAG_CHUNK_OVERLAP, previous=None):
+        # Extracted content starts with a "Title: ..." line that is kept out of the chunks
+        title, _, body = content.partition("\n\nContent: ")
+        if not body:
+            title, body = "", content
+        self.title = title.replace("Title: ", "", 1).strip()
+        description = _DESCRIPTION_PATTERN.search(body[:2000])
+        self.description = description.group(1) if description else ""
+        self.chunks = chunk_text(body, chunk_size, overlap)
+
+        known = {chunk: i for i, chunk in enumerate(previous.chunks)} if previous is not None else {}
+        self.reused = sum(1 for chunk in self.chunks if chunk in known)
+        self.term_counts = [previous.term_counts[known[chunk]] if chunk in known else Counter(tokenize(chunk))
+                            for chunk in self.chunks]
+        self.bm25 = BM25Index(self.chunks, term_counts=self.term_counts)
+        self.embeddings = None
+
+        model = load_embedding_model()
+        if model is not None and self.chunks:
+            try:
+                self.embeddings = self._embed(model, previous, known)
+            except Exception as e:
+                logger.error(f"Chunk embedding failed, using BM25 only: {str(e)}")
+
+    def _embed(self, model, previous, known):
+        """Embeds the chunks, copying the vectors of chunks the previous index already embedded."""
+        if previous is None or previous.embeddings is None or not self.reused:
+            return model.encode(self.chunks, normalize_embeddings=True)
+        import numpy
+
+        new = [i for i, chunk in enumerate(self.chunks) if chunk not in known]
+        vectors = dict(zip(new, model.encode([self.chunks[i] for i in new], normalize_embeddings=True))) if new else {}
+        return numpy.array([vectors[i] if i in vectors else previous.embeddings[known[chunk]]
+                            for i, chunk in enumerate(self.chunks)])
+
+    def rank(self, query):
+        """Returns chunk ids ordered by relevance to the query."""
+        lexical = self.bm25.score(query)
+        rankings = [sorted(lexical, key=lexical.get, reverse=True)]
+
+        if self.embeddings is not None:
+            query_vector = load_embedding_model().encode([query], normalize_embeddings=True)[0]
+            similarities = self.embeddings @ query_vector
+            rankings.append(sorted(range(len(self.chunks)), key=lambda i: similarities[i], reverse=True))
+
+        # Reciprocal rank fusion combines lexical and semantic rankings without score calibration
+        fused = defaultdict(float)
+        for ranking in rankings:
+            for position, doc_id in enumerate(ranking):
+                fused[doc_id] += 1.0 / (60 + position)
+        return sorted(fused, key=fused.get, reverse=True)
+
+    def retrieve(self, query, top_k=RAG_TOP_K, token_budget=RAG_TOKEN_BUDGET):
+        """Returns the most relevant chunks within the token budget, in page order."""
+        ranked = self.rank(query)
+        if not ranked:
+            # Nothing matched lexically; fall back to the start of the page
+            ranked = list(range(len(self.chunks)))
+
+        selected = []
+        used = 0
+        for doc_id in ranked[:top_k]:
+            cost = estimate_tokens(self.chunks[doc_id])
+            if selected and used + cost > token_budget:
+                continue
+            selected.append(doc_id)
+            used += cost
+        return [self.chunks[i] for i in sorted(selected)]
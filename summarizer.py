@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from token_counter import estimate_tokens
+from prompt_builder import fit_text, input_budget
+
+logger = logging.getLogger(__name__)
+
+# Summarization configuration (overridable through environment variables)
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "12000"))
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+
+# Tokens reserved for the instructions wrapped around page text
+PROMPT_OVERHEAD_TOKENS = 100
+
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+def split_stable_chunks(text, target_size=SUMMARY_CHUNK_SIZE):
+    """Splits text into chunks whose boundaries depend only on nearby content.
+
+    A chunk ends at a sentence whose checksum hits a fixed pattern (once the chunk
+    is at least half the target size) or when it reaches twice the target size.
+    Editing one paragraph therefore only changes the chunks around it, so the
+    other chunk summaries stay cached.
+    """
+    min_size = target_size // 2
+    max_size = target_size * 2
+    divisor = max(1, target_size // 200)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for sentence in _SENTENCE_PATTERN.split(text):
+        if not sentence.strip():
+            continue
+        current.append(sentence)
+        current_len += len(sentence) + 1
+        boundary = zlib.crc32(sentence.encode('utf-8')) % divisor == 0
+        if current_len >= max_size or (current_len >= min_size and boundary):
+            chunks.append(' '.join(current))
+            current, current_len = [], 0
+
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+def direct_summary_prompt(content):
+    """Builds the single-call summary prompt for content that fits in one chunk."""
+    return f"""
+            Please provide a comprehensive summary of the following website content.
+            Include key points, main topics, and important information:
+
+            {content}
+            """
+
+def map_prompt(title, chunk, index, total):
+    """Builds the prompt that summarizes one section of a long page."""
+    return f"""
+            The following is section {index} of {total} of the website "{title}".
+            Summarize this section, keeping all key points, facts, names and figures:
+
+            {chunk}
+            """
+
+def reduce_prompt(title, partial_summaries):
+    """Builds the prompt that merges section summaries into one summary."""
+    sections = "\n\n".join(f"Section {i}:\n{summary}" for i, summary in enumerate(partial_summaries, 1))
+    return f"""
+            The following are summaries of consecutive sections of the website "{title}".
+            Please combine them into one comprehensive summary of the whole website.
+            Include key points, main topics, and important information:
+
+            {sections}
+            """
+
+class MapReduceSummarizer:
+    """Summarizes long content by summarizing chunks in parallel and merging the results.
+
+    llm is a blocking prompt -> text function that raises on failure; stream_llm
+    optionally streams the final merge step. Failed sections are skipped, and
+    the last failure is raised only when no section could be summarized. Chunk summaries
+    are kept in chunk_cache (keyed by chunk hash) so unchanged chunks are reused, and so
+    are merges of unchanged groups (keyed by prompt hash), which makes summarizing an
+    edited page again cost roughly the edited sections. prune_cache() drops the
+    entries the last summary did not use.
+    Text sent in any one prompt is trimmed to token_budget (the "summary" prompt
+    budget by default).
+    """
+
+    def __init__(self, llm, stream_llm=None, chunk_size=SUMMARY_CHUNK_SIZE,
+                 max_workers=SUMMARY_MAX_WORKERS, chunk_cache=None, token_budget=None):
+        self.llm = llm
+        self.stream_llm = stream_llm
+        self.chunk_size = chunk_size
+        self.max_workers = max(1, max_workers)
+        self.chunk_cache = chunk_cache if chunk_cache is not None else {}
+        # Leave room for the instructions around the page text
+        self.text_budget = (token_budget or input_budget('summary')) - PROMPT_OVERHEAD_TOKENS
+        self.report = {}
+        self._last_error = None
+        self._used_keys = set()
+
+    def summarize(self, content, on_text=None):
+        """Returns the summary of content; on_text receives the partial text while streaming."""
+        start = time.monotonic()
+        self.report = {'stages': []}
+        self._last_error = None
+        self._used_keys = set()
+
+        title, _, body = content.partition("\n\nContent: ")
+        if not body:
+            title, body = "", content
+        title = title.replace("Title: ", "", 1).strip()
+
+        chunks = split_stable_chunks(body, self.chunk_size)
+        if len(chunks) <= 1:
+            final_prompt = direct_summary_prompt(fit_text(content, self.text_budget))
+        else:
+            partials = self._map(title, chunks)
+            if not partials:
+                raise self._last_error or RuntimeError("Unable to summarize any section of the website")
+
+            # Merge in rounds until the partial summaries fit in one final prompt
+            while len(partials) > 1 and sum(len(p) for p in partials) > self.chunk_size:
+                partials = self._reduce_round(title, partials)
+            final_prompt = reduce_prompt(title, [fit_text(p, self.text_budget // len(partials)) for p in partials])
+
+        summary = self._final(final_prompt, on_text)
+
+        stages = self.report['stages']
+        for stage in stages:
+            stage.pop('started', None)
+        self.report['total'] = {
+            'calls': sum(s['calls'] for s in stages),
+            'cached': sum(s['cached'] for s in stages),
+            'input_tokens': sum(s['input_tokens'] for s in stages),
+            'output_tokens': sum(s['output_tokens'] for s in stages),
+            'seconds': time.monotonic() - start,
+            'chunks': len(chunks)
+        }
+        return summary
+
+    def prune_cache(self):
+        """Removes cached summaries the last summarize() call did not use; returns how many were removed.
+
+        Keeps a long-lived chunk_cache at the size of the current page instead
+        of growing with every page and reload summarized in a session.
+        """
+        stale = [key for key in list(self.chunk_cache) if key not in self._used_keys]
+        for key in stale:
+            self.chunk_cache.pop(key, None)
+        return len(stale)
+
+    def _map(self, title, chunks):
+        """Summarizes all chunks concurrently, reusing cached chunk summaries."""
+        stage = self._new_stage("map")
+        keys = [hashlib.sha256(chunk.encode('utf-8')).hexdigest() for chunk in chunks]
+        self._used_keys.update(keys)
+        results = [self.chunk_cache.get(key) for key in keys]
+        stage['cached'] = sum(1 for r in results if r is not None)
+
+        pending = [i for i, r in enumerate(results) if r is None]
+        prompts = {i: map_prompt(title, fit_text(chunks[i], self.text_budget), i + 1, len(chunks)) for i in pending}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for i, summary in zip(pending, executor.map(lambda i: self._call(prompts[i]), pending)):
+                self._count_call(stage, prompts[i], summary)
+                if summary:
+                    results[i] = summary
+                    self.chunk_cache[keys[i]] = summary
+                else:
+                    logger.warning(f"Section {i + 1} summary failed: {self._last_error}")
+                    stage['failures'] += 1
+
+        stage['seconds'] = time.monotonic() - stage['started']
+        return [r for r in results if r is not None]
+
+    def _reduce_round(self, title, partials):
+        """Merges groups of partial summaries concurrently into fewer, larger ones."""
+        stage = self._new_stage("reduce")
+        groups = []
+        current = []
+        for partial in partials:
+            if current and sum(len(p) for p in current) + len(partial) > self.chunk_size:
+                groups.append(current)
+                current = []
+            current.append(partial)
+        groups.append(current)
+
+        # Make progress even if every group holds a single oversized summary
+        if len(groups) == len(partials):
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+
+        prompts = [reduce_prompt(title, group) for group in groups]
+        keys = ["reduce:" + hashlib.sha256(prompt.encode('utf-8')).hexdigest() for prompt in prompts]
+        self._used_keys.update(keys)
+        merged = [self.chunk_cache.get(key) for key in keys]
+        stage['cached'] = sum(1 for m in merged if m is not None)
+
+        pending = [i for i, m in enumerate(merged) if m is None]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for i, summary in zip(pending, executor.map(lambda i: self._call(prompts[i]), pending)):
+                self._count_call(stage, prompts[i], summary)
+                if summary:
+                    merged[i] = summary
+                    self.chunk_cache[keys[i]] = summary
+                else:
+                    # Keep the unmerged summaries rather than losing sections
+                    stage['failures'] += 1
+                    merged[i] = "\n".join(groups[i])
+
+        stage['seconds'] = time.monotonic() - stage['started']
+        return merged
+
+    def _final(self, prompt, on_text):
+        """Runs the last summary call, streaming it when possible."""
+        stage = self._new_stage("final")
+        summary = None
+        if self.stream_llm and on_text:
+            summary = ""
+            try:
+                for chunk in self.stream_llm(prompt):
+                    summary += chunk
+                    on_text(summary)
+            except Exception as e:
+                if not summary:
+                    raise
+                # A cut-off merge is not a summary; ask again without streaming
+                logger.warning(f"Streamed summary interrupted, retrying without streaming: {str(e)}")
+                summary = None
+        if summary is None:
+            summary = self.llm(prompt)
+            if on_text:
+                on_text(summary)
+        self._count_call(stage, prompt, summary)
+        stage['seconds'] = time.monotonic() - stage['started']
+        return summary
+
+    def _call(self, prompt):
+        """Runs one map or reduce call; failures are remembered and return an empty summary."""
+        try:
+            return self.llm(prompt)
+        except Exception as e:
+            self._last_error = e
+            return ""
+
+    def _new_stage(self, name):
+        """Adds an empty per-stage record to the report."""
+        stage = {'name': name, 'calls': 0, 'cached': 0, 'failures': 0,
+                 'input_tokens': 0, 'output_tokens': 0, 'seconds': 0.0, 'started': time.monotonic()}
+        self.report['stages'].append(stage)
+        return stage
+
+    def _count_call(self, stage, prompt, output):
+        """Records one API call and its estimated token usage."""
+        stage['calls'] += 1
+        stage['input_tokens'] += estimate_tokens(prompt)
+        stage['output_tokens'] += estimate_tokens(output or "")
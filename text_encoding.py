@@ -0,0 +1,228 @@
+import codecs
+import logging
+import os
+import re
+
+try:
+    import cchardet as _detector
+except ImportError:
+    try:
+        import charset_normalizer as _detector
+    except ImportError:
+        try:
+            import chardet as _detector
+        except ImportError:
+            _detector = None
+
+logger = logging.getLogger(__name__)
+
+# Encoding detection configuration (overridable through environment variables)
+ENCODING_SAMPLE_BYTES = int(os.getenv("ENCODING_SAMPLE_BYTES", "65536"))
+ENCODING_MIN_CONFIDENCE = float(os.getenv("ENCODING_MIN_CONFIDENCE", "0.5"))
+
+# Browsers only look this far into the document for a <meta> charset declaration
+META_PRESCAN_BYTES = 4096
+
+# Used when nothing declares an encoding and the bytes are not UTF-8
+FALLBACK_ENCODING = "cp1252"
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+_CHARSET_PATTERN = re.compile(rb"""charset\s*=\s*["']?\s*([A-Za-z0-9_.:\-]+)""", re.IGNORECASE)
+_META_PATTERN = re.compile(rb"<meta\b[^>]*?>", re.IGNORECASE)
+_HTTP_EQUIV_PATTERN = re.compile(rb"""http-equiv\s*=\s*["']?\s*content-type""", re.IGNORECASE)
+_META_CHARSET_PATTERN = re.compile(rb"""\bcharset\s*=\s*["']?\s*([A-Za-z0-9_.:\-]+)""", re.IGNORECASE)
+
+# Labels that browsers decode differently from Python's codec of the same name
+_LABEL_OVERRIDES = {
+    'latin-1': 'cp1252',
+    'latin1': 'cp1252',
+    'iso-8859-1': 'cp1252',
+    'iso8859-1': 'cp1252',
+    'ascii': 'cp1252',
+    'us-ascii': 'cp1252',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'x-sjis': 'shift_jis',
+}
+
+def normalize_encoding(label):
+    """Returns the Python codec name for an encoding label, or None if it is unknown."""
+    if not label:
+        return None
+    if isinstance(label, bytes):
+        label = label.decode('ascii', errors='ignore')
+    label = label.strip().lower()
+    label = _LABEL_OVERRIDES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+def sniff_bom(data):
+    """Returns (encoding, bom_length) for a byte order mark at the start of data, or (None, 0)."""
+    for bom, encoding in _BOMS:
+        if data.startswith(bom):
+            return encoding, len(bom)
+    return None, 0
+
+def charset_from_content_type(content_type):
+    """Returns the codec named by a Content-Type header's charset parameter, or None."""
+    if not content_type:
+        return None
+    if isinstance(content_type, str):
+        content_type = content_type.encode('latin-1', errors='ignore')
+    match = _CHARSET_PATTERN.search(content_type)
+    return normalize_encoding(match.group(1)) if match else None
+
+def sniff_meta_charset(data):
+    """Returns the codec declared by <meta charset> or <meta http-equiv="Content-Type"> near the start."""
+    for meta in _META_PATTERN.finditer(data[:META_PRESCAN_BYTES]):
+        tag = meta.group(0)
+        match = _META_CHARSET_PATTERN.search(tag)
+        if not match:
+            continue
+        # "charset=" inside a content attribute only counts on a Content-Type http-equiv
+        if b'content' in tag[:match.start()].lower() and not _HTTP_EQUIV_PATTERN.search(tag):
+            continue
+        encoding = normalize_encoding(match.group(1))
+        if encoding:
+            # A document that could be read this far is not UTF-16, whatever it claims
+            return "utf-8" if encoding.startswith("utf-16") else encoding
+    return None
+
+def is_utf8(sample, complete=False):
+    """Checks whether a byte sample decodes as UTF-8; a truncated final character is allowed."""
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def guess_encoding(sample):
+    """Runs the installed statistical detector on a sample; returns (encoding, confidence)."""
+    if _detector is None or not sample:
+        return None, 0.0
+    try:
+        result = _detector.detect(sample)
+    except Exception as e:
+        logger.debug(f"Encoding detector failed: {str(e)}")
+        return None, 0.0
+    return normalize_encoding(result.get('encoding')), result.get('confidence') or 0.0
+
+def detect_encoding(data, content_type=None, sample_size=ENCODING_SAMPLE_BYTES):
+    """Resolves the encoding of an HTML document; returns (encoding, source).
+
+    The order follows browsers: a byte order mark, then the HTTP charset, then
+    a <meta> declaration near the start. Undeclared documents that are valid
+    UTF-8 are UTF-8. Only the rest pay for statistical detection, and that
+    runs on a prefix sample rather than the whole body.
+    """
+    encoding, _ = sniff_bom(data)
+    if encoding:
+        return encoding, "bom"
+    encoding = charset_from_content_type(content_type)
+    if encoding:
+        return encoding, "http"
+    encoding = sniff_meta_charset(data)
+    if encoding:
+        return encoding, "meta"
+
+    sample = data[:sample_size]
+    if is_utf8(sample, complete=len(data) <= sample_size):
+        return "utf-8", "utf-8"
+    encoding, confidence = guess_encoding(sample)
+    if encoding and confidence >= ENCODING_MIN_CONFIDENCE:
+        return encoding, "detected"
+    return FALLBACK_ENCODING, "fallback"
+
+def decode_html(data, content_type=None):
+    """Decodes an HTML body once; returns (text, encoding, source).
+
+    Text input is returned as is. Bytes that do not fit the resolved encoding
+    are replaced rather than failing the page.
+    """
+    if isinstance(data, str):
+        return data, None, "text"
+    encoding, source = detect_encoding(data, content_type)
+    _, bom_length = sniff_bom(data)
+    try:
+        return data[bom_length:].decode(encoding, errors='replace'), encoding, source
+    except LookupError:
+        return data[bom_length:].decode(FALLBACK_ENCODING, errors='replace'), FALLBACK_ENCODING, "fallback"
+
+def stream_decoder(prefix, content_type=None):
+    """Resolves the encoding from the start of a body; returns (decoder, encoding, source, bom_length).
+
+    For bodies that arrive in chunks: the returned incremental decoder turns
+    the remaining chunks into text without splitting multi-byte characters.
+    Pass it the prefix minus bom_length first.
+    """
+    encoding, source = detect_encoding(prefix, content_type)
+    _, bom_length = sniff_bom(prefix)
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    except LookupError:
+        encoding, source = FALLBACK_ENCODING, "fallback"
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    return decoder, encoding, source, bom_length
+
+def run_benchmark(page_kb=256, repeats=3):
+    """Times encoding resolution per MB over generated pages in mixed encodings, against full-body chardet."""
+    import time
+
+    samples = {
+        'utf-8': "Ünïcödé façade — naïve résumé, 価格とサポート, цены и поддержка. ",
+        'cp1252': "Café crème, naïve façade — “quoted” prices in € and £. ",
+        'iso8859-2': "Zażółć gęślą jaźń, příliš žluťoučký kůň úpěl ďábelské ódy. ",
+        'koi8-r': "Съешь же ещё этих мягких французских булок да выпей чаю. ",
+        'shift_jis': "価格とサポートについての説明です。製品の詳細はこちら。",
+        'gb18030': "这是关于价格和支持的说明。产品详情请见此处。",
+    }
+    corpus = []
+    for encoding, sentence in samples.items():
+        body = "<p>" + sentence * (page_kb * 1024 // (len(sentence.encode(encoding)) + 8)) + "</p>"
+        document = f"<html><head><title>{encoding}</title></head><body>{body}</body></html>"
+        data = document.encode(encoding)
+        # The same page declared three ways: HTTP header, <meta>, and not at all
+        corpus.append((f"{encoding} (http)", data, f"text/html; charset={encoding}", document))
+        meta = document.replace("<head>", f'<head><meta charset="{encoding}">').encode(encoding)
+        corpus.append((f"{encoding} (meta)", meta, "text/html", meta.decode(encoding)))
+        corpus.append((f"{encoding} (none)", data, "text/html", document))
+
+    try:
+        import chardet
+    except ImportError:
+        chardet = None
+
+    total_mb = sum(len(data) for _, data, _, _ in corpus) / (1024 * 1024)
+    print(f"{len(corpus)} pages, {total_mb:.1f} MB, detector: {getattr(_detector, '__name__', 'none')}")
+    print(f"{'page':<20} {'source':<9} {'encoding':<10} {'ok':<4} {'ms/MB':>8} {'chardet ms/MB':>14}")
+    new_total = old_total = 0.0
+    for name, data, content_type, expected in corpus:
+        mb = len(data) / (1024 * 1024)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            text, encoding, source = decode_html(data, content_type)
+        new_ms = (time.perf_counter() - start) * 1000 / repeats / mb
+        new_total += new_ms * mb
+
+        old_ms = None
+        if chardet is not None:
+            start = time.perf_counter()
+            detected = chardet.detect(data)
+            data.decode(detected['encoding'] or 'utf-8', errors='replace')
+            old_ms = (time.perf_counter() - start) * 1000 / mb
+            old_total += old_ms * mb
+        correct = "yes" if text == expected else "no"
+        print(f"{name:<20} {source:<9} {encoding:<10} {correct:<4} {new_ms:>8.1f} "
+              f"{(f'{old_ms:.0f}' if old_ms is not None else 'n/a'):>14}")
+    print(f"overall: {new_total / total_mb:.1f} ms/MB"
+          + (f" vs {old_total / total_mb:.0f} ms/MB with full-body chardet" if chardet is not None else ""))
+
+if __name__ == "__main__":
+    run_benchmark()
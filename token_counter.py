@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Token accounting configuration (overridable through environment variables)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_USAGE_HISTORY = int(os.getenv("TOKEN_USAGE_HISTORY", "200"))
+
+# Texts shorter than this are counted directly; hashing them costs as much as counting
+_CACHE_MIN_CHARS = 256
+
+# Latin words, digit runs, single non-Latin characters and punctuation marks
+_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+def raw_token_estimate(text):
+    """Estimates the SentencePiece token count of a text without a tokenizer.
+
+    Common words are one token and long words split every ~6 letters; digits,
+    punctuation and non-Latin characters (e.g. CJK) are roughly one token each.
+    """
+    tokens = 0
+    for piece in _PIECE_PATTERN.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += 1 + (len(piece) - 1) // 6
+        elif first.isdigit():
+            tokens += len(piece)
+        else:
+            tokens += 1
+    return tokens
+
+class TokenCounter:
+    """Local token estimates, cached per text and calibrated against API-reported usage.
+
+    Every API call reports the real prompt size in usageMetadata; the ratio of
+    reported to estimated tokens is tracked as a moving average and applied to
+    later estimates, so budgets converge on the model's actual tokenizer.
+    """
+
+    def __init__(self, cache_size=TOKEN_CACHE_SIZE, history=TOKEN_USAGE_HISTORY):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._ratio = 1.0
+        self._usage = deque(maxlen=history)
+        self._hits = 0
+        self._misses = 0
+
+    def count(self, text):
+        """Returns the calibrated token estimate of a text."""
+        return max(1, round(self.raw_count(text) * self._ratio)) if text else 0
+
+    def raw_count(self, text):
+        """Returns the uncalibrated estimate, cached for long texts such as content chunks."""
+        if len(text) < _CACHE_MIN_CHARS:
+            return raw_token_estimate(text)
+
+        key = hashlib.blake2b(text.encode('utf-8', errors='replace'), digest_size=16).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return self._cache[key]
+            self._misses += 1
+
+        tokens = raw_token_estimate(text)
+        with self._lock:
+            self._cache[key] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def record_usage(self, request_type, prompt, usage):
+        """Records estimated against API-reported token counts for one call.
+
+        usage is the response's usageMetadata dict; calls without it are ignored.
+        """
+        if not usage or not usage.get('promptTokenCount'):
+            return
+        raw = self.raw_count(prompt)
+        with self._lock:
+            estimated = max(1, round(raw * self._ratio))
+            # Tokens of a referenced cached context are reported too, but were never part of the prompt
+            cached = usage.get('cachedContentTokenCount', 0)
+            reported = max(1, usage['promptTokenCount'] - cached)
+            self._usage.append({
+                'type': request_type,
+                'estimated': estimated,
+                'prompt_tokens': reported,
+                'cached_tokens': cached,
+                'output_tokens': usage.get('candidatesTokenCount', 0),
+                'total_tokens': usage.get('totalTokenCount', 0)
+            })
+            if raw:
+                # Exponential moving average, clamped against outliers
+                observed = min(3.0, max(0.33, reported / raw))
+                self._ratio = 0.8 * self._ratio + 0.2 * observed
+
+    def stats(self):
+        """Returns estimate accuracy and token totals over the recorded calls, by request type."""
+        with self._lock:
+            usage = list(self._usage)
+            stats = {
+                'calls': len(usage),
+                'ratio': self._ratio,
+                'cache_hits': self._hits,
+                'cache_misses': self._misses,
+                'by_type': {}
+            }
+
+        for record in usage:
+            totals = stats['by_type'].setdefault(record['type'], {
+                'calls': 0, 'estimated': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0, 'abs_error': 0
+            })
+            totals['calls'] += 1
+            totals['cached_tokens'] += record['cached_tokens']
+            totals['estimated'] += record['estimated']
+            totals['prompt_tokens'] += record['prompt_tokens']
+            totals['output_tokens'] += record['output_tokens']
+            totals['abs_error'] += abs(record['estimated'] - record['prompt_tokens'])
+        for totals in stats['by_type'].values():
+            totals['error_ratio'] = totals.pop('abs_error') / totals['prompt_tokens'] if totals['prompt_tokens'] else 0.0
+        return stats
+
+_counter = None
+_counter_lock = threading.Lock()
+
+def get_token_counter():
+    """Returns the process-wide token counter."""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = TokenCounter()
+        return _counter
+
+def estimate_tokens(text):
+    """Estimates the model token count of a text."""
+    return get_token_counter().count(text)
@@ -0,0 +1,569 @@
+import time
+import os
+from dotenv import load_dotenv
+import logging
+import threading
+import contextvars
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlparse
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from driver_pool import get_driver_pool
+from page_readiness import wait_for_page_ready, load_lazy_content
+from cache import get_content_cache, get_response_cache, CONTENT_CACHE_TTL
+from prompt_builder import output_tokens
+from context_cache import PageContext, get_context_cache_client, GEMINI_CACHE_MODEL
+from batch_questions import BATCH_RESPONSE_SCHEMA
+from gemini_client import get_gemini_client, GeminiError, GeminiStreamInterrupted, GEMINI_MODEL
+from fetcher import get_fetcher, media_type, FetchError, UnsupportedContentError, FETCH_MAX_BYTES
+from document_extractors import (
+    document_kind, extract_document, DOCUMENT_LABELS, DOCUMENT_MEDIA_TYPES, DOCUMENT_MAX_BYTES, GENERIC_MEDIA_TYPES
+)
+from html_extractor import extract_html_content, extract_html_stream
+from extraction_strategy import (
+    assess_content_quality, get_strategy_memory, get_browser_executor, EXTRACTION_STRATEGY, STATIC, BROWSER
+)
+from crawler import SiteCrawler, combine_pages, CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+from metrics import span, record_span, start_trace
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Detect if running on Streamlit Cloud
+IS_STREAMLIT_CLOUD = (
+    os.path.exists("/home/appuser") or 
+    os.path.exists("/mount/src") or 
+    os.getenv("STREAMLIT_SHARING") is not None
+)
+
+# Get the API key from environment variable
+API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() == "true"
+
+# Upper bound on extracted page content; questions only see retrieved chunks of it
+MAX_CONTENT_CHARS = int(os.getenv("MAX_CONTENT_CHARS", "200000"))
+
+# Content types the static fetcher extracts; anything else is rejected before its body is downloaded
+HTML_MEDIA_TYPES = ('text/html', 'application/xhtml+xml')
+
+def validate_url(url):
+    """Validates and normalizes URL."""
+    try:
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        parsed = urlparse(url)
+        if not parsed.netloc:
+            return None, "Invalid URL format"
+        return url, None
+    except Exception as e:
+        return None, f"URL validation error: {str(e)}"
+
+@span('browser_extraction')
+def extract_with_selenium(url, timeout=15, cancel_event=None):
+    """Extracts content using Selenium for JavaScript-rendered pages.
+    
+    Setting cancel_event from another thread abandons the render at the next
+    checkpoint and returns the driver to the pool.
+    """
+    pool = get_driver_pool()
+    with span('browser_acquire'):
+        pooled, error = pool.acquire()
+    if error:
+        return None, error
+    
+    driver = pooled.driver
+    broken = False
+    try:
+        driver.set_page_load_timeout(timeout)
+        with span('page_load'):
+            driver.get(url)
+        if cancel_event is not None and cancel_event.is_set():
+            return None, "Browser rendering cancelled"
+        
+        with span('page_ready'):
+            WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+            
+            # Wait for the page to settle instead of sleeping for a fixed time
+            readiness = wait_for_page_ready(driver, cancel_event=cancel_event)
+        if readiness.get('cancelled'):
+            return None, "Browser rendering cancelled"
+        
+        # Scroll to trigger lazy-loaded content and wait for it to settle too
+        with span('lazy_content'):
+            lazy_readiness = load_lazy_content(driver, cancel_event=cancel_event)
+        if lazy_readiness.get('cancelled'):
+            return None, "Browser rendering cancelled"
+        logger.info(f"Page ready in {readiness['elapsed']:.2f}s (settled: {readiness['ready']}), "
+                    f"lazy content in {lazy_readiness['elapsed']:.2f}s (settled: {lazy_readiness['ready']})")
+        
+        # Get page source after JavaScript execution, capped like static downloads so that an
+        # endless page is not copied out of the browser whole
+        with span('dom_read'):
+            html_source = driver.execute_script(
+                "return document.documentElement.outerHTML.substring(0, arguments[0]);", FETCH_MAX_BYTES
+            ) or driver.page_source
+        
+        # Score the rendered DOM for its main content in a single parsing pass
+        with span('parse', source="browser"):
+            content, error = extract_html_content(html_source, MAX_CONTENT_CHARS)
+        if error:
+            return None, "Insufficient content extracted. The page might be heavily JavaScript-dependent or have access restrictions."
+        return content, None
+        
+    except TimeoutException:
+        return None, "Page load timeout. The website might be slow or unresponsive."
+    except WebDriverException as e:
+        # A crashed or disconnected browser must not go back into the pool
+        broken = True
+        return None, f"Browser error: {str(e)}"
+    except Exception as e:
+        return None, f"Content extraction error: {str(e)}"
+    finally:
+        pool.release(pooled, broken=broken)
+
+@span('static_extraction')
+def extract_with_requests(url, validators=None, response_meta=None):
+    """Enhanced fallback method using the shared async fetcher and the single-pass HTML extractor.
+    
+    When cache validators (etag/last_modified) are given, a conditional GET is sent and
+    (None, None) is returned if the server answers 304 Not Modified. Response validators
+    and the not-modified flag are written into response_meta when provided. PDFs, plain
+    text, JSON and XML are dispatched by Content-Type to the document extractors, and
+    response_meta['document'] then names the document type.
+    """
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'none',
+        'Cache-Control': 'max-age=0',
+    }
+
+    # Revalidate a cached copy with a conditional GET
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    
+    # Alternate browser identity, raced against the primary one if it is slow or rejected
+    alternate_headers = dict(headers, **{
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15'
+    })
+    
+    try:
+        # Pooled keep-alive connections, retries with backoff and hedging live in the fetcher;
+        # the status and Content-Type are checked before any of the body is downloaded
+        response = get_fetcher().open(url, headers=headers, alternate_headers=alternate_headers,
+                                      accept=HTML_MEDIA_TYPES + tuple(DOCUMENT_MEDIA_TYPES) + GENERIC_MEDIA_TYPES)
+        try:
+            if response_meta is not None:
+                response_meta['etag'] = response.headers.get('ETag')
+                response_meta['last_modified'] = response.headers.get('Last-Modified')
+                response_meta['not_modified'] = response.status_code == 304
+            if response.status_code == 304:
+                return None, None
+            
+            content_type = response.headers.get('Content-Type')
+            kind = document_kind(content_type, str(response.url))
+            if kind is None and media_type(content_type) in GENERIC_MEDIA_TYPES:
+                return None, f"Unsupported content: {media_type(content_type)} is not a page or known document type"
+            if kind:
+                # Documents such as PDFs may need to be read whole, so they get a larger byte limit
+                response.max_bytes = DOCUMENT_MAX_BYTES
+            if (response.content_length or 0) > response.max_bytes:
+                logger.info(f"{url} declares {response.content_length:,} bytes, reading at most {response.max_bytes:,}")
+            
+            # Decode and parse the body as it streams in, stopping once enough content was collected
+            stream_stats = {}
+            parse_start = time.perf_counter()
+            if kind:
+                result = extract_document(kind, response.iter_bytes(), MAX_CONTENT_CHARS,
+                                          content_type=content_type, stats=stream_stats)
+            else:
+                result = extract_html_stream(response.iter_bytes(), MAX_CONTENT_CHARS,
+                                             content_type=content_type, stats=stream_stats)
+        finally:
+            response.close()
+        # Download and parsing interleave; parse time is what was not spent waiting for the network
+        record_span('parse', time.perf_counter() - parse_start - response.timings.get('download', 0.0),
+                    start=parse_start, source=kind or "html")
+        
+        if response_meta is not None:
+            response_meta['html_bytes'] = stream_stats['bytes_read']
+            response_meta['truncated'] = response.truncated or stream_stats['stopped_early']
+            response_meta['encoding'] = stream_stats.get('encoding')
+            response_meta['encoding_source'] = stream_stats.get('encoding_source')
+            response_meta['document'] = stream_stats.get('document_type')
+            if 'pages' in stream_stats:
+                response_meta['pages'] = stream_stats['pages']
+                response_meta['page_count'] = stream_stats['page_count']
+        return result
+        
+    except UnsupportedContentError as e:
+        return None, f"Unsupported content: {media_type(e.content_type)} is not a page or known document type"
+    except FetchError as e:
+        return None, f"Network error: {str(e)}"
+    except Exception as e:
+        return None, f"Content extraction error: {str(e)}"
+
+def extract_from_html(html):
+    """Extracts readable content from an HTML document in a single parsing pass."""
+    try:
+        return extract_html_content(html, MAX_CONTENT_CHARS)
+    except Exception as e:
+        return None, f"Content extraction error: {str(e)}"
+
+def fetch_cache_validators(url):
+    """Fetches ETag/Last-Modified headers with a lightweight HEAD request."""
+    try:
+        response = get_fetcher().get(url, method="HEAD", headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        })
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+    except FetchError as e:
+        logger.info(f"Could not fetch cache validators: {str(e)}")
+        return {}
+
+def cached_result(entry, cache_state):
+    """Builds a fetch_website_content result from a content cache entry."""
+    stats = dict(entry['stats'])
+    stats['cache'] = cache_state
+    return entry['content'], entry['extraction_method'], stats
+
+def race_extraction(url, static_content=None, static_meta=None, cancel_event=None):
+    """Runs static and browser extraction concurrently and keeps the first good result.
+    
+    The static result is accepted as soon as it passes the quality check, which
+    cancels the browser render; otherwise the browser result is awaited. Domains
+    where one strategy keeps winning skip the other one on later loads. Returns
+    (content, extraction_method, error, static_content), where static_content can
+    serve as a fallback if the browser also fails. Setting cancel_event abandons
+    the browser render.
+    """
+    memory = get_strategy_memory()
+    preferred = memory.preferred(url)
+    static_meta = static_meta if static_meta is not None else {}
+    
+    if preferred == BROWSER:
+        # This domain needs JavaScript, so don't spend a static request on it
+        content, error = extract_with_selenium(url, cancel_event=cancel_event)
+        if content:
+            memory.record(url, BROWSER)
+            return content, "JavaScript-enabled (Selenium) - Remembered", None, static_content
+        return None, "", error, static_content
+    
+    render_cancel = threading.Event()
+    browser_future = None
+    if preferred != STATIC:
+        # The render joins the caller's trace through a copy of its context
+        browser_future = get_browser_executor().submit(contextvars.copy_context().run, extract_with_selenium, url,
+                                                       cancel_event=render_cancel)
+    
+    static_error = None
+    if static_content is None:
+        try:
+            static_content, static_error = extract_with_requests(url, response_meta=static_meta)
+        except Exception as e:
+            static_content, static_error = None, str(e)
+    
+    if static_content and static_meta.get('document'):
+        # A PDF, feed or JSON answer is the document itself; rendering it adds nothing
+        render_cancel.set()
+        return static_content, document_method(static_meta), None, static_content
+    
+    acceptable, reason = assess_content_quality(static_content, static_meta.get('html_bytes'))
+    if acceptable:
+        render_cancel.set()
+        memory.record(url, STATIC)
+        method = "Enhanced Static HTML (Requests) - " + ("Remembered" if preferred == STATIC else "Parallel")
+        return static_content, method, None, static_content
+    
+    logger.info(f"Static extraction not accepted ({reason}), waiting for browser render")
+    if browser_future is None:
+        # The remembered static strategy no longer works for this domain
+        browser_future = get_browser_executor().submit(contextvars.copy_context().run, extract_with_selenium, url,
+                                                       cancel_event=render_cancel)
+    
+    content, error = None, None
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            render_cancel.set()
+            error = "Extraction cancelled"
+            break
+        try:
+            content, error = browser_future.result(timeout=0.2)
+            break
+        except FutureTimeout:
+            continue
+        except Exception as e:
+            content, error = None, str(e)
+            break
+    
+    if content:
+        memory.record(url, BROWSER)
+        return content, "JavaScript-enabled (Selenium) - Parallel", None, static_content
+    return None, "", error or static_error, static_content
+
+def document_method(static_meta):
+    """Names the extraction method for a document the static fetcher extracted."""
+    return f"Document ({DOCUMENT_LABELS[static_meta['document']]})"
+
+def fetch_website_content(url, use_selenium=True, revalidate=False, strategy=EXTRACTION_STRATEGY, cancel_event=None):
+    """Main function to fetch website content with multiple strategies.
+    
+    With the "parallel" strategy, static and browser extraction race each other;
+    "sequential" tries the browser first and falls back to static extraction.
+    Fresh cached content is returned directly unless revalidate is set; stale or
+    revalidated entries are checked with a conditional GET before re-extracting.
+    Setting cancel_event from another thread stops a browser render early.
+    The stats of a successful load include its Trace as 'trace', which holds
+    the timed stages of this load, and its wall time as 'seconds'.
+    """
+    with start_trace(url) as trace:
+        result = _fetch_website_content(url, use_selenium, revalidate, strategy, cancel_event)
+    if len(result) == 3 and result[2]:
+        content, extraction_method, stats = result
+        result = content, extraction_method, dict(stats, trace=trace, seconds=trace.elapsed())
+    return result
+
+def _fetch_website_content(url, use_selenium, revalidate, strategy, cancel_event):
+    """Loads one page for fetch_website_content inside its trace."""
+    
+    # Validate URL
+    with span('validate'):
+        validated_url, error = validate_url(url)
+    if error:
+        return f"Error: {error}", "validation_error"
+    
+    extraction_method = ""
+    content = None
+    error_msg = None
+    
+    # Check the persistent content cache
+    cache = get_content_cache()
+    with span('cache_lookup'):
+        cached, stored_at = cache.get(validated_url) if cache else (None, None)
+    static_content = None
+    static_meta = {}
+    if cached:
+        if not revalidate and time.time() - stored_at < CONTENT_CACHE_TTL:
+            logger.info(f"Content cache hit for {validated_url}")
+            return cached_result(cached, "hit")
+        
+        if cached.get('etag') or cached.get('last_modified'):
+            try:
+                static_content, _ = extract_with_requests(validated_url, validators=cached, response_meta=static_meta)
+            except Exception as e:
+                logger.warning(f"Cache revalidation failed: {str(e)}")
+            if static_meta.get('not_modified'):
+                logger.info(f"Content unchanged for {validated_url}, reusing cached copy")
+                cache.touch(validated_url)
+                return cached_result(cached, "revalidated")
+    
+    # Disable Selenium on Streamlit Cloud due to browser limitations
+    if IS_STREAMLIT_CLOUD:
+        use_selenium = False
+        logger.info("Running on Streamlit Cloud, using enhanced requests-only mode")
+    
+    # URLs that name a document (.pdf, .json, .xml, ...) go straight to the static fetcher
+    browser_skipped = use_selenium and document_kind(url=validated_url) is not None
+    if browser_skipped:
+        use_selenium = False
+        logger.info(f"{validated_url} looks like a document, skipping browser rendering")
+    
+    if use_selenium and strategy == "parallel":
+        try:
+            content, extraction_method, error_msg, static_content = race_extraction(
+                validated_url, static_content, static_meta, cancel_event=cancel_event
+            )
+        except Exception as e:
+            logger.error(f"Parallel extraction failed: {str(e)}")
+            error_msg = str(e)
+    
+    # Try Selenium first for JavaScript content (only if not on Streamlit Cloud)
+    elif use_selenium:
+        try:
+            content, error_msg = extract_with_selenium(validated_url, cancel_event=cancel_event)
+            if content:
+                extraction_method = "JavaScript-enabled (Selenium)"
+            else:
+                logger.warning(f"Selenium extraction failed: {error_msg}")
+        except Exception as e:
+            logger.error(f"Selenium method failed: {str(e)}")
+            error_msg = str(e)
+    
+    if cancel_event is not None and cancel_event.is_set():
+        return "Error: Extraction cancelled", "cancelled", {}
+    
+    # Fallback to enhanced requests method, reusing the revalidation response if there was one
+    if not content:
+        try:
+            if static_content:
+                content, fallback_error = static_content, None
+            else:
+                content, fallback_error = extract_with_requests(validated_url, response_meta=static_meta)
+            if content and static_meta.get('document'):
+                extraction_method = document_method(static_meta)
+            elif content:
+                extraction_method = "Enhanced Static HTML (Requests)" + (" - Fallback" if use_selenium or browser_skipped else " - Cloud Mode")
+            else:
+                # Provide more helpful error message for Streamlit Cloud
+                if IS_STREAMLIT_CLOUD:
+                    error_msg = f"Content extraction failed. This website might be heavily JavaScript-dependent. {fallback_error} Note: JavaScript rendering is not available on Streamlit Cloud, so some dynamic content may not be accessible."
+                else:
+                    error_msg = fallback_error
+        except Exception as e:
+            if IS_STREAMLIT_CLOUD:
+                error_msg = f"All extraction methods failed on Streamlit Cloud: {str(e)}. This website might require JavaScript rendering which is not available in this environment."
+            else:
+                error_msg = f"All extraction methods failed: {str(e)}"
+    
+    if content:
+        # Calculate content statistics
+        stats = {
+            'character_count': len(content),
+            'word_count': len(content.split()),
+            'extraction_method': extraction_method
+        }
+        if extraction_method.startswith("Document") and 'pages' in static_meta:
+            stats['pages'] = static_meta['pages']
+            stats['page_count'] = static_meta['page_count']
+        
+        if cache:
+            # Rendered pages carry no response headers, so ask for validators separately
+            validators = static_meta if static_meta.get('etag') or static_meta.get('last_modified') else {}
+            if not validators and extraction_method.startswith("JavaScript"):
+                validators = fetch_cache_validators(validated_url)
+            cache.set(validated_url, {
+                'content': content,
+                'extraction_method': extraction_method,
+                'stats': stats,
+                'etag': validators.get('etag'),
+                'last_modified': validators.get('last_modified')
+            })
+        
+        stats = dict(stats, cache="miss")
+        if use_selenium:
+            stats['browser_pool'] = get_driver_pool().stats()
+        return content, extraction_method, stats
+    else:
+        return f"Error: {error_msg}", "error", {}
+
+def crawl_website_content(url, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, on_progress=None, cancel_event=None):
+    """Crawls a whole site from url and returns its combined content like fetch_website_content.
+    
+    Setting cancel_event stops queueing new pages; the pages crawled so far are kept.
+    """
+    validated_url, error = validate_url(url)
+    if error:
+        return f"Error: {error}", "validation_error"
+    
+    try:
+        crawler = SiteCrawler(validated_url, extract_from_html, max_depth=max_depth, max_pages=max_pages)
+        pages = crawler.crawl(on_progress=on_progress, cancel_event=cancel_event)
+    except Exception as e:
+        logger.error(f"Crawl failed: {str(e)}")
+        return f"Error: Site crawl failed: {str(e)}", "error", {}
+    
+    if not pages:
+        return "Error: No readable pages found while crawling the site.", "error", {}
+    
+    content = combine_pages(pages, MAX_CONTENT_CHARS)
+    extraction_method = f"Site Crawl ({len(pages)} pages)"
+    stats = {
+        'character_count': len(content),
+        'word_count': len(content.split()),
+        'extraction_method': extraction_method,
+        'crawl': crawler.report
+    }
+    return content, extraction_method, stats
+
+def get_generation_config(request_type):
+    """Returns the generation settings for a request type ("question", "summary", "memory" or "batch")."""
+    config = {
+        "maxOutputTokens": output_tokens(request_type),
+        "temperature": 0.7
+    }
+    if request_type == "batch":
+        # Batched questions are answered as a JSON array matched back to the questions by number
+        config["responseMimeType"] = "application/json"
+        config["responseSchema"] = BATCH_RESPONSE_SCHEMA
+    return config
+
+def get_gemini_response(prompt, request_type="question", cached_content=None, on_usage=None):
+    """Gemini API call served through the process-wide response cache.
+    
+    Identical prompts (same model and generation config) are answered from the
+    cache, and concurrent identical requests share a single API call.
+    cached_content names a Gemini cached context the prompt refers to; on_usage
+    receives the usageMetadata of calls that reach the API. Raises GeminiError
+    when the call fails.
+    """
+    generation_config = get_generation_config(request_type)
+    # Cached contents are bound to the exact model version they were created for
+    model = GEMINI_CACHE_MODEL if cached_content else GEMINI_MODEL
+    
+    def request_answer():
+        answer, usage = get_gemini_client(API_KEY).generate(
+            prompt, generation_config, cached_content=cached_content, request_type=request_type, model=model
+        )
+        if on_usage:
+            on_usage(usage)
+        return answer
+    
+    cache = get_response_cache()
+    if cache is None:
+        return request_answer()
+    
+    key = cache.make_key(f"{model}/{cached_content}" if cached_content else model, generation_config, prompt)
+    return cache.get_or_compute(key, request_answer)
+
+def stream_gemini_response(prompt, request_type="question", cached_content=None, on_usage=None):
+    """Streams a Gemini response as text chunks using the server-sent events endpoint.
+    
+    Cached responses, and answers another session is streaming for the same
+    prompt, are yielded as a single chunk. If the call fails before any text
+    arrives, GeminiError is raised; a stream that breaks midway raises
+    GeminiStreamInterrupted with the partial answer, which is not cached.
+    """
+    generation_config = get_generation_config(request_type)
+    model = GEMINI_CACHE_MODEL if cached_content else GEMINI_MODEL
+    
+    def stream_answer():
+        parts = []
+        try:
+            for text in get_gemini_client(API_KEY).stream(prompt, generation_config, cached_content=cached_content,
+                                                          request_type=request_type, model=model, on_usage=on_usage):
+                parts.append(text)
+                yield text
+        except GeminiError as e:
+            logger.error(f"Gemini stream failed: {str(e)}")
+            if not parts:
+                raise
+            raise GeminiStreamInterrupted(f"Response stream interrupted - {str(e)}", partial="".join(parts)) from e
+    
+    cache = get_response_cache()
+    if cache is None:
+        yield from stream_answer()
+        return
+    
+    key = cache.make_key(f"{model}/{cached_content}" if cached_content else model, generation_config, prompt)
+    yield from cache.stream_or_compute(key, stream_answer)
+
+def new_page_context(content):
+    """Returns a context cache handle for freshly loaded content, or None when caching is off."""
+    client = get_context_cache_client(get_gemini_client(API_KEY))
+    return PageContext(content, client) if client else None